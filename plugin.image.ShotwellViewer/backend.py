@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import socket
+import urlparse
+import binascii
+import threading
+import xbmc
+
+from viewer import ShotwellViewer
+from shotwell import getDatabaseSignature
+from libraries import ShotwellPool, LibraryQueries
+from derivatives import DerivativeQueue
+from prefetch import SlideshowPrefetcher, PREFETCH_DIRECTORY
+from client import SERVICE_STATE_FILE, REQUEST_TIMEOUT, sendMessage, receiveMessage
+
+# the service waits this long for a request before it rebuilds the next listing after a change
+WARM_PAUSE = 0.05
+# and looks for a change of the watch interval this often while it doesn't watch
+UNWATCHED_CHECK_INTERVAL = 60.0
+
+# the listings most visits start with, rebuilt after shotwell wrote to a library; the years of
+# the events catalog follow it (see ChangeWatcher.warmNext)
+WARM_ARGS = [{}, {'category': ['Events']}, {'category': ['Saved Searches']}, {'category': ['Collections']}]
+
+
+def encodeArgs(args):
+    # json hands back unicode, the viewer works on the utf-8 strings parse_qs returns
+    encoded = {}
+    for key in args:
+        encoded[key.encode('utf-8')] = [value.encode('utf-8') for value in args[key]]
+    return encoded
+
+
+class ListingCollector:
+    # the service returns whole listings, as the viewer hands them out
+
+    def __init__(self):
+        self.listing = {'items': [], 'total': 0}
+
+    def addItems(self, items, totalItems):
+        self.listing['items'] += items
+        self.listing['total'] = totalItems
+
+    def endOfDirectory(self):
+        pass
+
+
+class ChangeWatcher:
+    # notices writes of shotwell to the databases of the libraries by their signatures. the listings
+    # that show something written are out of date by then (see SideIndex.touchScopes), the most
+    # visited of them are built again one by one, whenever the service has nothing else to do
+
+    def __init__(self, baseUrl):
+        self.baseUrl = baseUrl
+        self.signature = None
+        self.nextCheck = 0.0
+        self.pending = []
+
+    def getTimeout(self):
+        # how long the service may wait for a request before the watcher wants to run
+        if len(self.pending) > 0:
+            return WARM_PAUSE
+        return min(1.0, max(WARM_PAUSE, self.nextCheck - time.time()))
+
+    def run(self, createViewer):
+        # createViewer(baseUrl, args, directory) sets up a viewer as a request would
+        if len(self.pending) > 0:
+            self.warmNext(createViewer)
+        elif time.time() >= self.nextCheck:
+            self.check(createViewer(self.baseUrl, {}, ListingCollector()))
+
+    def check(self, viewer):
+        interval = viewer.getWatchInterval()
+        if interval is None:
+            self.signature = None
+            self.nextCheck = time.time() + UNWATCHED_CHECK_INTERVAL
+            return
+        self.nextCheck = time.time() + interval
+        # snapshots of shared databases are copied again by the viewer, so their copies are watched
+        signature = tuple((library.getSettingsKey(), getDatabaseSignature(library.database)) for library in viewer.libraries)
+        if signature == self.signature:
+            return
+        self.signature = signature
+        if viewer.listingCache is None:
+            # nothing to rebuild, the side indexes are synced for the next request still
+            viewer.queryLibraries(lambda v, library: v.ensureSideIndex())
+        else:
+            self.pending = list(WARM_ARGS)
+
+    def warmNext(self, createViewer):
+        args = self.pending.pop(0)
+        collector = ListingCollector()
+        viewer = createViewer(self.baseUrl, args, collector)
+        viewer.Main()
+        if args == {'category': ['Events']}:
+            years = [urlparse.parse_qs(urlparse.urlparse(item['url']).query) for item in collector.listing['items']]
+            self.pending = years + self.pending
+
+
+class ViewerService(threading.Thread):
+    # answers listing requests of plugin.py one after another and lets the watcher run in between;
+    # the connections and caches are created by and stay in this thread, sqlite wants it that way
+
+    def __init__(self, profileDirectory, baseUrl, derivativeWorkers = 2):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.profileDirectory = profileDirectory
+        if not os.path.isdir(profileDirectory):
+            os.makedirs(profileDirectory)
+        self.token = binascii.hexlify(os.urandom(16))
+        self.stopped = threading.Event()
+        self.derivativeQueue = DerivativeQueue(derivativeWorkers)
+        self.libraryQueries = LibraryQueries()
+        self.prefetcher = SlideshowPrefetcher(os.path.join(profileDirectory, PREFETCH_DIRECTORY))
+        self.watcher = ChangeWatcher(baseUrl)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.bind(('127.0.0.1', 0))
+        self.socket.listen(5)
+
+    def getStatePath(self):
+        return os.path.join(self.profileDirectory, SERVICE_STATE_FILE)
+
+    def writeState(self):
+        path = self.getStatePath()
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'port': self.socket.getsockname()[1], 'token': self.token}, f)
+        os.rename(path + '.tmp', path)
+
+    def removeState(self):
+        try:
+            os.remove(self.getStatePath())
+        except OSError:
+            pass
+
+    def run(self):
+        pool = ShotwellPool()
+        self.prefetcher.start()
+        self.writeState()
+        try:
+            while not self.stopped.is_set():
+                # accept wakes up regularly to notice stop() and to let the watcher run
+                self.socket.settimeout(self.watcher.getTimeout())
+                try:
+                    connection = self.socket.accept()[0]
+                except socket.timeout:
+                    try:
+                        self.watcher.run(lambda baseUrl, args, directory: self.createViewer(baseUrl, args, directory, pool))
+                    except Exception as e:
+                        xbmc.log("ShotwellViewer service: watching the libraries failed: %s"%(e), xbmc.LOGWARNING)
+                    continue
+                except socket.error:
+                    break
+                try:
+                    self.handle(connection, pool)
+                except Exception as e:
+                    xbmc.log("ShotwellViewer service: request failed: %s"%(e), xbmc.LOGWARNING)
+                finally:
+                    connection.close()
+        finally:
+            self.removeState()
+            self.socket.close()
+            self.derivativeQueue.close()
+            self.libraryQueries.close()
+            self.prefetcher.stop()
+            pool.close()
+
+    def handle(self, connection, pool):
+        connection.settimeout(REQUEST_TIMEOUT)
+        request = receiveMessage(connection)
+        if request.get('token', None) != self.token:
+            sendMessage(connection, {'error': 'invalid token'})
+            return
+        collector = ListingCollector()
+        baseUrl = request['base_url'].encode('utf-8')
+        self.watcher.baseUrl = baseUrl
+        self.createViewer(baseUrl, encodeArgs(request['args']), collector, pool).Main()
+        sendMessage(connection, {'listing': collector.listing})
+
+    def createViewer(self, baseUrl, args, directory, pool):
+        return ShotwellViewer(baseUrl, args, directory, pool, derivativeQueue = self.derivativeQueue,
+                              prefetcher = self.prefetcher, libraryQueries = self.libraryQueries)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
@@ -0,0 +1,296 @@
+import os
+import binascii
+from array import array
+from bisect import bisect_left
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from mediatypes import MEDIA_CLASS_PHOTO, MEDIA_CLASS_RAW
+
+BITMAP_CACHE_FILE = "bitmaps.cache"
+BITMAP_CACHE_VERSION = 3
+
+# bitmaps of this process, keyed by database
+loadedBitmaps = {}
+
+# terms evaluated by queries of their own, their bitmaps are kept with the others (see PhotoBitmaps.terms)
+QUERIED_TERMS = ('text', 'fulltext')
+
+
+def bitsToLong(bits):
+    # bits is a little endian bytearray, python longs give us fast and/or/not
+    if len(bits) == 0:
+        return 0
+    return int(binascii.hexlify(bytes(bits[::-1])), 16)
+
+
+def setBit(bits, position):
+    bits[position >> 3] |= 1 << (position & 7)
+
+
+def countBits(bitmap):
+    return bin(bitmap).count('1')
+
+
+def getLowestBit(bitmap):
+    return (bitmap & -bitmap).bit_length() - 1
+
+
+class PhotoBitmaps:
+    # one scan of the photos in listing order (exposure_time, filename), so the
+    # position of a bit is the rank of the photo and the lowest bit is the cover;
+    # the photos are read from the side index, it has to be attached and synced
+
+    def __init__(self, signature):
+        self.version = BITMAP_CACHE_VERSION
+        self.signature = signature
+        self.count = 0
+        self.ids = array('l')
+        self.nullTimes = 0
+        self.times = array('l')
+        self.events = array('l')
+        self.ratings = {}
+        self.flagged = 0
+        # photos with flags at all, sql's (flags & 16) == 0 leaves out NULL flags
+        self.withFlags = 0
+        self.photos = 0
+        self.raws = 0
+        # bitmaps of QUERIED_TERMS by repr of the term, as long as the signature holds
+        self.terms = {}
+
+    def build(self, cursor):
+        cursor.execute("""select id, exposure_time, rating, flags, media_class, event_id from sideindex.photo_browse
+                          order by exposure_time asc, filename asc""")
+        rows = cursor.fetchall()
+        self.count = len(rows)
+        size = (self.count + 7) // 8
+        ratings = {}
+        flagged = bytearray(size)
+        withFlags = bytearray(size)
+        photos = bytearray(size)
+        raws = bytearray(size)
+
+        for position in range(self.count):
+            row = rows[position]
+            self.ids.append(row[0])
+            if row[1] is None:
+                self.nullTimes += 1
+            else:
+                self.times.append(row[1])
+            if row[5] is None:
+                self.events.append(-1)
+            else:
+                self.events.append(row[5])
+
+            rating = row[2]
+            if rating not in ratings:
+                ratings[rating] = bytearray(size)
+            setBit(ratings[rating], position)
+            if row[3] is not None:
+                setBit(withFlags, position)
+                if (row[3] & 16) == 16:
+                    setBit(flagged, position)
+            if row[4] in (MEDIA_CLASS_PHOTO, MEDIA_CLASS_RAW):
+                setBit(photos, position)
+            if row[4] == MEDIA_CLASS_RAW:
+                setBit(raws, position)
+
+        for rating in ratings:
+            self.ratings[rating] = bitsToLong(ratings[rating])
+        self.flagged = bitsToLong(flagged)
+        self.withFlags = bitsToLong(withFlags)
+        self.photos = bitsToLong(photos)
+        self.raws = bitsToLong(raws)
+
+    def getTime(self, position):
+        if position < self.nullTimes:
+            return None
+        return self.times[position - self.nullTimes]
+
+
+class SearchBitmapEngine:
+
+    def __init__(self, cursor, database, signature, cacheFile = None):
+        self.cursor = cursor
+        self.database = database
+        self.signature = signature
+        self.cacheFile = cacheFile
+        self.positions = None
+        # whether bitmaps of terms were added since the cache file was written
+        self.changed = False
+        self.bitmaps = self.load()
+
+    def load(self):
+        bitmaps = loadedBitmaps.get(self.database, None)
+        if bitmaps is not None and bitmaps.signature == self.signature:
+            return bitmaps
+
+        cacheFile = self.cacheFile
+        if cacheFile is not None and os.path.exists(cacheFile):
+            try:
+                with open(cacheFile, 'rb') as f:
+                    bitmaps = pickle.load(f)
+            except Exception:
+                bitmaps = None
+            if bitmaps is not None and bitmaps.version == BITMAP_CACHE_VERSION and bitmaps.signature == self.signature:
+                loadedBitmaps[self.database] = bitmaps
+                return bitmaps
+
+        bitmaps = PhotoBitmaps(self.signature)
+        bitmaps.build(self.cursor)
+        loadedBitmaps[self.database] = bitmaps
+        self.store(bitmaps)
+        return bitmaps
+
+    def store(self, bitmaps = None):
+        # writes the bitmaps to the cache file, with the bitmaps of the terms evaluated so far
+        if bitmaps is None:
+            if not self.changed:
+                return
+            bitmaps = self.bitmaps
+        self.changed = False
+        if self.cacheFile is None:
+            return
+        try:
+            with open(self.cacheFile + '.tmp', 'wb') as f:
+                pickle.dump(bitmaps, f, 2)
+            os.rename(self.cacheFile + '.tmp', self.cacheFile)
+        except (IOError, OSError):
+            pass
+
+    def getUniverse(self):
+        return (1 << self.bitmaps.count) - 1
+
+    def getTimeRange(self, first, last):
+        # times are sorted, so a time range is a contiguous run of bits
+        times = self.bitmaps.times
+        start = 0
+        end = len(times)
+        if first is not None:
+            start = bisect_left(times, first)
+        if last is not None:
+            end = bisect_left(times, last)
+        if end <= start:
+            return 0
+        offset = self.bitmaps.nullTimes
+        return (1 << (end + offset)) - (1 << (start + offset))
+
+    def getBitmapForIds(self, ids):
+        if self.positions is None:
+            self.positions = dict((self.bitmaps.ids[i], i) for i in range(self.bitmaps.count))
+        bits = bytearray((self.bitmaps.count + 7) // 8)
+        for id in ids:
+            position = self.positions.get(id, None)
+            if position is not None:
+                setBit(bits, position)
+        return bitsToLong(bits)
+
+    def getBitmapForEvents(self, eventIds):
+        bits = bytearray((self.bitmaps.count + 7) // 8)
+        events = self.bitmaps.events
+        for position in range(self.bitmaps.count):
+            if events[position] in eventIds:
+                setBit(bits, position)
+        return bitsToLong(bits)
+
+    def getRatingBitmap(self, operator, value):
+        bitmap = 0
+        for rating in self.bitmaps.ratings:
+            if rating is None:
+                continue
+            if (operator == "=" and rating == value) or (operator == "<=" and rating <= value) or (operator == ">=" and rating >= value):
+                bitmap |= self.bitmaps.ratings[rating]
+        return bitmap
+
+    def getTextFieldBitmap(self, field, condition, params, comparison, comparisonParams):
+        if field == "EVENT_NAME":
+            self.cursor.execute("select id from eventtable where name" + comparison, comparisonParams)
+            return self.getBitmapForEvents(set([row[0] for row in self.cursor.fetchall()]))
+
+        self.cursor.execute("select id from phototable where " + condition, params)
+        return self.getBitmapForIds([row[0] for row in self.cursor.fetchall()])
+
+    def evaluateTerm(self, term):
+        if term[0] not in QUERIED_TERMS:
+            return self.evaluateStoredTerm(term)
+        key = repr(term)
+        bitmap = self.bitmaps.terms.get(key, None)
+        if bitmap is None:
+            bitmap = self.bitmaps.terms[key] = self.evaluateStoredTerm(term)
+            self.changed = True
+        return bitmap
+
+    def evaluateStoredTerm(self, term):
+        universe = self.getUniverse()
+        if term[0] == 'rating':
+            return self.getRatingBitmap(term[1], term[2])
+        elif term[0] == 'flagged':
+            if term[1]:
+                return self.bitmaps.flagged
+            return self.bitmaps.withFlags & ~self.bitmaps.flagged
+        elif term[0] == 'mediatype':
+            bitmap = 0
+            if term[2] == 'PHOTO_ALL':
+                bitmap = self.bitmaps.photos
+            elif term[2] == 'PHOTO_RAW':
+                bitmap = self.bitmaps.raws
+            if term[1]:
+                return universe & ~bitmap
+            return bitmap
+        elif term[0] == 'date':
+            return self.getTimeRange(term[1], term[2])
+        elif term[0] == 'date_unset':
+            return (1 << self.bitmaps.nullTimes) - 1
+        elif term[0] == 'fulltext':
+            self.cursor.execute("select rowid from sideindex.photo_search where photo_search match ?", (term[1],))
+            bitmap = self.getBitmapForIds([row[0] for row in self.cursor.fetchall()])
+            if term[2]:
+                return universe & ~bitmap
+            return bitmap
+        elif term[0] == 'text':
+            fieldTerms, junction, negated, comparison, comparisonParams = term[1:]
+            bitmap = None
+            for field, condition, params in fieldTerms:
+                fieldBitmap = self.getTextFieldBitmap(field, condition, params, comparison, comparisonParams)
+                if bitmap is None:
+                    bitmap = fieldBitmap
+                elif junction == "and":
+                    bitmap &= fieldBitmap
+                else:
+                    bitmap |= fieldBitmap
+            if bitmap is None:
+                bitmap = 0
+            if negated:
+                return universe & ~bitmap
+            return bitmap
+        return 0
+
+    def evaluate(self, plan):
+        universe = self.getUniverse()
+        if len(plan['terms']) == 0:
+            return universe
+
+        if plan['matchtype'] not in ("ANY", "NONE"):
+            bitmap = universe
+            for term in plan['terms']:
+                bitmap &= self.evaluateTerm(term)
+                if bitmap == 0:
+                    break
+            return bitmap
+
+        bitmap = 0
+        for term in plan['terms']:
+            bitmap |= self.evaluateTerm(term)
+        if plan['matchtype'] == "NONE":
+            return universe & ~bitmap
+        return bitmap
+
+    def getSummary(self, plan):
+        bitmap = self.evaluate(plan)
+        if bitmap == 0:
+            return {'count': 0, 'first_id': None, 'earliest_time': None}
+
+        first = getLowestBit(bitmap)
+        return {'count': countBits(bitmap), 'first_id': self.bitmaps.ids[first], 'earliest_time': self.bitmaps.getTime(first)}
@@ -0,0 +1,60 @@
+import os
+import json
+import socket
+
+# what plugin.py needs to ask the service (see backend.py) for a listing; plugin.py runs for
+# every click, so this module imports nothing of the viewer, its database or its caches
+
+# the service publishes its port here, inside the profile directory of the addon
+SERVICE_STATE_FILE = "service.json"
+
+CONNECT_TIMEOUT = 1.0
+# building a listing of a large library from a cold cache can take a while
+REQUEST_TIMEOUT = 120.0
+
+# pictures handed to kodi per addDirectoryItems call
+SUBMIT_BATCH_SIZE = 100
+
+
+def sendMessage(connection, message):
+    connection.sendall(json.dumps(message) + "\n")
+
+
+def receiveMessage(connection):
+    chunks = []
+    while True:
+        chunk = connection.recv(65536)
+        if not chunk:
+            break
+        if chunk.endswith("\n"):
+            chunks.append(chunk[:-1])
+            break
+        chunks.append(chunk)
+    return json.loads("".join(chunks))
+
+
+def readServiceState(profileDirectory):
+    try:
+        with open(os.path.join(profileDirectory, SERVICE_STATE_FILE), 'r') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+
+def requestListing(profileDirectory, baseUrl, args):
+    # returns None whenever the service can't answer, the caller then builds the listing itself
+    state = readServiceState(profileDirectory)
+    if state is None:
+        return None
+    connection = None
+    try:
+        connection = socket.create_connection(('127.0.0.1', state['port']), CONNECT_TIMEOUT)
+        connection.settimeout(REQUEST_TIMEOUT)
+        sendMessage(connection, {'token': state['token'], 'base_url': baseUrl, 'args': args})
+        response = receiveMessage(connection)
+    except (socket.error, ValueError, KeyError):
+        return None
+    finally:
+        if connection is not None:
+            connection.close()
+    return response.get('listing', None)
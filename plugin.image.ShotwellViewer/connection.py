@@ -0,0 +1,194 @@
+import os
+import time
+import sqlite3
+import urllib
+import threading
+
+import instrumentation
+
+# shotwell may be writing while we read: wait this long for its locks
+# inside sqlite, then retry a few times before giving up
+BUSY_TIMEOUT = 5.0
+MAX_RETRIES = 3
+RETRY_DELAY = 0.2
+
+STATEMENT_CACHE_SIZE = 200
+MMAP_SIZE = 256 * 1024 * 1024
+# negative cache sizes are KiB
+CACHE_SIZE = -16384
+
+# connections of this process, one per database and thread
+localConnections = threading.local()
+
+# rows fetched at once when a cursor is iterated
+ITERATION_BATCH_SIZE = 100
+
+
+class ConnectionStatistics:
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.queries = 0
+        self.queryTime = 0.0
+        self.lockWaits = 0
+        self.lockWaitTime = 0.0
+        self.failures = 0
+
+    def asDict(self):
+        return {'queries': self.queries, 'query_time': self.queryTime, 'lock_waits': self.lockWaits,
+                'lock_wait_time': self.lockWaitTime, 'failures': self.failures}
+
+
+statistics = ConnectionStatistics()
+
+
+def isLockError(error):
+    message = str(error)
+    return "locked" in message or "busy" in message
+
+
+def openReadOnly(database):
+    # a read-only uri keeps us from ever taking a write lock, python 2's
+    # sqlite3 can't open uris, there query_only (see configure) has to do
+    path = os.path.abspath(database)
+    try:
+        return sqlite3.connect("file:" + urllib.pathname2url(path) + "?mode=ro", timeout = BUSY_TIMEOUT,
+                               cached_statements = STATEMENT_CACHE_SIZE, uri = True)
+    except TypeError:
+        return sqlite3.connect(path, timeout = BUSY_TIMEOUT, cached_statements = STATEMENT_CACHE_SIZE)
+
+
+class MeasuredCursor:
+    # a cursor that counts query times and retries statements shotwell's writes locked out;
+    # sqlite does most of the work while rows are fetched, so fetching counts as query time
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.entry = None
+
+    def run(self, method, sql, params, single = True):
+        retries = 0
+        while True:
+            start = time.time()
+            try:
+                method(sql, params)
+                elapsed = time.time() - start
+                statistics.queries += 1
+                statistics.queryTime += elapsed
+                self.entry = None
+                if instrumentation.recorder is not None:
+                    # only single statements can be explained later
+                    if not single:
+                        params = None
+                    self.entry = instrumentation.recorder.record(self.cursor, sql, params, elapsed)
+                return self
+            except sqlite3.OperationalError as e:
+                if not isLockError(e) or retries == MAX_RETRIES:
+                    statistics.failures += 1
+                    raise
+                retries += 1
+                delay = RETRY_DELAY * retries
+                statistics.lockWaits += 1
+                statistics.lockWaitTime += time.time() - start + delay
+                time.sleep(delay)
+
+    def execute(self, sql, params = ()):
+        return self.run(self.cursor.execute, sql, params)
+
+    def executemany(self, sql, params):
+        return self.run(self.cursor.executemany, sql, params, False)
+
+    def addFetch(self, start, rows):
+        elapsed = time.time() - start
+        statistics.queryTime += elapsed
+        if self.entry is not None:
+            self.entry['time'] += elapsed
+            self.entry['rows'] += rows
+            if instrumentation.recorder is not None:
+                instrumentation.recorder.checkSlow(self.entry)
+
+    def fetchone(self):
+        start = time.time()
+        row = self.cursor.fetchone()
+        if row is None:
+            self.addFetch(start, 0)
+        else:
+            self.addFetch(start, 1)
+        return row
+
+    def fetchmany(self, size):
+        start = time.time()
+        rows = self.cursor.fetchmany(size)
+        self.addFetch(start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.time()
+        rows = self.cursor.fetchall()
+        self.addFetch(start, len(rows))
+        return rows
+
+    def close(self):
+        self.cursor.close()
+
+    def __iter__(self):
+        while True:
+            rows = self.fetchmany(ITERATION_BATCH_SIZE)
+            if len(rows) == 0:
+                break
+            for row in rows:
+                yield row
+
+
+class ReadOnlyConnection:
+
+    def __init__(self, database):
+        self.database = database
+        self.connection = openReadOnly(database)
+        self.attached = {}
+        self.configure()
+
+    def configure(self):
+        # pragmas touching the schema have to wait for shotwell's locks as well
+        cursor = self.cursor()
+        cursor.execute("pragma query_only = 1")
+        cursor.execute("pragma busy_timeout = %d"%(int(BUSY_TIMEOUT * 1000)))
+        cursor.execute("pragma mmap_size = %d"%(MMAP_SIZE))
+        cursor.execute("pragma cache_size = %d"%(CACHE_SIZE))
+        cursor.execute("pragma temp_store = memory")
+        cursor.close()
+
+    def cursor(self):
+        return MeasuredCursor(self.connection.cursor())
+
+    def attach(self, path, schema):
+        # connections are shared, so several ShotwellAccess instances may ask for the same database
+        if self.attached.get(schema, None) == path:
+            return
+        if schema in self.attached:
+            self.cursor().execute("detach database %s"%(schema))
+        self.cursor().execute("attach database ? as %s"%(schema), (path,))
+        self.attached[schema] = path
+
+    def close(self):
+        self.connection.close()
+
+
+def getConnection(database):
+    connections = getattr(localConnections, 'connections', None)
+    if connections is None:
+        connections = localConnections.connections = {}
+    key = os.path.abspath(database)
+    connection = connections.get(key, None)
+    if connection is None:
+        connection = connections[key] = ReadOnlyConnection(database)
+    return connection
+
+
+def closeConnection(database):
+    connections = getattr(localConnections, 'connections', {})
+    connection = connections.pop(os.path.abspath(database), None)
+    if connection is not None:
+        connection.close()
@@ -0,0 +1,381 @@
+import os
+import mmap
+import time
+import struct
+import hashlib
+import threading
+from multiprocessing.pool import ThreadPool
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from mediatypes import getMediaClass, MEDIA_CLASS_RAW
+from libraries import ShotwellPool
+
+# display copies of RAW files (their embedded preview) and of pictures larger than the screen,
+# kept in the profile directory of the addon and linked by the picture pages once they exist
+DERIVATIVE_DIRECTORY = "derivatives"
+DERIVATIVE_EXTENSION = ".jpg"
+DERIVATIVE_QUALITY = 90
+
+# previews smaller than this (edge in pixels) are thumbnails, kodi may do better with the RAW file itself
+MIN_PREVIEW_SIZE = 1024
+
+# pictures of a listing handed to the workers at once, the first ones start while the rest is still read
+LISTING_BATCH_SIZE = 100
+
+# plain jpegs are only read this far to learn their size
+JPEG_HEADER_SIZE = 256 * 1024
+
+JPEG_EXTENSIONS = frozenset(["jpg", "jpeg", "jpe"])
+
+# start of frame markers of baseline, extended and progressive huffman jpegs, the others
+# (lossless, arithmetic coding) are what RAW files keep their sensor data in
+DISPLAYABLE_FRAME_MARKERS = frozenset([0xc0, 0xc1, 0xc2])
+OTHER_FRAME_MARKERS = frozenset([0xc3, 0xc5, 0xc6, 0xc7, 0xc9, 0xca, 0xcb, 0xcd, 0xce, 0xcf])
+
+TIFF_ORIENTATION_TAG = 0x0112
+
+# PIL transpositions turning a picture of the exif orientation upright, and its best downscaling filter
+if Image is not None:
+    RESAMPLE_FILTER = getattr(Image, 'LANCZOS', getattr(Image, 'ANTIALIAS', None))
+    ORIENTATION_TRANSPOSES = {2: [Image.FLIP_LEFT_RIGHT], 3: [Image.ROTATE_180], 4: [Image.FLIP_TOP_BOTTOM],
+                              5: [Image.ROTATE_90, Image.FLIP_TOP_BOTTOM], 6: [Image.ROTATE_270],
+                              7: [Image.ROTATE_270, Image.FLIP_TOP_BOTTOM], 8: [Image.ROTATE_90]}
+
+
+def getExtension(filename):
+    return os.path.splitext(filename)[1][1:].lower()
+
+
+def parseJpegHeader(data, start):
+    # walks the segments of the jpeg at start up to its first scan,
+    # returns width, height and the position of the scan or None
+    if data[start:start + 2] != b'\xff\xd8':
+        return None
+    position = start + 2
+    size = None
+    while position + 4 <= len(data):
+        if data[position:position + 1] != b'\xff':
+            return None
+        marker = ord(data[position + 1:position + 2])
+        if marker == 0xff:
+            # fill byte
+            position += 1
+            continue
+        length = struct.unpack('>H', data[position + 2:position + 4])[0]
+        if marker in OTHER_FRAME_MARKERS:
+            return None
+        if marker in DISPLAYABLE_FRAME_MARKERS and position + 9 <= len(data):
+            height, width = struct.unpack('>HH', data[position + 5:position + 9])
+            size = (width, height)
+        if marker == 0xda:
+            if size is None:
+                return None
+            return size[0], size[1], position
+        position += 2 + length
+    return None
+
+
+def findLargestJpeg(data):
+    # RAW containers keep one or more jpeg previews next to the sensor data,
+    # the largest displayable one is returned as (start, end, width, height)
+    best = None
+    position = data.find(b'\xff\xd8\xff')
+    while position >= 0:
+        header = parseJpegHeader(data, position)
+        next = position + 2
+        if header is not None:
+            width, height, scan = header
+            # scans contain no markers but restarts, the end of image is the next marker of its kind
+            end = data.find(b'\xff\xd9', scan)
+            if end >= 0:
+                end += 2
+                if best is None or width * height > best[2] * best[3]:
+                    best = (position, end, width, height)
+                next = end
+        position = data.find(b'\xff\xd8\xff', next)
+    return best
+
+
+def getTiffOrientation(data):
+    # the orientation of the first ifd of tiff based RAW files (nef, cr2, arw, dng, ...), None for others
+    if data[:4] == b'II*\x00':
+        order = '<'
+    elif data[:4] == b'MM\x00*':
+        order = '>'
+    else:
+        return None
+    try:
+        offset = struct.unpack(order + 'I', data[4:8])[0]
+        count = struct.unpack(order + 'H', data[offset:offset + 2])[0]
+        for i in range(count):
+            entry = offset + 2 + i * 12
+            tag, type = struct.unpack(order + 'HH', data[entry:entry + 4])
+            if tag == TIFF_ORIENTATION_TAG and type == 3:
+                return struct.unpack(order + 'H', data[entry + 8:entry + 10])[0]
+    except struct.error:
+        return None
+    return None
+
+
+def addOrientation(jpeg, orientation):
+    # a preview copied out of its RAW file lost the orientation of the RAW's tiff header,
+    # a minimal exif segment carrying it lets kodi turn the picture (PIL-less systems)
+    if orientation is None or orientation == 1 or b'Exif\x00\x00' in jpeg[:4096]:
+        return jpeg
+    tiff = b'II*\x00' + struct.pack('<I', 8) + struct.pack('<H', 1)
+    tiff += struct.pack('<HHIHH', TIFF_ORIENTATION_TAG, 3, 1, orientation, 0) + struct.pack('<I', 0)
+    segment = b'Exif\x00\x00' + tiff
+    return jpeg[:2] + b'\xff\xe1' + struct.pack('>H', len(segment) + 2) + segment + jpeg[2:]
+
+
+def isOversized(size, displaySize):
+    # compared edge by edge, so portrait pictures fit a landscape screen the same way
+    return max(size) > max(displaySize) or min(size) > min(displaySize)
+
+
+def scaleJpeg(data, displaySize, orientation):
+    # returns the jpeg turned upright and scaled to fit displaySize, or None without PIL
+    if Image is None:
+        return None
+    from io import BytesIO
+    image = Image.open(BytesIO(data))
+    if orientation is None:
+        try:
+            orientation = image._getexif().get(TIFF_ORIENTATION_TAG, None)
+        except Exception:
+            orientation = None
+    image.draft('RGB', displaySize)
+    for transpose in ORIENTATION_TRANSPOSES.get(orientation, []):
+        image = image.transpose(transpose)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.thumbnail(displaySize, RESAMPLE_FILTER)
+    output = BytesIO()
+    image.save(output, 'JPEG', quality = DERIVATIVE_QUALITY)
+    return output.getvalue()
+
+
+def needsDerivative(filename):
+    # which pictures get display copies; plain jpegs only where they can be scaled
+    extension = getExtension(filename)
+    if getMediaClass(filename) == MEDIA_CLASS_RAW:
+        return True
+    return Image is not None and extension in JPEG_EXTENSIONS
+
+
+def readRawPreview(path):
+    with open(path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        try:
+            preview = findLargestJpeg(data)
+            if preview is None or max(preview[2], preview[3]) < MIN_PREVIEW_SIZE:
+                return None, None, None
+            return data[preview[0]:preview[1]], (preview[2], preview[3]), getTiffOrientation(data[:65536])
+        finally:
+            data.close()
+
+
+def readLargeJpeg(path, displaySize):
+    with open(path, 'rb') as f:
+        header = parseJpegHeader(f.read(JPEG_HEADER_SIZE), 0)
+        if header is None or not isOversized(header[:2], displaySize):
+            return None, None
+        f.seek(0)
+        return f.read(), header[:2]
+
+
+def createDerivative(source, target, displaySize):
+    # source is a readable path of the picture, target the path in the derivative cache;
+    # returns whether a copy was written
+    if getMediaClass(source) == MEDIA_CLASS_RAW:
+        data, size, orientation = readRawPreview(source)
+    elif Image is not None:
+        data, size = readLargeJpeg(source, displaySize)
+        orientation = None
+    else:
+        return False
+    if data is None:
+        return False
+
+    if Image is not None and (isOversized(size, displaySize) or orientation not in (None, 1)):
+        data = scaleJpeg(data, displaySize, orientation)
+    else:
+        data = addOrientation(data, orientation)
+
+    with open(target + '.tmp', 'wb') as f:
+        f.write(data)
+    os.rename(target + '.tmp', target)
+    return True
+
+
+class DerivativeCache:
+    # one file per picture and display size; the modification time of a file is the time it was
+    # made (a picture edited later is made again), its access time the last time a page linked it,
+    # and the least recently linked files are dropped once the cache grows beyond maxBytes
+
+    def __init__(self, directory, maxBytes, displaySize):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.displaySize = displaySize
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def getPath(self, filename):
+        key = "%s|%dx%d"%(filename, self.displaySize[0], self.displaySize[1])
+        return os.path.join(self.directory, hashlib.md5(key.encode('utf-8')).hexdigest() + DERIVATIVE_EXTENSION)
+
+    def lookup(self, filename):
+        # the copy of a picture (its key, see libraries.Library.getSourceKey) if there is one
+        path = self.getPath(filename)
+        try:
+            stat = os.stat(path)
+            os.utime(path, (time.time(), stat.st_mtime))
+        except OSError:
+            return None
+        return path
+
+    def isCurrent(self, filename, source):
+        try:
+            return os.stat(self.getPath(filename)).st_mtime >= os.stat(source).st_mtime
+        except OSError:
+            return False
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(DERIVATIVE_EXTENSION):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_atime, stat.st_size, path))
+            total += stat.st_size
+
+        entries.sort()
+        for atime, size, path in entries:
+            if total <= self.maxBytes:
+                break
+            self.remove(path)
+            total -= size
+
+
+def getJobs(library, pictures):
+    # the jobs of DerivativeQueue.add for pictures of library
+    jobs = []
+    for picture in pictures:
+        sources = [library.getProperPath(picture.filename)]
+        if sources[0] != picture.filename:
+            sources += [picture.filename]
+        jobs += [(library.getSourceKey(picture.filename), sources)]
+    return jobs
+
+
+def runJob(cache, filename, sources):
+    # sources: paths to read the picture from, the mapped one first
+    for source in sources:
+        if not os.path.exists(source):
+            continue
+        if cache.isCurrent(filename, source):
+            return False
+        try:
+            return createDerivative(source, cache.getPath(filename), cache.displaySize)
+        except Exception:
+            # a broken or unexpected file (or none of ours), kodi gets the original
+            cache.remove(cache.getPath(filename) + '.tmp')
+            return False
+    return False
+
+
+class DerivativeQueue:
+    # makes the display copies of whole events and saved searches in the background of the
+    # service; the work is reading files and PIL's scaling, which both run without the GIL,
+    # and kodi's embedded python can't start worker processes, so these are threads
+
+    def __init__(self, workers):
+        self.workers = max(1, workers)
+        self.pool = None
+        # lists the pictures of whole events and saved searches, with connections of its own
+        self.lister = None
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.caches = {}
+
+    def add(self, cache, jobs):
+        # jobs: (key of the picture, see libraries.Library.getSourceKey, readable paths of the file)
+        with self.lock:
+            if self.pool is None:
+                self.pool = ThreadPool(self.workers)
+            for filename, sources in jobs:
+                if not needsDerivative(filename):
+                    continue
+                key = (cache.directory, filename)
+                if key in self.pending:
+                    continue
+                self.pending.add(key)
+                self.caches[cache.directory] = cache
+                self.pool.apply_async(runJob, (cache, filename, sources), callback = self.getCallback(key))
+
+    def addListing(self, cache, library, cacheDirectory, query):
+        # query(shotwellAccess) lists the pictures, it runs in the lister so that the page
+        # doesn't wait for the whole event or saved search to be read
+        with self.lock:
+            if self.lister is None:
+                self.lister = ThreadPool(1)
+            self.lister.apply_async(self.runListing, (cache, library, cacheDirectory, query))
+
+    def runListing(self, cache, library, cacheDirectory, query):
+        shotwellPool = getattr(self.local, 'shotwellPool', None)
+        if shotwellPool is None:
+            shotwellPool = self.local.shotwellPool = ShotwellPool()
+        batch = []
+        try:
+            for picture in query(shotwellPool.get(library.database, cacheDirectory)):
+                batch += [picture]
+                if len(batch) == LISTING_BATCH_SIZE:
+                    self.add(cache, getJobs(library, batch))
+                    batch = []
+        except Exception:
+            # the database went away or changed under the listing, the next page view queues it again
+            return
+        if len(batch) > 0:
+            self.add(cache, getJobs(library, batch))
+
+    def getCallback(self, key):
+        def finished(result):
+            self.finish(key)
+        return finished
+
+    def finish(self, key):
+        # the caches are trimmed whenever the queue runs empty
+        with self.lock:
+            self.pending.discard(key)
+            if len(self.pending) > 0:
+                return
+            caches = self.caches.values()
+            self.caches = {}
+        for cache in caches:
+            cache.evict()
+
+    def close(self):
+        with self.lock:
+            pools = [self.lister, self.pool]
+            self.lister = None
+            self.pool = None
+            self.pending = set()
+        for pool in pools:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
@@ -0,0 +1,141 @@
+import os
+import sys
+import time
+import json
+import threading
+import xbmc
+
+# per-navigation summaries are appended here (one json object per line) when
+# the kodi log is not used, the file is rotated once it grows beyond the size
+INSTRUMENTATION_LOG_FILE = "instrumentation.json"
+INSTRUMENTATION_LOG_SIZE = 1024 * 1024
+
+# slow statements show at most this much of their sql in the kodi log
+SQL_LOG_LENGTH = 300
+
+# records the queries of the current navigation, None unless enabled in the settings
+recorder = None
+
+# the page handler a worker thread queries for (see libraries.LibraryQueries), its own stack doesn't know
+delegated = threading.local()
+
+
+def getCallingHandler():
+    # the page handlers (create...Page of the viewer) a query was made for, outermost first
+    handlers = []
+    frame = sys._getframe(2)
+    while frame is not None:
+        name = frame.f_code.co_name
+        if name.startswith('create') and name.endswith('Page'):
+            handlers.insert(0, name)
+        frame = frame.f_back
+    outer = getattr(delegated, 'handler', None)
+    if outer is not None:
+        handlers.insert(0, outer)
+    if len(handlers) == 0:
+        return None
+    return "/".join(handlers)
+
+
+def isFullScan(detail):
+    # "SCAN TABLE phototable" (newer sqlite: "SCAN phototable"), scans of a covering index say "USING"
+    return detail.startswith('SCAN') and 'USING' not in detail
+
+
+class QueryRecorder:
+    # queries of worker threads are recorded as well; sqlite connections belong to the thread
+    # that opened them, so slow queries are explained right away, by the thread running them
+
+    def __init__(self, slowQueryTime):
+        self.slowQueryTime = slowQueryTime
+        self.queries = []
+        self.lock = threading.Lock()
+
+    def record(self, cursor, sql, params, elapsed):
+        # the settings of connections (see connection.ReadOnlyConnection) are no queries of a page
+        if sql.lstrip().lower().startswith('pragma'):
+            return None
+        entry = {'sql': " ".join(sql.split()), 'time': elapsed, 'rows': 0, 'handler': getCallingHandler(),
+                 'connection': cursor.connection, 'params': params, 'plan': None}
+        with self.lock:
+            self.queries.append(entry)
+        self.checkSlow(entry)
+        return entry
+
+    def checkSlow(self, entry):
+        # called again while the rows are fetched, sqlite does most of its work then
+        if entry['plan'] is None and entry['params'] is not None and entry['time'] >= self.slowQueryTime:
+            entry['plan'] = self.explain(entry)
+            entry['connection'] = None
+
+    def explain(self, entry):
+        try:
+            rows = entry['connection'].execute("explain query plan " + entry['sql'], entry['params']).fetchall()
+        except Exception as e:
+            return ["explain failed: %s"%(e)]
+        return [row[-1] for row in rows]
+
+    def getSlowQueries(self):
+        slow = []
+        for entry in self.queries:
+            if entry['plan'] is None:
+                continue
+            plan = entry['plan']
+            slow.append({'sql': entry['sql'], 'time': entry['time'], 'rows': entry['rows'], 'handler': entry['handler'],
+                         'plan': plan, 'full_scan': len([detail for detail in plan if isFullScan(detail)]) > 0})
+        return slow
+
+    def getSummary(self, url, totalTime, submitTime):
+        sqlTime = sum(entry['time'] for entry in self.queries)
+        return {'time': time.time(), 'url': url, 'queries': len(self.queries),
+                'total_time': totalTime, 'sql_time': sqlTime, 'submit_time': submitTime,
+                'python_time': max(0.0, totalTime - sqlTime - submitTime),
+                'query_log': [{'sql': entry['sql'], 'time': entry['time'], 'rows': entry['rows'], 'handler': entry['handler']}
+                              for entry in self.queries],
+                'slow_queries': self.getSlowQueries()}
+
+
+def startNavigation(enabled, slowQueryTime):
+    global recorder
+    recorder = None
+    if enabled:
+        recorder = QueryRecorder(slowQueryTime)
+
+
+def logSummary(summary):
+    xbmc.log("ShotwellViewer: %(url)s took %(total_time).3fs: sql %(sql_time).3fs (%(queries)d queries), "
+             "python %(python_time).3fs, kodi %(submit_time).3fs"%(summary), xbmc.LOGNOTICE)
+    for query in summary['slow_queries']:
+        flag = ""
+        if query['full_scan']:
+            flag = " FULL SCAN"
+        xbmc.log("ShotwellViewer: slow query%s in %s, %.3fs, %d rows: %s"%(flag, query['handler'], query['time'], query['rows'],
+                                                                          query['sql'][:SQL_LOG_LENGTH]), xbmc.LOGNOTICE)
+        for detail in query['plan']:
+            xbmc.log("ShotwellViewer:     " + detail, xbmc.LOGNOTICE)
+
+
+def writeSummary(summary, directory):
+    path = os.path.join(directory, INSTRUMENTATION_LOG_FILE)
+    try:
+        if os.path.exists(path) and os.path.getsize(path) > INSTRUMENTATION_LOG_SIZE:
+            if os.path.exists(path + '.1'):
+                os.remove(path + '.1')
+            os.rename(path, path + '.1')
+        with open(path, 'a') as f:
+            f.write(json.dumps(summary) + "\n")
+    except (IOError, OSError) as e:
+        xbmc.log("ShotwellViewer: can't write %s: %s"%(path, e), xbmc.LOGWARNING)
+
+
+def finishNavigation(url, totalTime, submitTime, directory = None):
+    # directory: write the summary to the rotating json file there instead of the kodi log
+    global recorder
+    if recorder is None:
+        return
+    summary = recorder.getSummary(url, totalTime, submitTime)
+    recorder = None
+    if directory is None:
+        logSummary(summary)
+    else:
+        writeSummary(summary, directory)
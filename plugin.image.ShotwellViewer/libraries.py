@@ -0,0 +1,172 @@
+import os
+import heapq
+import threading
+from multiprocessing.pool import ThreadPool
+
+from shotwell import ShotwellAccess, getPhotoSourceId
+from thumbnails import ThumbnailResolver
+import instrumentation
+
+# the library of the general settings and up to three more, set up in their own category
+MAX_LIBRARIES = 4
+
+
+def getFileIdentity(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_dev, stat.st_ino)
+
+
+def getPictureOrder(picture):
+    # the order of all picture listings, sqlite sorts pictures without exposure time first
+    return (picture.exposure_time, picture.filename)
+
+
+def mergeSorted(streams, key):
+    # k-way merge of streams that are each sorted by key, equal keys keep the order of the streams;
+    # only the head of every stream is held, so the merged stream can stop early at a page limit
+    iterators = [iter(stream) for stream in streams]
+    heap = []
+    for index, iterator in enumerate(iterators):
+        for item in iterator:
+            heap.append((key(item), index, item))
+            break
+    heapq.heapify(heap)
+    while len(heap) > 0:
+        index, item = heap[0][1:]
+        yield item
+        for item in iterators[index]:
+            heapq.heapreplace(heap, (key(item), index, item))
+            break
+        else:
+            heapq.heappop(heap)
+
+
+def ofLibrary(library, pictures):
+    # the (library, picture) entries picture pages list
+    return ((library, picture) for picture in pictures)
+
+
+def mergePictures(streams):
+    # streams: (library, pictures) of several libraries, each in picture order
+    return mergeSorted([ofLibrary(library, pictures) for library, pictures in streams], lambda entry: getPictureOrder(entry[1]))
+
+
+def interleave(streams):
+    # the rankings of search results of different libraries can't be compared, so they take turns
+    iterators = [iter(stream) for stream in streams]
+    while len(iterators) > 0:
+        remaining = []
+        for iterator in iterators:
+            for item in iterator:
+                yield item
+                remaining.append(iterator)
+                break
+        iterators = remaining
+
+
+class Library:
+    # one shotwell library: source is the configured photo.db, database the one read (maybe a
+    # local snapshot of it); index is the number of its settings, urls of its events, saved
+    # searches and tags carry it (see ShotwellViewer.getLibrary)
+
+    def __init__(self, index, source, database, sourcePathPrefix, targetPathPrefix, thumbnailDirectory):
+        self.index = index
+        self.source = source
+        self.database = database
+        self.sourcePathPrefix = sourcePathPrefix
+        self.targetPathPrefix = targetPathPrefix
+        self.thumbnailDirectory = thumbnailDirectory
+        self.thumbnails = ThumbnailResolver(thumbnailDirectory, getPhotoSourceId, self.getProperPath)
+
+    def getProperPath(self, filepath):
+        if self.sourcePathPrefix != "" and filepath.startswith(self.sourcePathPrefix):
+            return self.targetPathPrefix + "/" + filepath[len(self.sourcePathPrefix):]
+        else:
+            return filepath
+
+    def isRemotePath(self, filepath):
+        # files of a remapped prefix or an url are on some share, shotwell's own paths are local
+        properPath = self.getProperPath(filepath)
+        return properPath != filepath or "://" in properPath
+
+    def getSourceKey(self, filename):
+        # pictures of different machines may have the same file name, the first
+        # library keeps shotwell's file names as keys of its display copies
+        if self.index == 0:
+            return filename
+        return "%d:%s"%(self.index, filename)
+
+    def getSettingsKey(self):
+        return (self.index, self.database, self.sourcePathPrefix, self.targetPathPrefix, self.thumbnailDirectory)
+
+
+class ShotwellPool:
+    # open ShotwellAccess instances of one thread, a database that was
+    # replaced by a new file (e.g. restored from a backup) is opened again
+
+    def __init__(self):
+        self.instances = {}
+
+    def get(self, database, cacheDirectory):
+        key = (database, cacheDirectory)
+        identity = getFileIdentity(database)
+        entry = self.instances.get(key, None)
+        if entry is not None and entry[0] == identity:
+            return entry[1]
+        if entry is not None:
+            entry[1].close()
+        access = ShotwellAccess(database, cacheDirectory)
+        self.instances[key] = (identity, access)
+        return access
+
+    def close(self):
+        for key in self.instances:
+            self.instances[key][1].close()
+        self.instances = {}
+
+
+class LibraryQueries:
+    # runs a query against several libraries at once; sqlite does its work without the GIL,
+    # so a combined listing takes about as long as the one of the slowest library. sqlite
+    # connections belong to the thread that opened them, every worker has its own ShotwellPool
+
+    def __init__(self, workers = MAX_LIBRARIES):
+        self.workers = workers
+        self.pool = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def open(self, library, cacheDirectory):
+        shotwellPool = getattr(self.local, 'shotwellPool', None)
+        if shotwellPool is None:
+            shotwellPool = self.local.shotwellPool = ShotwellPool()
+        return shotwellPool.get(library.database, cacheDirectory)
+
+    def map(self, query, libraries, cacheDirectory):
+        # query(shotwellAccess, library) of every library, in the order of libraries; cursors
+        # can't leave the worker either, so queries return lists rather than streams
+        handler = None
+        if instrumentation.recorder is not None:
+            handler = instrumentation.getCallingHandler()
+        def run(library):
+            instrumentation.delegated.handler = handler
+            try:
+                return query(self.open(library, cacheDirectory), library)
+            finally:
+                instrumentation.delegated.handler = None
+        with self.lock:
+            if self.pool is None:
+                self.pool = ThreadPool(self.workers)
+            pool = self.pool
+        return pool.map(run, libraries)
+
+    def close(self):
+        with self.lock:
+            pool = self.pool
+            self.pool = None
+        if pool is not None:
+            pool.terminate()
+            pool.join()
@@ -0,0 +1,82 @@
+import os
+import hashlib
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+LISTING_CACHE_VERSION = 3
+
+
+class ListingCache:
+    # rendered directory listings, one file per plugin url; an entry is only
+    # valid for the listing signature it was built with, and the least
+    # recently used entries are dropped once the cache grows beyond maxBytes
+
+    def __init__(self, directory, maxBytes):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def getPath(self, key):
+        return os.path.join(self.directory, hashlib.md5(repr(key).encode('utf-8')).hexdigest() + '.listing')
+
+    def load(self, key, signature):
+        path = self.getPath(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except Exception:
+            entry = None
+        if entry is None or entry.get('version', None) != LISTING_CACHE_VERSION or entry['key'] != key or entry['signature'] != signature:
+            self.remove(path)
+            return None
+
+        # the modification time doubles as the last access time
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return entry['listing']
+
+    def store(self, key, signature, listing):
+        path = self.getPath(key)
+        entry = {'version': LISTING_CACHE_VERSION, 'key': key, 'signature': signature, 'listing': listing}
+        try:
+            with open(path + '.tmp', 'wb') as f:
+                pickle.dump(entry, f, 2)
+            os.rename(path + '.tmp', path)
+        except (IOError, OSError):
+            self.remove(path + '.tmp')
+            return
+        self.evict()
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith('.listing'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.maxBytes:
+                break
+            self.remove(path)
+            total -= size
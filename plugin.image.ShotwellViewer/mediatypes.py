@@ -0,0 +1,44 @@
+import os
+
+NON_RAW_EXTENSIONS = [
+        "jpg", "jpeg", "jpe",
+        "tiff", "tif",
+        "png",
+        "gif",
+        "bmp",
+        "ppm", "pgm", "pbm", "pnm",        
+        # THM are JPEG thumbnails produced by some RAW cameras ... want to support the RAW
+        # image but not import their thumbnails
+        "thm",        
+        # less common
+        "tga", "ilbm", "pcx", "ecw", "img", "sid", "cd5", "fits", "pgf",        
+        # vector
+        "cgm", "svg", "odg", "eps", "pdf", "swf", "wmf", "emf", "xps",        
+        # 3D
+        "pns", "jps", "mpo"]
+        
+RAW_EXTENSIONS = [
+        "3fr", "arw", "srf", "sr2", "bay", "crw", "cr2", "cap", "iiq", "eip", "dcs", "dcr", "drf",
+        "k25", "kdc", "dng", "erf", "fff", "mef", "mos", "mrw", "nef", "nrw", "orf", "ptx", "pef",
+        "pxn", "r3d", "raf", "raw", "rw2", "rwl", "rwz", "x3f", "srw"]
+        
+ALL_EXTENSIONS = NON_RAW_EXTENSIONS + RAW_EXTENSIONS
+
+
+# media classes kept in the side index
+MEDIA_CLASS_UNSUPPORTED = 0
+MEDIA_CLASS_PHOTO = 1
+MEDIA_CLASS_RAW = 2
+
+NON_RAW_EXTENSION_SET = frozenset(NON_RAW_EXTENSIONS)
+RAW_EXTENSION_SET = frozenset(RAW_EXTENSIONS)
+
+
+def getMediaClass(filename):
+    # the real extension, "xjpg" is not a jpeg
+    ext = os.path.splitext(filename)[1][1:].lower()
+    if ext in RAW_EXTENSION_SET:
+        return MEDIA_CLASS_RAW
+    elif ext in NON_RAW_EXTENSION_SET:
+        return MEDIA_CLASS_PHOTO
+    return MEDIA_CLASS_UNSUPPORTED
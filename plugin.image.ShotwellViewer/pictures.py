@@ -0,0 +1,74 @@
+import os
+from array import array
+
+# exposure time of pictures without one in the columns of PictureList
+NO_EXPOSURE_TIME = -2 ** 31
+
+
+class Picture(object):
+    # one row of a picture listing (id, filename, title, exposure_time)
+    __slots__ = ('id', 'filename', 'title', 'exposure_time')
+
+    def __init__(self, row):
+        self.id, self.filename, self.title, self.exposure_time = row
+
+    @property
+    def label(self):
+        # shotwell shows pictures without a title by their file name
+        if self.title is None:
+            return os.path.basename(self.filename)
+        return self.title
+
+
+class ListedPicture(Picture):
+    # a row of a picture listing (LISTED_PICTURE_COLUMNS of shotwell.py), a Picture
+    # and what kodi would read from the file itself (see viewer.getPictureInfo)
+    __slots__ = ('rating', 'width', 'height', 'orientation', 'comment', 'filesize')
+
+    def __init__(self, row):
+        Picture.__init__(self, row[:4])
+        self.rating, self.width, self.height, self.orientation, self.comment, self.filesize = row[4:]
+
+
+class PictureList(object):
+    # whole results (getPicturesOf... of ShotwellAccess) kept column by column,
+    # ListedPicture records are only made for the entries looked at
+
+    def __init__(self, pictures = ()):
+        self.ids = array('l')
+        self.exposureTimes = array('l')
+        self.filenames = []
+        self.titles = []
+        # the columns of ListedPicture beyond those of Picture, None for plain pictures
+        self.details = [[] for name in ListedPicture.__slots__]
+        for picture in pictures:
+            self.append(picture)
+
+    def append(self, picture):
+        self.ids.append(picture.id)
+        if picture.exposure_time is None:
+            self.exposureTimes.append(NO_EXPOSURE_TIME)
+        else:
+            self.exposureTimes.append(picture.exposure_time)
+        self.filenames.append(picture.filename)
+        self.titles.append(picture.title)
+        for name, column in zip(ListedPicture.__slots__, self.details):
+            column.append(getattr(picture, name, None))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self.ids)
+        if index < 0 or index >= len(self.ids):
+            raise IndexError(index)
+        exposureTime = self.exposureTimes[index]
+        if exposureTime == NO_EXPOSURE_TIME:
+            exposureTime = None
+        return ListedPicture((self.ids[index], self.filenames[index], self.titles[index], exposureTime) + 
+                             tuple(column[index] for column in self.details))
+
+    def __iter__(self):
+        for index in range(len(self.ids)):
+            yield self[index]
@@ -0,0 +1,234 @@
+import os
+import shutil
+import urllib
+import hashlib
+import binascii
+import threading
+import mimetypes
+import SocketServer
+import BaseHTTPServer
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+import xbmc
+import xbmcvfs
+
+# pictures on a network share are handed to kodi as urls of a small http server in the
+# service, which reads them ahead into a local directory while a slideshow runs
+PREFETCH_DIRECTORY = "prefetch"
+PREFETCH_WORKERS = 3
+
+# pictures behind the one shown stay cached for going back this far
+KEEP_BEHIND = 1
+
+# listings whose pictures can still be asked for, older ones are forgotten
+MAX_SEQUENCES = 20
+
+COPY_BUFFER_SIZE = 256 * 1024
+
+
+def getKey(path):
+    return hashlib.md5(path.encode('utf-8')).hexdigest()
+
+
+def copyFile(source, target):
+    # kodi reads smb:// and nfs:// urls, python only what is mounted
+    if "://" in source:
+        if not xbmcvfs.copy(source, target):
+            raise IOError("can't copy " + source)
+    else:
+        shutil.copyfile(source, target)
+
+
+class PrefetchRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        # /<token>/<key>/<file name>, the file name only tells kodi the type of the picture
+        parts = self.path.split('/')
+        path = None
+        if len(parts) == 4 and parts[1] == self.server.prefetcher.token:
+            path = self.server.prefetcher.serve(parts[2])
+        if path is None:
+            self.send_error(404)
+            return
+        try:
+            f = open(path, 'rb')
+        except IOError:
+            # evicted meanwhile by a tiny cache
+            self.send_error(404)
+            return
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', mimetypes.guess_type(parts[3])[0] or 'application/octet-stream')
+            self.send_header('Content-Length', str(os.fstat(f.fileno()).st_size))
+            self.end_headers()
+            shutil.copyfileobj(f, self.wfile, COPY_BUFFER_SIZE)
+        except (IOError, OSError):
+            # kodi went on to the next picture
+            pass
+        finally:
+            f.close()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PrefetchServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class SlideshowPrefetcher:
+    # a listing registers its pictures in order as a sequence; whenever kodi asks for one
+    # of them, the next depth pictures are copied by the workers, the ones shown before
+    # are dropped, and the cache never holds more than maxBytes beyond the picture asked for
+
+    def __init__(self, directory, workers = PREFETCH_WORKERS):
+        self.directory = directory
+        self.workers = workers
+        self.token = binascii.hexlify(os.urandom(8))
+        self.depth = 0
+        self.maxBytes = 0
+        self.lock = threading.Lock()
+        self.sequences = {}
+        self.nextSequence = 0
+        # key -> (sequence, index) of its latest listing, and the path of the picture
+        self.positions = {}
+        self.paths = {}
+        # cached keys and their sizes, least recently used first
+        self.cached = OrderedDict()
+        self.cachedBytes = 0
+        self.fetching = {}
+        self.pool = None
+        self.server = None
+
+    def start(self):
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory, ignore_errors = True)
+        os.makedirs(self.directory)
+        self.pool = ThreadPool(self.workers)
+        self.server = PrefetchServer(('127.0.0.1', 0), PrefetchRequestHandler)
+        self.server.prefetcher = self
+        thread = threading.Thread(target = self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def configure(self, depth, maxBytes):
+        with self.lock:
+            self.depth = depth
+            self.maxBytes = maxBytes
+
+    def newSequence(self):
+        with self.lock:
+            sequence = self.nextSequence
+            self.nextSequence += 1
+            self.sequences[sequence] = []
+            if len(self.sequences) > MAX_SEQUENCES:
+                oldest = min(self.sequences)
+                for key in self.sequences.pop(oldest):
+                    if key in self.positions and self.positions[key][0] == oldest:
+                        del self.positions[key]
+                        del self.paths[key]
+            return sequence
+
+    def getUrl(self, sequence, path):
+        # appends the picture at path (as kodi would read it) to the sequence
+        key = getKey(path)
+        with self.lock:
+            self.positions[key] = (sequence, len(self.sequences[sequence]))
+            self.paths[key] = path
+            self.sequences[sequence].append(key)
+        name = urllib.quote(os.path.basename(path).encode('utf-8'))
+        return "http://127.0.0.1:%d/%s/%s/%s"%(self.server.server_address[1], self.token, key, name)
+
+    def getCachePath(self, key):
+        return os.path.join(self.directory, key)
+
+    def serve(self, key):
+        # the local copy of the picture, fetched now unless a worker has it already
+        with self.lock:
+            if key not in self.paths:
+                return None
+            sequence, index = self.positions[key]
+            keys = self.sequences[sequence]
+            ahead = keys[index + 1:index + 1 + self.depth]
+            behind = keys[:max(0, index - KEEP_BEHIND)]
+        for shown in behind:
+            self.drop(shown)
+        path = self.fetch(key)
+        for following in ahead:
+            self.schedule(following)
+        return path
+
+    def schedule(self, key):
+        with self.lock:
+            if key in self.cached or key in self.fetching:
+                return
+            self.fetching[key] = threading.Event()
+        self.pool.apply_async(self.runFetch, (key,))
+
+    def runFetch(self, key):
+        try:
+            self.copy(key)
+        except Exception as e:
+            xbmc.log("ShotwellViewer: prefetching %s failed: %s"%(self.paths.get(key, key), e), xbmc.LOGDEBUG)
+        finally:
+            with self.lock:
+                done = self.fetching.pop(key, None)
+            if done is not None:
+                done.set()
+
+    def fetch(self, key):
+        with self.lock:
+            if key in self.cached:
+                self.cached[key] = self.cached.pop(key)
+                return self.getCachePath(key)
+            done = self.fetching.get(key, None)
+            if done is None:
+                self.fetching[key] = threading.Event()
+        if done is None:
+            self.runFetch(key)
+        else:
+            done.wait()
+        with self.lock:
+            if key in self.cached:
+                return self.getCachePath(key)
+        return None
+
+    def copy(self, key):
+        path = self.getCachePath(key)
+        copyFile(self.paths[key], path + '.tmp')
+        os.rename(path + '.tmp', path)
+        size = os.path.getsize(path)
+        with self.lock:
+            self.cached[key] = size
+            self.cachedBytes += size
+            evicted = []
+            # the least recently used go first, but never the picture just copied
+            while self.cachedBytes > self.maxBytes and len(self.cached) > 1:
+                oldest = next(iter(self.cached))
+                self.cachedBytes -= self.cached.pop(oldest)
+                evicted.append(oldest)
+        for oldest in evicted:
+            self.remove(oldest)
+
+    def drop(self, key):
+        with self.lock:
+            if key not in self.cached:
+                return
+            self.cachedBytes -= self.cached.pop(key)
+        self.remove(key)
+
+    def remove(self, key):
+        try:
+            os.remove(self.getCachePath(key))
+        except OSError:
+            pass
@@ -0,0 +1,43 @@
+import random
+
+# rounds of the feistel network, four make a good enough shuffle of photo ids
+ROUNDS = 4
+
+GOLDEN_RATIO_32 = 0x9E3779B1
+
+
+class RandomOrder:
+    # a pseudo random order of the numbers 0 .. size - 1, the same for the same seed; random
+    # slideshows only need to remember the seed and how far they got to go on without repeats.
+    # a feistel network shuffles the smallest power of four covering size, numbers outside
+    # of size are shuffled again until they fall inside (at most four times on average)
+
+    def __init__(self, size, seed):
+        self.size = size
+        bits = max(2, (size - 1).bit_length())
+        self.halfBits = (bits + 1) // 2
+        self.mask = (1 << self.halfBits) - 1
+        generator = random.Random(seed)
+        self.keys = [int(generator.getrandbits(32)) for i in range(ROUNDS)]
+
+    def mix(self, value, key):
+        mixed = ((value ^ key) * GOLDEN_RATIO_32) & 0xffffffff
+        return (mixed ^ (mixed >> 15)) & self.mask
+
+    def shuffle(self, value):
+        left = value >> self.halfBits
+        right = value & self.mask
+        for key in self.keys:
+            left, right = right, left ^ self.mix(right, key)
+        return (left << self.halfBits) | right
+
+    def get(self, position):
+        # the number at position of the order
+        value = self.shuffle(position)
+        while value >= self.size:
+            value = self.shuffle(value)
+        return value
+
+
+def getRandomSeed():
+    return random.getrandbits(31)
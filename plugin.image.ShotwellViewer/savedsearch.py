@@ -0,0 +1,255 @@
+from mediatypes import MEDIA_CLASS_PHOTO, MEDIA_CLASS_RAW
+from sideindex import getSearchWords, getFullTextQuery
+
+SAVED_SEARCH_TABLES = [
+        "savedsearchdbtable",
+        "savedsearchdbtable_date",
+        "savedsearchdbtable_flagged",
+        "savedsearchdbtable_mediatype",
+        "savedsearchdbtable_rating",
+        "savedsearchdbtable_text"]
+
+TEXT_SEARCH_FIELDS = ["TAG", "COMMENT", "EVENT_NAME", "FILE_NAME", "TITLE"]
+
+# side index tables, see ShotwellAccess.ensureSideIndex:
+# tag membership as (tag_id, photo_id) rows and the browse table holding the media class of every photo
+TAG_MEMBERSHIP_TABLE = "sideindex.tag_photo"
+MEDIA_CLASS_TABLE = "sideindex.photo_browse"
+# the full text index of the side index, see sideindex.SEARCH_MODULES
+FULL_TEXT_TABLE = "sideindex.photo_search"
+
+# compiled plans survive the ShotwellAccess instances of one process,
+# keyed by (database, search id) and tagged with the signature they were built for
+compiledPlans = {}
+
+
+def escapeLike(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class SavedSearchCompiler:
+
+    def __init__(self, cursor, namespace = None):
+        self.cursor = cursor
+        self.namespace = namespace
+        # the full text module of the side index, None while plain like conditions have to do
+        self.fullText = None
+
+    def getSignature(self):
+        # shotwell replaces the rows of a search when it is edited, so row counts
+        # and ids of all savedsearch tables change whenever a definition does
+        parts = ["""select count(*), ifnull(max(id), 0), total(id) from %s"""%(table) for table in SAVED_SEARCH_TABLES]
+        self.cursor.execute(" union all ".join(parts))
+        return tuple(self.cursor.fetchall())
+
+    def getPlan(self, searchId, signature = None):
+        # callers planning several searches pass the signature they read once for all of them
+        key = (self.namespace, int(searchId), self.fullText)
+        if signature is None:
+            signature = self.getSignature()
+        cached = compiledPlans.get(key, None)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        plan = self.compile(searchId)
+        compiledPlans[key] = (signature, plan)
+        return plan
+
+    def getTextComparison(self, context, text):
+        # returns the comparison, its parameters and whether the condition has to be negated
+        if text is None:
+            text = ""
+        if context == "CONTAINS":
+            return " like ? escape '\\'", ['%' + escapeLike(text) + '%'], False
+        elif context == "IS_EXACTLY":
+            return " = ?", [text], False
+        elif context == "STARTS_WITH":
+            return " like ? escape '\\'", [escapeLike(text) + '%'], False
+        elif context == "ENDS_WITH":
+            return " like ? escape '\\'", ['%' + escapeLike(text)], False
+        elif context == "DOES_NOT_CONTAIN":
+            return " like ? escape '\\'", ['%' + escapeLike(text) + '%'], True
+        elif context == "IS_NOT_SET":
+            return " is NULL", [], False
+        return None, [], False
+
+    def getTextFieldCondition(self, field, context, comparison, params):
+        if field == "TAG":
+            if context == "IS_NOT_SET":
+                return "id not in (select photo_id from %s)"%(TAG_MEMBERSHIP_TABLE), []
+            return """id in (select T.photo_id from %s as T join tagtable as G on G.id = T.tag_id
+                             where G.name%s)"""%(TAG_MEMBERSHIP_TABLE, comparison), params
+        elif field == "COMMENT":
+            return "comment" + comparison, params
+        elif field == "EVENT_NAME":
+            return "event_id in (select id from eventtable where name%s)"%(comparison), params
+        elif field == "FILE_NAME":
+            return "filename" + comparison, params
+        elif field == "TITLE":
+            return "title" + comparison, params
+        return None, []
+
+    def getFullTextCondition(self, context, text):
+        # "any text contains" becomes a phrase query of the full text index: its words have to
+        # follow each other in one of the fields, the last one may be the start of a word
+        if self.fullText not in ("fts5", "fts4") or context not in ("CONTAINS", "DOES_NOT_CONTAIN") or text is None:
+            return None
+        words = getSearchWords(text)
+        if len(words) == 0:
+            return None
+        query = getFullTextQuery(self.fullText, words, True)
+        negated = context == "DOES_NOT_CONTAIN"
+        condition = "id in (select rowid from %s where photo_search match ?)"%(FULL_TEXT_TABLE)
+        if negated:
+            condition = "not " + condition
+        return (condition, [query], True, ('fulltext', query, negated))
+
+    def getTextSearchConditions(self, searchId):
+        self.cursor.execute("""select search_type, context, text from savedsearchdbtable_text
+                               where search_id = ? order by id asc""", (searchId,))
+        conditions = []
+        for row in self.cursor.fetchall():
+            if row[0] == "ANY_TEXT":
+                fullTextCondition = self.getFullTextCondition(row[1], row[2])
+                if fullTextCondition is not None:
+                    conditions += [fullTextCondition]
+                    continue
+
+            comparison, params, negated = self.getTextComparison(row[1], row[2])
+            if comparison is None:
+                continue
+
+            fields = [row[0]]
+            if row[0] == "ANY_TEXT":
+                fields = TEXT_SEARCH_FIELDS
+
+            fieldConditions = []
+            conditionParams = []
+            fieldTerms = []
+            for field in fields:
+                condition, fieldParams = self.getTextFieldCondition(field, row[1], comparison, params)
+                if condition is not None:
+                    fieldConditions += [condition]
+                    conditionParams += fieldParams
+                    fieldTerms += [(field, condition, fieldParams)]
+            if len(fieldConditions) == 0:
+                continue
+
+            # any text is unset only if every field is unset
+            junction = " or "
+            if row[1] == "IS_NOT_SET":
+                junction = " and "
+            condition = "(" + junction.join(fieldConditions) + ")"
+            if negated:
+                # a missing value does not contain anything
+                condition = "not ifnull(" + condition + ", 0)"
+            term = ('text', fieldTerms, junction.strip(), negated, comparison, params)
+            conditions += [(condition, conditionParams, row[0] in ("TAG", "ANY_TEXT"), term)]
+
+        return conditions
+
+    def getDateSearchConditions(self, searchId):
+        self.cursor.execute("""select context, date_one, date_two from savedsearchdbtable_date
+                               where search_id = ? order by id asc""", (searchId,))
+        conditions = []
+        for row in self.cursor.fetchall():
+            if row[0] == "BETWEEN":
+                # include the whole second day
+                first, last = int(row[1]), int(row[2]) + 86400
+                conditions += [("exposure_time between ? and ?", [first, last], False, ('date', first, last + 1))]
+            elif row[0] == "EXACT":
+                # date_one is the start of the chosen day, shotwell matches the whole day
+                first, last = int(row[1]), int(row[1]) + 86400
+                conditions += [("(exposure_time >= ? and exposure_time < ?)", [first, last], False, ('date', first, last))]
+            elif row[0] == "AFTER":
+                conditions += [("exposure_time > ?", [int(row[1])], False, ('date', int(row[1]) + 1, None))]
+            elif row[0] == "BEFORE":
+                conditions += [("exposure_time < ?", [int(row[1])], False, ('date', None, int(row[1])))]
+            elif row[0] == "IS_NOT_SET":
+                conditions += [("exposure_time is NULL", [], False, ('date_unset',))]
+
+        return conditions
+
+    def getFlaggedSearchConditions(self, searchId):
+        self.cursor.execute("""select flag_state from savedsearchdbtable_flagged
+                               where search_id = ? order by id asc""", (searchId,))
+        conditions = []
+        for row in self.cursor.fetchall():
+            if row[0] == "FLAGGED":
+                conditions += [("(flags & 16) == 16", [], False, ('flagged', True))]
+            else:
+                conditions += [("(flags & 16) == 0", [], False, ('flagged', False))]
+
+        return conditions
+
+    def getMediaTypeSearchConditions(self, searchId):
+        self.cursor.execute("""select context, type from savedsearchdbtable_mediatype
+                               where search_id = ? order by id asc""", (searchId,))
+        conditions = []
+        for row in self.cursor.fetchall():
+            prefix = ""
+            if row[0] == 'IS_NOT':
+                prefix = 'NOT '
+
+            usesIndex = True
+            if row[1] == 'PHOTO_ALL':
+                condition = prefix + "(id in (select id from %s where media_class in (%d, %d)))"%(MEDIA_CLASS_TABLE, MEDIA_CLASS_PHOTO, MEDIA_CLASS_RAW)
+            elif row[1] == 'PHOTO_RAW':
+                condition = prefix + "(id in (select id from %s where media_class = %d))"%(MEDIA_CLASS_TABLE, MEDIA_CLASS_RAW)
+            else: # not supported media type
+                condition = prefix + "(filename is NULL and filename is not NULL)"
+                usesIndex = False
+            conditions += [(condition, [], usesIndex, ('mediatype', prefix != "", row[1]))]
+
+        return conditions
+
+    def getRatingSearchConditions(self, searchId):
+        self.cursor.execute("""select rating, context from savedsearchdbtable_rating
+                               where search_id = ? order by id asc""", (searchId,))
+        conditions = []
+        for row in self.cursor.fetchall():
+            comparison_operator = "="
+            if row[1] == "AND_LOWER":
+                comparison_operator = "<="
+            elif row[1] == "AND_HIGHER":
+                comparison_operator = ">="
+
+            if row[0] in (-1, 0, 1, 2, 3, 4, 5):
+                conditions += [("rating " + comparison_operator + " ?", [row[0]], False, ('rating', comparison_operator, row[0]))]
+
+        return conditions
+
+    def compile(self, searchId):
+        self.cursor.execute('select id, name, operator from savedsearchdbtable where id = ?', (searchId,))
+        row = self.cursor.fetchone()
+        if row is None:
+            return None
+
+        plan = {'id': row[0], 'name': row[1], 'matchtype': row[2], 'condition': "", 'params': (), 'uses_index': False, 'terms': []}
+
+        conditions = []
+        conditions += self.getRatingSearchConditions(row[0])
+        conditions += self.getMediaTypeSearchConditions(row[0])
+        conditions += self.getFlaggedSearchConditions(row[0])
+        conditions += self.getTextSearchConditions(row[0])
+        conditions += self.getDateSearchConditions(row[0])
+        if len(conditions) == 0:
+            return plan
+
+        operator = " AND "
+        if plan['matchtype'] in ("ANY", "NONE"):
+            operator = " OR "
+
+        condition = operator.join(["(" + condition[0] + ")" for condition in conditions])
+        if plan['matchtype'] == "NONE":
+            condition = "not ifnull(" + condition + ", 0)"
+
+        params = []
+        for entry in conditions:
+            params += entry[1]
+
+        plan['condition'] = condition
+        plan['params'] = tuple(params)
+        plan['uses_index'] = len([entry for entry in conditions if entry[2]]) > 0
+        plan['terms'] = [entry[3] for entry in conditions]
+        return plan
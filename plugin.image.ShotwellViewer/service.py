@@ -0,0 +1,28 @@
+#!/usr/bin/python
+
+import xbmc
+import xbmcaddon
+from backend import ViewerService
+
+# keeps the database open and the caches warm between two clicks,
+# plugin.py asks this service for listings (see backend.py)
+
+# xbmc.Monitor().waitForAbort needs kodi 14, abortRequested is polled instead
+ABORT_POLL_INTERVAL_MS = 500
+
+if (__name__ == "__main__"):
+    settings = xbmcaddon.Addon()
+    if settings.getSetting( "use_service" ) != "false":
+        try:
+            workers = int(settings.getSetting( "derivative_workers" ))
+        except ValueError:
+            workers = 2
+        # the urls of listings built in the background, until plugin.py sends its own
+        baseUrl = "plugin://%s/"%(settings.getAddonInfo('id'))
+        service = ViewerService(xbmc.translatePath(settings.getAddonInfo('profile')), baseUrl, workers)
+        service.start()
+        try:
+            while not xbmc.abortRequested:
+                xbmc.sleep(ABORT_POLL_INTERVAL_MS)
+        finally:
+            service.stop()
@@ -1,28 +1,72 @@
-import sqlite3
+import os
+import calendar
+import hashlib
+import tempfile
+import collections
+
+from mediatypes import NON_RAW_EXTENSIONS, RAW_EXTENSIONS, ALL_EXTENSIONS
+from savedsearch import SavedSearchCompiler, TAG_MEMBERSHIP_TABLE, escapeLike
+from bitmaps import SearchBitmapEngine, BITMAP_CACHE_FILE
+from sideindex import SideIndex, SIDE_INDEX_SCHEMA, getTagDisplayName, getSearchWords, getFullTextQuery, getEventScope
+from sideindex import SEARCH_COLUMNS, SEARCH_MODULE_LIKE, SEARCH_COLUMN_WEIGHTS
+from connection import getConnection, closeConnection
+from pictures import Picture, ListedPicture, PictureList
+from stacks import StackedPicture, getStacks
+
+# stay well below SQLITE_MAX_VARIABLE_NUMBER of older sqlite builds
+MAX_SQL_PARAMETERS = 500
+
+# rows fetched at once while streaming picture listings
+FETCH_BATCH_SIZE = 200
+
+# the columns of picture listings (see pictures.ListedPicture), in phototable and photo_browse
+LISTED_PICTURE_COLUMNS = "id, filename, title, exposure_time, rating, width, height, orientation, comment, filesize"
+
+# shotwell's photos and the denormalized copies of photos and events in the side index
+PHOTO_TABLE = "phototable"
+BROWSE_TABLE = SIDE_INDEX_SCHEMA + ".photo_browse"
+EVENT_BROWSE_TABLE = SIDE_INDEX_SCHEMA + ".event_browse"
+DATE_BROWSE_TABLE = SIDE_INDEX_SCHEMA + ".date_browse"
+SEARCH_TABLE = SIDE_INDEX_SCHEMA + ".photo_search"
+
+# the scope of the saved searches listing besides the photos, see getListingSignature
+SCOPE_SAVED_SEARCHES = "searches"
+
+# built-in collections: the ones of a condition list their pictures in picture order,
+# the ones of a time column the latest first (both read an index of photo_browse)
+COLLECTION_CONDITIONS = {'rated5': "rating = 5", 'flagged': "(flags & 16) == 16"}
+COLLECTION_TIMES = {'imported': "time_created", 'modified': "modified"}
+
+# stacked events an instance keeps the stacks of, the ones paged through last (see getStacksOfEvent)
+EVENT_STACKS_CACHE_SIZE = 8
+
+
+def getDatabaseSignature(database):
+    # shotwell may keep recent writes in the write-ahead log only
+    signature = []
+    for path in [database, database + '-wal']:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            signature += [(stat.st_size, stat.st_mtime)]
+        else:
+            signature += [None]
+    return tuple(signature)
+
+
+def getPhotoSourceId(id):
+    # the name of a photo in shotwell's thumbnail cache
+    return "%s%016x"%("thumb",id)
 
-NON_RAW_EXTENSIONS = [
-        "jpg", "jpeg", "jpe",
-        "tiff", "tif",
-        "png",
-        "gif",
-        "bmp",
-        "ppm", "pgm", "pbm", "pnm",        
-        # THM are JPEG thumbnails produced by some RAW cameras ... want to support the RAW
-        # image but not import their thumbnails
-        "thm",        
-        # less common
-        "tga", "ilbm", "pcx", "ecw", "img", "sid", "cd5", "fits", "pgf",        
-        # vector
-        "cgm", "svg", "odg", "eps", "pdf", "swf", "wmf", "emf", "xps",        
-        # 3D
-        "pns", "jps", "mpo"]
-        
-RAW_EXTENSIONS = [
-        "3fr", "arw", "srf", "sr2", "bay", "crw", "cr2", "cap", "iiq", "eip", "dcs", "dcr", "drf",
-        "k25", "kdc", "dng", "erf", "fff", "mef", "mos", "mrw", "nef", "nrw", "orf", "ptx", "pef",
-        "pxn", "r3d", "raf", "raw", "rw2", "rwl", "rwz", "x3f", "srw"]
-        
-ALL_EXTENSIONS = NON_RAW_EXTENSIONS + RAW_EXTENSIONS
+
+def getLikeSearchCondition(words, table):
+    # without a full text module every word has to be part of one of the columns
+    columns = [column.strip() for column in SEARCH_COLUMNS.split(",")]
+    conditions = []
+    params = []
+    for word in words:
+        conditions += ["(" + " or ".join("%s.%s like ? escape '\\'"%(table, column) for column in columns) + ")"]
+        params += ['%' + escapeLike(word) + '%'] * len(columns)
+    return " and ".join(conditions), params
 
 
 class TagFilter:
@@ -32,25 +76,81 @@ class TagFilter:
             
 class ShotwellAccess:
     
-    def __init__(self, database):
+    def __init__(self, database, cacheDirectory = None):
         self.database = database
-        self.connection = sqlite3.connect(self.database)
+        if cacheDirectory is None:
+            cacheDirectory = os.path.join(tempfile.gettempdir(), 'shotwellviewer')
+            if not os.path.isdir(cacheDirectory):
+                os.makedirs(cacheDirectory)
+        self.cacheDirectory = cacheDirectory
+        # several libraries may share one cache directory; kodi hands paths over as byte strings
+        path = os.path.abspath(database)
+        if isinstance(path, unicode):
+            path = path.encode('utf-8')
+        self.cacheKey = hashlib.md5(path).hexdigest()[:12]
+        # read-only and shared by all instances of this process and thread, see connection.py
+        self.connection = getConnection(self.database)
         self.cursor = self.connection.cursor()
+        self.searchCompiler = SavedSearchCompiler(self.cursor, self.database)
+        self.sideIndex = None
+        self.searchBitmaps = None
+        self.eventStacks = collections.OrderedDict()
+
+    def close(self):
+        if self.sideIndex is not None:
+            self.sideIndex.close()
+            self.sideIndex = None
+        self.searchBitmaps = None
+        self.eventStacks.clear()
+        closeConnection(self.database)
 
     def photoIdToSourceId(self, id):
-        return "%s%016x"%("thumb",id)
+        return getPhotoSourceId(id)
 
+    def getDatabaseSignature(self):
+        return getDatabaseSignature(self.database)
+    
+    def getCachePath(self, name):
+        return os.path.join(self.cacheDirectory, self.cacheKey + '-' + name)
+    
+    def getSideIndex(self):
+        if self.sideIndex is None:
+            self.sideIndex = SideIndex(self.getCachePath('index.db'))
+            self.connection.attach(self.sideIndex.path, SIDE_INDEX_SCHEMA)
+            # any text clauses of saved searches use the full text index, if sqlite has a module for it
+            self.searchCompiler.fullText = self.sideIndex.searchModule
+        return self.sideIndex
+    
+    def getSearchBitmaps(self):
+        # instances may live long (see backend.ShotwellPool), so the bitmaps are checked against the database
+        signature = self.getDatabaseSignature()
+        if self.searchBitmaps is None or self.searchBitmaps.signature != signature:
+            self.ensureSideIndex()
+            self.searchBitmaps = SearchBitmapEngine(self.cursor, self.database, signature, self.getCachePath(BITMAP_CACHE_FILE))
+        return self.searchBitmaps
+    
     def getSavedSearches(self):
         searches = []
         self.cursor.execute('select distinct id, name, operator from savedsearchdbtable order by id asc')
         result = self.cursor.fetchall()
+        engine = self.getSearchBitmaps()
+        signature = self.searchCompiler.getSignature()
         for row in result:
             intermediateSearch = {'id': row[0], 'name': row[1], 'matchtype': row[2], 'picture_representation': None, 'earliest_time': None}
-            pictureInfo = self.getFirstMatchOfSavedSearch(intermediateSearch)
-            if pictureInfo is not None:
-                intermediateSearch['picture_representation'] = pictureInfo
-                intermediateSearch['earliest_time'] = pictureInfo['exposure_time']
+            plan = self.getSavedSearchPlan(intermediateSearch, signature)
+            if plan is None:
+                continue
+            summary = engine.getSummary(plan)
+            if summary['count'] > 0:
+                intermediateSearch['picture_representation'] = summary['first_id']
+                intermediateSearch['earliest_time'] = summary['earliest_time']
+                intermediateSearch['picture_count'] = summary['count']
                 searches += [intermediateSearch]
+        engine.store()
+        
+        pictures = self.getPicturesForIds([search['picture_representation'] for search in searches])
+        for search in searches:
+            search['picture_representation'] = pictures[search['picture_representation']]
         return searches
     
     def getSavedSearchInfo(self, id):
@@ -63,326 +163,393 @@ class ShotwellAccess:
         
         return search
     
-    def getDateSearchConditions(self, savedSearch):
-        self.cursor.execute("""select context, date_one, date_two 
-                               from savedsearchdbtable as T1 join savedsearchdbtable_date as T2 on T1.id = T2.search_id 
-                               where T1.id = ?""", (savedSearch['id'],))
-        rows = self.cursor.fetchall()        
-        conditions = []
-        
-        for sresult in rows:            
-            if sresult[0] == "BETWEEN":
-                conditions += [""" "exposure_time" between '%s' and '%s'"""%(sresult[1], str(int(sresult[2])+86400))] # include the whole second day
-            elif sresult[0] == "EXACT":
-                conditions += [""" "exposure_time" = %s"""%(sresult[1])]
-            elif sresult[0] == "AFTER":
-                conditions += [""" "exposure_time" > %s"""%(sresult[1])]
-            elif sresult[0] == "BEFORE":
-                conditions += [""" "exposure_time" < %s"""%(sresult[1])]
-            elif sresult[0] == "IS_NOT_SET":
-                conditions += [""" "exposure_time" is NULL"""%(sresult[1])]
-            
-        return conditions
+    def ensureSideIndex(self):
+        # tag membership and the browse tables live in the side database
+        signature = self.getDatabaseSignature()
+        sideIndex = self.getSideIndex()
+        sideIndex.syncTags(self.cursor, signature)
+        sideIndex.syncBrowse(self.cursor, signature)
+        sideIndex.refreshSearch()
     
-    def getTextSearchConditions(self, savedSearch):
-        self.cursor.execute("""select search_type, context, text 
-                               from savedsearchdbtable as T1 join savedsearchdbtable_text as T2 on  T1.id = T2.search_id
-                               where T1.id = ?""", (savedSearch['id'],))
-        rows = self.cursor.fetchall()        
-        conditions = []
-        
-        for sresult in rows:
-            comparison = ""
-            if sresult[1] == "CONTAINS":
-                comparison = " LIKE '%" + sresult[2] + "%'"
-            elif sresult[1] == "IS_EXACTLY":
-                comparison = " = '" + sresult[2] + "'"
-            elif sresult[1] == "STARTS_WITH":
-                comparison = " LIKE '%" + sresult[2] + "'"
-            elif sresult[1] == "ENDS_WITH":
-                comparison = " LIKE '" + sresult[2] + "%'"
-            elif sresult[1] == "DOES_NOT_CONTAIN":
-                comparison = " LIKE '%" + sresult[2] + "%' IS FALSE"
-            elif sresult[1] == "IS_NOT_SET":
-                comparison = " IS NULL"
-            
-            tmpconditions = []
-            if sresult[0] == "TAG" or sresult[0] == "ANY_TEXT":
-                tmpconditions += ["id in (" + self.concatList(self.getPhotoIdListFromTagCondition(comparison)) + ")"]
-            elif sresult[0] == "COMMENT" or sresult[0] == "ANY_TEXT":
-                tmpconditions += ["comment " + comparison]
-            elif sresult[0] == "EVENT_NAME" or sresult[0] == "ANY_TEXT":
-                tmpconditions += ["event_id in (select distinct id from eventtable where name %s)"%(comparison)]
-            elif sresult[0] == "FILE_NAME" or sresult[0] == "ANY_TEXT":
-                tmpconditions += ["filename " + comparison]
-            elif sresult[0] == "TITLE" or sresult[0] == "ANY_TEXT":
-                tmpconditions += ["title " + comparison]
-            
-            if sresult[0] == "ANY_TEXT" and len(tmpconditions)>0:
-                condition = tmpconditions[0]
-                for con in tmpconditions[1:]:
-                    condition += " OR " + con
-                tmpconditions = [condition]
-            
-            conditions += tmpconditions
-            
-            
-        return conditions
+    def getListingSignature(self, scopes):
+        # changes whenever a listing of the given scopes (see sideindex) may have changed,
+        # the saved searches listing also depends on the definitions of the searches
+        self.ensureSideIndex()
+        signature = self.getSideIndex().getScopeVersions(scopes)
+        if SCOPE_SAVED_SEARCHES in scopes:
+            self.cursor.execute('select id, name from savedsearchdbtable order by id asc')
+            signature += (self.searchCompiler.getSignature(), tuple(self.cursor.fetchall()))
+        return signature
     
-    def getFlaggedSearchConditions(self, savedSearch):
-        self.cursor.execute("""select search_type, flag_state 
-                               from savedsearchdbtable as T1 join savedsearchdbtable_flagged as T2 on T1.id = T2.search_id 
-                               where T1.id = ?""", (savedSearch['id'],))
-        rows = self.cursor.fetchall()        
-        conditions = []
-        
-        for sresult in rows:            
-            if sresult[1] == "FLAGGED":
-                conditions += ["""(flags & 16) == 16"""]
-            else:
-                conditions += ["""(flags & 16) == 0"""]
-            
-        return conditions
-    
-    def getMediatypeCondition(self, validExtensions):
-        condition = ""
-        if len(validExtensions)>0:
-            ext = validExtensions[0]
-            condition = "lower(substr(filename," + str(-len(ext)) + ")) = '" + str(ext.lower()) + "'"
-            for ext in validExtensions[1:]:
-                condition += " OR lower(substr(filename," + str(-len(ext)) + ")) = '" + str(ext.lower()) + "'"
-        
-        return condition
+    def getSavedSearchPlan(self, savedSearch, signature = None):
+        self.getSideIndex()
+        plan = self.searchCompiler.getPlan(savedSearch['id'], signature)
+        if plan is not None and plan['uses_index']:
+            self.ensureSideIndex()
+        return plan
     
-    def getMediaTypeSearchConditions(self, savedSearch):
-        self.cursor.execute("""select search_type, context, type 
-                               from savedsearchdbtable as T1 join savedsearchdbtable_mediatype as T2 on T1.id = T2.search_id 
-                               where T1.id = ?""", (savedSearch['id'],))
-        rows = self.cursor.fetchall()        
-        conditions = []
-        
-        for row in rows:
-            prefix = ""
-            if row[1]== 'IS_NOT':
-                prefix = 'NOT '
-            
-            if row[2]=='PHOTO_ALL':
-                conditions += [prefix + "(" + self.getMediatypeCondition(ALL_EXTENSIONS) + ")"]
-            elif row[2]=='PHOTO_RAW':
-                conditions += [prefix + "(" + self.getMediatypeCondition(RAW_EXTENSIONS) + ")"]
-            else: # not supported media type
-                conditions += [prefix + "(filename is NULL and filename is not NULL)"]
-        
-        return conditions
+    def getPictureInfoForRow(self, row):
+        return Picture(row)
     
-    def getRatingSearchConditions(self, savedSearch):
-        self.cursor.execute("""select search_type, rating, context
-                               from savedsearchdbtable as T1 join savedsearchdbtable_rating as T2 on T1.id = T2.search_id 
-                               where T1.id = ?""", (savedSearch['id'],))
-        rows = self.cursor.fetchall()        
-        conditions = []
-        
-        for sresult in rows:
-            comparison_operator = "="
-            if sresult[2] == "ONLY":
-                comparison_operator = "="
-            elif sresult[2] == "AND_LOWER":
-                comparison_operator = "<="
-            elif sresult[2] == "AND_HIGHER":
-                comparison_operator = ">="
-                
-            if sresult[1] == -1: # rejected
-                conditions += ["rating " + comparison_operator + " -1"]    
-            elif sresult[1] == 0: # unset
-                conditions += ["rating " + comparison_operator + " 0"]    
-            elif sresult[1] == 1: 
-                conditions += ["rating " + comparison_operator + " 1"]
-            elif sresult[1] == 2:
-                conditions += ["rating " + comparison_operator + " 2"]
-            elif sresult[1] == 3:
-                conditions += ["rating " + comparison_operator + " 3"]
-            elif sresult[1] == 4:
-                conditions += ["rating " + comparison_operator + " 4"]
-            elif sresult[1] == 5:
-                conditions += ["rating " + comparison_operator + " 5"]
-        
-        return conditions
+    def getListedPictureForRow(self, row):
+        return ListedPicture(row)
     
-    def getIdFromSourceId(self, sourceId, prefix):
-        hex = '0';
-        i = len(prefix);
-        while i<len(sourceId) and sourceId[i]!='0':
-            i += 1
-        
-        if i<len(sourceId):
-            hex = sourceId[i:]
-        
-        return int(hex, 16)
-    
-    def concatList(self, list):
-        result = ''
-        if len(list)>0:            
-            result += str(list[0])
-            for item in list[1:]:
-                result += ', ' + str(item)
-            
-        return result
-            
-    def getPhotoIdListFromTagCondition(self, condition):        
-        sql = "select photo_id_list from tagtable where name " + condition        
-        self.cursor.execute(sql)
-        rows = self.cursor.fetchall()
-        result = []
-        for row in rows:
-            tmplist = row[0].split(',')
-            for sourceId in tmplist:
-                if sourceId.startswith('thumb'):
-                    result.append(self.getIdFromSourceId(sourceId,'thumb'))
-        
-        return result
+    def getKeysetCondition(self, after):
+        # continues the (exposure_time, filename) order behind the given picture,
+        # sqlite sorts pictures without exposure time first
+        exposureTime, filename = after
+        if exposureTime is None:
+            return "((exposure_time is NULL and filename > ?) or exposure_time is not NULL)", [filename]
+        return "(exposure_time > ? or (exposure_time = ? and filename > ?))", [exposureTime, exposureTime, filename]
     
-    def getSavedSearchCondition(self, savedSearch):
-        operator = "AND"
-        if savedSearch['matchtype'] == "ALL":
-            operator = "AND"
-        elif savedSearch['matchtype'] == "ANY":
-            operator = "OR"
-        elif savedSearch['matchtype'] == "NONE":
-            operator = "OR"
-        
+    def queryPicturesMatchingCondition(self, condition, params = (), after = None, limit = None, cursor = None, table = PHOTO_TABLE):
         conditions = []
-        conditions += self.getRatingSearchConditions(savedSearch)
-        conditions += self.getMediaTypeSearchConditions(savedSearch)
-        conditions += self.getFlaggedSearchConditions(savedSearch)
-        conditions += self.getTextSearchConditions(savedSearch)
-        conditions += self.getDateSearchConditions(savedSearch)
+        allParams = []
+        if condition != "":
+            conditions += ["(" + condition + ")"]
+            allParams += list(params)
+        if after is not None:
+            keysetCondition, keysetParams = self.getKeysetCondition(after)
+            conditions += [keysetCondition]
+            allParams += keysetParams
         
-        condition = ""
+        sql = "select " + LISTED_PICTURE_COLUMNS + " from " + table
         if len(conditions) > 0:
-            condition += conditions[0]
-            
-            for i in range(1,len(conditions)):
-                condition += " " + operator + " " + conditions[i]
+            sql += " where " + " and ".join(conditions)
+        sql += " order by exposure_time asc, filename asc"
+        if limit is not None:
+            sql += " limit ?"
+            allParams += [limit]
         
-        if savedSearch['matchtype'] == "NONE":
-            condition = "(" + condition + ") IS FALSE"
-            
-        return condition
-    
-    def getPictureInfoForRow(self, row):
-        return {'filename': row[0], 'title': row[1], 'exposure_time': row[2]}
-    
-    def queryPicturesMatchingCondition(self, condition):
-        sql = """select filename, title, exposure_time from phototable where """ + condition + " order by exposure_time asc, filename asc"
-        if condition=="":
-            sql = """select filename, title, exposure_time from phototable order by exposure_time asc, filename asc"""
-        self.cursor.execute(sql)
-        return self.cursor
+        if cursor is None:
+            cursor = self.cursor
+        cursor.execute(sql, allParams)
+        return cursor
         
-    def getFirstPictureMatchForCondition(self, condition):
-        cursor = self.queryPicturesMatchingCondition(condition)
+    def getFirstPictureMatchForCondition(self, condition, params = (), table = PHOTO_TABLE):
+        cursor = self.queryPicturesMatchingCondition(condition, params, limit = 1, table = table)
         row = cursor.fetchone()
         picture = None
         if row is not None:
-            picture = self.getPictureInfoForRow(row)
+            picture = self.getListedPictureForRow(row)
         
         return picture
         
-    def getPicturesForCondition(self, condition):
-        cursor = self.queryPicturesMatchingCondition(condition)
-        rows = cursor.fetchall()
-        pictures = []
-        for row in rows:
-            pictures.append(self.getPictureInfoForRow(row))
+    def iterPicturesForCondition(self, condition, params = (), after = None, limit = None, table = PHOTO_TABLE):
+        # streams from a cursor of its own, so the connection stays usable meanwhile
+        cursor = self.queryPicturesMatchingCondition(condition, params, after, limit, self.connection.cursor(), table)
+        return self.iterPicturesOfCursor(cursor)
+    
+    def iterPicturesOfCursor(self, cursor):
+        try:
+            while True:
+                rows = cursor.fetchmany(FETCH_BATCH_SIZE)
+                if len(rows) == 0:
+                    break
+                for row in rows:
+                    yield self.getListedPictureForRow(row)
+        finally:
+            cursor.close()
         
-        return pictures
+    def getSavedSearchCondition(self, savedSearch):
+        plan = self.getSavedSearchPlan(savedSearch)
+        if plan is None:
+            return None, ()
+        return plan['condition'], plan['params']
     
-    def getFirstMatchOfSavedSearch(self, savedSearch):
-        return self.getFirstPictureMatchForCondition(self.getSavedSearchCondition(savedSearch))
+    def iterPicturesOfSavedSearch(self, savedSearch, after = None, limit = None):
+        condition, params = self.getSavedSearchCondition(savedSearch)
+        if condition is None:
+            return iter([])
+        return self.iterPicturesForCondition(condition, params, after, limit)
     
     def getPicturesOfSavedSearch(self, savedSearch):
-        return self.getPicturesForCondition(self.getSavedSearchCondition(savedSearch))
+        return PictureList(self.iterPicturesOfSavedSearch(savedSearch))
     
-    def getPictureInfoForId(self, id):
-        self.cursor.execute("""select filename, title, exposure_time from phototable where id = ? order by exposure_time asc, filename asc""", (id,))
-        row = self.cursor.fetchone()
-        if row is not None:
-            return self.getPictureInfoForRow(row)
-        else:
-            return None
+    def getEventCondition(self, eventId, flagged = False):
+        condition = 'event_id = ?'
+        if flagged:
+            condition += " AND (flags & 16) == 16"
+        return condition, (eventId,)
+    
+    def iterPicturesOfEvent(self, eventId, flagged = False, after = None, limit = None):
+        self.ensureSideIndex()
+        condition, params = self.getEventCondition(eventId, flagged)
+        return self.iterPicturesForCondition(condition, params, after, limit, BROWSE_TABLE)
+    
+    def getPicturesOfEvent(self, eventId, flagged = False):
+        return PictureList(self.iterPicturesOfEvent(eventId, flagged))
     
-    def getEventRange(self, baseInfo):
-        self.cursor.execute("""select min(exposure_time), max(exposure_time) from phototable where event_id = ?""", (baseInfo['eventid'],))
+    def getStackedPicturesOfEvent(self, eventId):
+        # all pictures of an event with what stacking looks at, in picture order
+        self.ensureSideIndex()
+        self.cursor.execute("""select %s, flags, md5 from %s
+                               where event_id = ? order by exposure_time asc, filename asc"""%(LISTED_PICTURE_COLUMNS, BROWSE_TABLE), (eventId,))
+        return [StackedPicture(row) for row in self.cursor.fetchall()]
+    
+    def getStacksOfEvent(self, eventId, maxGap):
+        # the pictures of an event and their stacks (see stacks.getStacks), which every page of a stacked
+        # event and of its stacks shows; they are kept until the listing scope of the event changes
+        eventId = int(eventId)
+        version = self.getListingSignature((getEventScope(eventId),))
+        key = (eventId, maxGap)
+        entry = self.eventStacks.pop(key, None)
+        if entry is None or entry[0] != version:
+            pictures = self.getStackedPicturesOfEvent(eventId)
+            entry = (version, pictures, getStacks(pictures, maxGap))
+        self.eventStacks[key] = entry
+        while len(self.eventStacks) > EVENT_STACKS_CACHE_SIZE:
+            self.eventStacks.popitem(False)
+        return entry[1:]
+    
+    def getEventPictureCount(self, eventId):
+        self.ensureSideIndex()
+        self.cursor.execute("select photo_count from %s where event_id = ?"%(EVENT_BROWSE_TABLE), (eventId,))
         row = self.cursor.fetchone()
         if row is None:
-            return None, None
-        else:
-            return row[0], row[1]
+            return 0
+        return row[0]
     
-    def getPicturesOfEvent(self, eventId, flagged = False):
-        condition = 'event_id = %s'%(eventId)
-        if flagged:
-            condition += " AND (flags & 16) == 16"
-        return self.getPicturesForCondition(condition)
+    def hasFlaggedPictures(self, eventId):
+        self.ensureSideIndex()
+        self.cursor.execute("select 1 from %s where event_id = ? and flagged_count > 0"%(EVENT_BROWSE_TABLE), (eventId,))
+        return self.cursor.fetchone() is not None
+    
+    def getYearRange(self, year):
+        start = calendar.timegm((int(year), 1, 1, 0, 0, 0))
+        end = calendar.timegm((int(year) + 1, 1, 1, 0, 0, 0))
+        return start, end
     
-    def getFirstPictureForEvent(self, baseInfo):
-        condition = 'event_id = %s'%(baseInfo['eventid'])
-        return getFirstPictureMatchForCondition(condition)
+    def getPicturesForIds(self, ids, condition = "", params = ()):
+        # reads the side index, callers have to ensure it; ids not matching condition are left out
+        pictures = {}
+        ids = list(set(ids))
+        if condition != "":
+            condition = " and (" + condition + ")"
+        for i in range(0, len(ids), MAX_SQL_PARAMETERS):
+            chunk = ids[i:i + MAX_SQL_PARAMETERS]
+            self.cursor.execute("""select %s from %s 
+                                   where id in (%s)%s"""%(LISTED_PICTURE_COLUMNS, BROWSE_TABLE, ", ".join("?" * len(chunk)), condition), chunk + list(params))
+            for row in self.cursor.fetchall():
+                pictures[row[0]] = self.getListedPictureForRow(row)
+        return pictures
     
-    def getEventInfo(self, baseInfo):
-        hasResult = True
-        eventInfo = baseInfo
+    # ranges and covers of all events (or of all events touching one year), kept up to date by the side index
+    def getEventCatalog(self, year = None):
+        self.ensureSideIndex()
+        sql = """select event_id, name, cover_id, start_time, end_time, photo_count from %s 
+                 where start_time is not NULL"""%(EVENT_BROWSE_TABLE)
+        params = ()
+        if year is not None:
+            start, end = self.getYearRange(year)
+            sql += """ and ((start_time >= ? and start_time < ?) or (end_time >= ? and end_time < ?))"""
+            params = (start, end, start, end)
+        self.cursor.execute(sql + " order by event_id asc", params)
         
-        startRange, endRange = self.getEventRange(baseInfo)
-        if startRange is None:
-            return False, baseInfo
+        events = []
+        for row in self.cursor.fetchall():
+            events += [{
+                'eventid': row[0], 
+                'name': row[1], 
+                'cover_id': row[2], 
+                'picture_representation': None, 'startrange': row[3], 'endrange': row[4],
+                'picture_count': row[5]}]
         
-        pictureId = None
-        sourceId = baseInfo['primary_source_id']
-        if sourceId is not None and sourceId.startswith('thumb'):
-            pictureId = self.getIdFromSourceId(sourceId, 'thumb')
-        elif baseInfo['primary_photo_id'] is not None:
-            pictureId = baseInfo['primary_photo_id']
+        covers = self.getPicturesForIds([event['cover_id'] for event in events if event['cover_id'] is not None])
+        for event in events:
+            event['picture_representation'] = covers.get(event['cover_id'], None)
         
-        picture_representation = None
-        if pictureId is not None:
-            picture_representation = self.getPictureInfoForId(pictureId)
+        return [event for event in events if event['picture_representation'] is not None]
+    
+    def getEventYears(self):
+        self.ensureSideIndex()
+        self.cursor.execute("""select strftime('%%Y', start_time, 'unixepoch'), strftime('%%Y', end_time, 'unixepoch') 
+                               from %s where start_time is not NULL"""%(EVENT_BROWSE_TABLE))
+        years = set()
+        for row in self.cursor.fetchall():
+            years.add(str(int(row[0])))
+            years.add(str(int(row[1])))
+        return list(years)
+    
+    def getEvents(self):
+        return self.getEventCatalog()
+    
+    # photos matching every word of text (as a word prefix) in title, comment, file name, tags or event name;
+    # fts5 ranks them by relevance, fts4 and the plain table list them in picture order
+    def iterPicturesOfSearch(self, text, offset = 0, limit = None):
+        self.ensureSideIndex()
+        words = getSearchWords(text)
+        if len(words) == 0:
+            return iter([])
         
-        if picture_representation is None:
-            # try to get earliest picture for this event
-            picture_representation = self.getFirstPictureForEvent(baseInfo)
-            
-        if picture_representation is None:
-            return False, baseInfo
+        module = self.getSideIndex().searchModule
+        columns = ", ".join("photo_browse." + column.strip() for column in LISTED_PICTURE_COLUMNS.split(","))
+        order = "photo_browse.exposure_time asc, photo_browse.filename asc"
+        if module == SEARCH_MODULE_LIKE:
+            condition, params = getLikeSearchCondition(words, "photo_search")
+            sql = """select %s from %s join %s on photo_browse.id = photo_search.id 
+                     where %s"""%(columns, SEARCH_TABLE, BROWSE_TABLE, condition)
+        else:
+            params = [getFullTextQuery(module, words)]
+            sql = """select %s from %s join %s on photo_browse.id = photo_search.rowid 
+                     where photo_search match ?"""%(columns, SEARCH_TABLE, BROWSE_TABLE)
+            if module == "fts5":
+                order = "bm25(photo_search, %s), "%(", ".join(str(weight) for weight in SEARCH_COLUMN_WEIGHTS)) + order
+        sql += " order by " + order
+        if limit is None:
+            limit = -1
+        sql += " limit ? offset ?"
+        params += [limit, offset]
         
-        eventInfo['picture_representation'] = picture_representation
-        eventInfo['startrange'] = startRange
-        eventInfo['endrange'] = endRange
+        cursor = self.connection.cursor()
+        cursor.execute(sql, params)
+        return self.iterPicturesOfCursor(cursor)
+    
+    def getTimelineEntries(self, sql, params, keys):
+        # rows are the date parts named by keys, the photo count and the cover id
+        self.ensureSideIndex()
+        self.cursor.execute(sql, params)
+        entries = []
+        for row in self.cursor.fetchall():
+            entry = dict(zip(keys, row))
+            entry['picture_count'] = row[len(keys)]
+            entry['cover_id'] = row[len(keys) + 1]
+            entries += [entry]
         
-        return hasResult, eventInfo
+        covers = self.getPicturesForIds([entry['cover_id'] for entry in entries])
+        for entry in entries:
+            entry['picture_representation'] = covers.get(entry['cover_id'], None)
+        return [entry for entry in entries if entry['picture_representation'] is not None]
     
-    def getEvents(self):
-        events = []
-        self.cursor.execute('select distinct id, name, primary_photo_id, primary_source_id from eventtable order by id asc')
-        result = self.cursor.fetchall()
-        for row in result:
-            baseInfo = {
-                'eventid': row[0], 
-                'name': row[1], 
-                'primary_photo_id': row[2], 
-                'primary_source_id': row[3], 
-                'picture_representation': None, 'startrange': None, 'endrange': None}
-            hasResult, eventInfo = self.getEventInfo(baseInfo)
-            if hasResult:
-                events += [eventInfo]
-        return events
-
-
-if __name__ == '__main__':
-    v = ShotwellAccess('/home/cello/.local/share/shotwell/data/photo.db')
-    searches = v.getSavedSearches()
-    print searches
-    pictures = v.getPicturesOfSavedSearch(searches[5])
-    print len(pictures)
-    print pictures
+    # the timeline buckets are kept per day by the side index, months and years add them up;
+    # the cover of a bucket is the earliest picture of its first day
+    def getTimelineYears(self):
+        return self.getTimelineEntries("""select year, sum(photo_count), cover_id, min(month * 100 + day) from %s 
+                                          group by year order by year asc"""%(DATE_BROWSE_TABLE), (), ['year'])
+    
+    def getTimelineMonths(self, year):
+        return self.getTimelineEntries("""select year, month, sum(photo_count), cover_id, min(day) from %s where year = ? 
+                                          group by month order by month asc"""%(DATE_BROWSE_TABLE), (year,), ['year', 'month'])
+    
+    def getTimelineDays(self, year, month):
+        return self.getTimelineEntries("""select year, month, day, photo_count, cover_id from %s where year = ? and month = ? 
+                                          order by day asc"""%(DATE_BROWSE_TABLE), (year, month), ['year', 'month', 'day'])
+    
+    def iterPicturesOfDay(self, year, month, day, after = None, limit = None):
+        self.ensureSideIndex()
+        return self.iterPicturesForCondition("year = ? and month = ? and day = ?", (year, month, day), after, limit, BROWSE_TABLE)
+    
+    def getCollectionSummary(self, name):
+        # picture count and cover (the first picture listed) of a built-in collection,
+        # collections by time also tell the time of their cover
+        self.ensureSideIndex()
+        if name in COLLECTION_CONDITIONS:
+            condition = COLLECTION_CONDITIONS[name]
+            self.cursor.execute("select count(*) from %s where %s"%(BROWSE_TABLE, condition))
+            count = self.cursor.fetchone()[0]
+            return {'picture_count': count, 'picture_representation': self.getFirstPictureMatchForCondition(condition, table = BROWSE_TABLE)}
+        column = COLLECTION_TIMES[name]
+        self.cursor.execute("select count(*) from %s where %s is not NULL"%(BROWSE_TABLE, column))
+        count = self.cursor.fetchone()[0]
+        summary = {'picture_count': count, 'picture_representation': None, 'latest_time': None}
+        for time, picture in self.getLatestPictures(name, 0, 1):
+            summary['picture_representation'] = picture
+            summary['latest_time'] = time
+        return summary
+    
+    def iterPicturesOfCollection(self, name, after = None, limit = None):
+        self.ensureSideIndex()
+        return self.iterPicturesForCondition(COLLECTION_CONDITIONS[name], (), after, limit, BROWSE_TABLE)
+    
+    def getLatestPictures(self, name, offset, limit = None):
+        # (time, picture) of the pictures of a collection by time, the latest first; pages go by
+        # offset, a page deep into the collection walks the index up to it but sorts nothing
+        self.ensureSideIndex()
+        column = COLLECTION_TIMES[name]
+        sql = """select %s, %s from %s where %s is not NULL
+                 order by %s desc, id desc"""%(column, LISTED_PICTURE_COLUMNS, BROWSE_TABLE, column, column)
+        params = []
+        if limit is not None or offset > 0:
+            sql += " limit ? offset ?"
+            params = [-1 if limit is None else limit, offset]
+        self.cursor.execute(sql, params)
+        return [(row[0], self.getListedPictureForRow(row[1:])) for row in self.cursor.fetchall()]
+    
+    # random slideshows pick ids between the smallest and the largest one of the library,
+    # both are ends of the primary key, and look the picked ones up (see viewer.createRandomPage)
+    def getIdRange(self):
+        self.ensureSideIndex()
+        self.cursor.execute("select min(id), max(id) from %s"%(BROWSE_TABLE))
+        row = self.cursor.fetchone()
+        if row is None or row[0] is None:
+            return None
+        return row[0], row[1]
+    
+    def getRandomCondition(self, flagged = False, minRating = None, year = None):
+        self.ensureSideIndex()
+        conditions = []
+        params = []
+        if flagged:
+            conditions += ["(flags & 16) == 16"]
+        if minRating is not None:
+            conditions += ["rating >= ?"]
+            params += [minRating]
+        if year is not None:
+            conditions += ["year = ?"]
+            params += [year]
+        return " and ".join(conditions), params
+    
+    def getFirstPicturesOfTags(self, tagIds):
+        pictures = {}
+        tagIds = list(tagIds)
+        for i in range(0, len(tagIds), MAX_SQL_PARAMETERS):
+            chunk = tagIds[i:i + MAX_SQL_PARAMETERS]
+            self.cursor.execute("""select T.tag_id, P.id, P.filename, P.title, min(P.exposure_time) 
+                                   from %s as T join %s as P on P.id = T.photo_id
+                                   where T.tag_id in (%s) group by T.tag_id"""%(TAG_MEMBERSHIP_TABLE, BROWSE_TABLE, ", ".join("?" * len(chunk))), chunk)
+            for row in self.cursor.fetchall():
+                pictures[row[0]] = self.getPictureInfoForRow(row[1:])
+        return pictures
+    
+    def getTagInfoForRow(self, row):
+        return {'id': row[0], 'path': row[1], 'name': getTagDisplayName(row[1]), 'picture_count': row[2], 'picture_representation': None}
+    
+    def getTags(self, parent = ""):
+        self.ensureSideIndex()
+        # tags whose parent is gone are shown at the top level
+        self.cursor.execute("""select tag_id, name, photo_count from sideindex.tag_state 
+                               where (parent = ? or (? = '' and parent not in (select name from sideindex.tag_state))) 
+                                     and photo_count > 0 order by name asc""", (parent, parent))
+        tags = [self.getTagInfoForRow(row) for row in self.cursor.fetchall()]
+        covers = self.getFirstPicturesOfTags([tag['id'] for tag in tags])
+        for tag in tags:
+            tag['picture_representation'] = covers.get(tag['id'], None)
+        return [tag for tag in tags if tag['picture_representation'] is not None]
+    
+    def getTagInfo(self, tagId):
+        self.ensureSideIndex()
+        self.cursor.execute("select tag_id, name, photo_count from sideindex.tag_state where tag_id = ?", (tagId,))
+        row = self.cursor.fetchone()
+        if row is None:
+            return None
+        return self.getTagInfoForRow(row)
+    
+    def getTagInfoForPath(self, path):
+        # tags of several libraries are the same tag if they have the same path
+        self.ensureSideIndex()
+        self.cursor.execute("select tag_id, name, photo_count from sideindex.tag_state where name = ?", (path,))
+        row = self.cursor.fetchone()
+        if row is None:
+            return None
+        return self.getTagInfoForRow(row)
+    
+    def getTagCondition(self, tagId):
+        self.ensureSideIndex()
+        return "id in (select photo_id from %s where tag_id = ?)"%(TAG_MEMBERSHIP_TABLE), (tagId,)
+    
+    def iterPicturesOfTag(self, tagId, after = None, limit = None):
+        condition, params = self.getTagCondition(tagId)
+        return self.iterPicturesForCondition(condition, params, after, limit, BROWSE_TABLE)
     
+    def getPicturesOfTag(self, tagId):
+        return PictureList(self.iterPicturesOfTag(tagId))
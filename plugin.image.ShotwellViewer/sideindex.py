@@ -0,0 +1,517 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import binascii
+
+from mediatypes import getMediaClass
+
+# the side index is a database of our own, attached to shotwell connections under this name
+SIDE_INDEX_SCHEMA = "sideindex"
+
+# the tables of a side index of an older version are dropped and synced again
+SIDE_INDEX_VERSION = "8"
+
+SIDE_INDEX_TABLES = [
+        """create table if not exists index_state (key text primary key, value text)""",
+        # one row per shotwell tag, parent is the path of the enclosing tag ("" for top level tags)
+        """create table if not exists tag_state (tag_id integer primary key, name text not null,
+                                                  parent text not null, signature text not null, photo_count integer not null)""",
+        """create index if not exists tag_state_parent on tag_state (parent, name)""",
+        # the inverted index, clustered by tag so the photos of a tag are one sorted range
+        """create table if not exists tag_photo (tag_id integer not null, photo_id integer not null,
+                                                  primary key (tag_id, photo_id)) without rowid""",
+        """create index if not exists tag_photo_photo on tag_photo (photo_id)""",
+        # photo_media was replaced by photo_browse
+        """drop table if exists photo_media""",
+        # the photo columns the listings show (and md5, which stacks copies of a picture), with shotwell's
+        # column names so conditions work on both tables, plus when shotwell last saw an edited photo change (see BROWSE_MODIFIED), the date
+        # parts and the media class (see mediatypes)
+        """create table if not exists photo_browse (id integer primary key, filename text not null, title text,
+                                                     exposure_time integer, event_id integer, rating integer, flags integer,
+                                                     comment text, md5 text, width integer, height integer, orientation integer,
+                                                     filesize integer, time_created integer, modified integer,
+                                                     year integer, month integer, day integer, media_class integer not null)""",
+        # covering indexes for listings in (exposure_time, filename) order, of everything and of one event
+        """create index if not exists photo_browse_order on photo_browse (exposure_time, filename, title)""",
+        """create index if not exists photo_browse_event on photo_browse (event_id, exposure_time, filename, title, flags)""",
+        """create index if not exists photo_browse_date on photo_browse (year, month, day, exposure_time)""",
+        """create index if not exists photo_browse_media on photo_browse (media_class)""",
+        # the built-in collections (see ShotwellAccess.getCollectionSummary) read no more than a page of these
+        """create index if not exists photo_browse_rating on photo_browse (rating, exposure_time, filename, title)""",
+        """create index if not exists photo_browse_flagged on photo_browse (exposure_time, filename, title)
+                                                            where (flags & 16) == 16""",
+        """create index if not exists photo_browse_created on photo_browse (time_created)""",
+        """create index if not exists photo_browse_modified on photo_browse (modified) where modified is not NULL""",
+        # digest of the phototable rows of every block of ids and the cheaper checksum looked at first, see syncBrowse
+        """create table if not exists browse_block (block integer primary key, digest text not null, checksum text not null)""",
+        # events with photos, their ranges and the cover picture (primary picture or the earliest one)
+        """create table if not exists event_browse (event_id integer primary key, name text, cover_id integer,
+                                                     photo_count integer not null, flagged_count integer not null,
+                                                     start_time integer, end_time integer)""",
+        """create index if not exists event_browse_start on event_browse (start_time, end_time)""",
+        # photo count and cover (the earliest picture) of every day with photos
+        """create table if not exists date_browse (year integer not null, month integer not null, day integer not null,
+                                                    photo_count integer not null, cover_id integer not null,
+                                                    primary key (year, month, day)) without rowid""",
+        # photos whose row in photo_search has to be written again, see refreshSearch
+        """create table if not exists search_dirty (photo_id integer primary key)""",
+        # the last change (a number counting up) of everything cached listings show, see touchScopes
+        """create table if not exists listing_scope (scope text primary key, version integer not null)"""]
+
+# the full text index of titles, comments, file names, tags and event names, with the photo id as rowid;
+# the first module sqlite knows is used, without any a plain table is searched with like
+SEARCH_COLUMNS = "title, comment, filename, tags, event"
+SEARCH_MODULES = [("fts5", "tokenize = 'unicode61'"), ("fts4", "tokenize=unicode61")]
+SEARCH_MODULE_LIKE = "like"
+
+# bm25 weights of the columns, in the order of SEARCH_COLUMNS
+SEARCH_COLUMN_WEIGHTS = (10.0, 2.0, 1.0, 5.0, 3.0)
+
+# scopes of listings: any photo column (saved searches), the event catalog, the timeline and the tags,
+# single events, days and tags have scopes of their own (see getEventScope, getDateScope, getTagScopes)
+SCOPE_PHOTOS = "photos"
+SCOPE_EVENTS = "events"
+SCOPE_DATES = "dates"
+SCOPE_TAGS = "tags"
+
+# the photo_browse columns picture listings show or are arranged by, and all of them
+LISTED_COLUMNS = "filename, title, exposure_time, event_id, flags, year, month, day, rating, comment, md5, width, height, orientation, filesize"
+BROWSE_COLUMNS = LISTED_COLUMNS + ", time_created, modified, media_class"
+
+# photos are synced in blocks of 2^BROWSE_BLOCK_BITS consecutive ids
+BROWSE_BLOCK_BITS = 10
+
+# a row of phototable as text, quote() tells NULL and '' apart
+BROWSE_ROW_TEXT = """quote(id) || ',' || quote(filename) || ',' || quote(title) || ',' || quote(exposure_time) || ',' || 
+                     quote(event_id) || ',' || quote(rating) || ',' || quote(flags) || ',' || quote(comment) || ',' || 
+                     quote(md5) || ',' || quote(width) || ',' || quote(height) || ',' || quote(orientation) || ',' || 
+                     quote(filesize) || ',' || quote(time_created) || ',' || quote(timestamp) || ',' || quote(time_reimported) || ',' || 
+                     quote(transformations) || ',' || quote(editable_id)"""
+
+# the checksum of a block adds up the numbers of BROWSE_ROW_TEXT weighted by id and joins its texts;
+# without quote() it is about three times cheaper than the digest. it misses no more than changes
+# of several rows that cancel out in a sum and numbers going from NULL to 0
+BROWSE_CHECK_NUMBERS = """exposure_time, event_id, rating, flags, width, height, orientation, filesize, time_created, timestamp,
+                          time_reimported, editable_id"""
+BROWSE_CHECK_TEXTS = "filename, title, comment, md5, transformations"
+
+# shotwell keeps no time of edits; photos with edits of their own (or an external editor's
+# copy, or reimported after a change of the file) count as modified when the file last did
+BROWSE_MODIFIED = """case when ifnull(transformations, '') != '' or editable_id != -1 or time_reimported is not NULL
+                     then max(ifnull(timestamp, 0), ifnull(time_reimported, 0)) end"""
+EVENT_ROW_TEXT = """quote(id) || ',' || quote(name) || ',' || quote(primary_photo_id) || ',' || quote(primary_source_id)"""
+
+def getTagParent(name):
+    # shotwell stores hierarchical tags as /parent/child
+    if not name.startswith('/') or name.rfind('/') == 0:
+        return ""
+    return name[:name.rfind('/')]
+
+
+def getTagDisplayName(name):
+    if name.startswith('/'):
+        return name[name.rfind('/') + 1:]
+    return name
+
+
+def parseSourceId(sourceId):
+    # photos are "thumb" followed by the hex id, videos ("video-...") are not supported
+    if sourceId is None or not sourceId.startswith('thumb') or len(sourceId) <= 5:
+        return None
+    return int(sourceId[5:], 16)
+
+
+def parsePhotoIdList(photoIdList):
+    ids = []
+    if photoIdList is None:
+        return ids
+    for sourceId in photoIdList.split(','):
+        id = parseSourceId(sourceId)
+        if id is not None:
+            ids.append(id)
+    return ids
+
+
+def getSearchWords(text):
+    return re.findall(r'\w+', text, re.UNICODE)
+
+
+def getFullTextQuery(module, words, phrase = False):
+    # every word has to start a word of the photo, with phrase they have to follow each other in one column;
+    # the words are quoted, so none of them is taken for an operator
+    if module == "fts5":
+        if phrase:
+            return '"' + " ".join(words) + '"*'
+        return " ".join('"' + word + '"*' for word in words)
+    if phrase:
+        return '"' + " ".join(words) + '*"'
+    return " ".join('"' + word + '*"' for word in words)
+
+
+def getSearchText(title, comment, filename, tagNames, eventName):
+    # hierarchical tags are searchable by every level
+    tags = " ".join(name.replace('/', ' ').strip() for name in tagNames)
+    return (title, comment, os.path.basename(filename), tags, eventName)
+
+
+def getEventScope(eventId):
+    return "event:%d"%(eventId)
+
+
+def getDateScope(year, month, day):
+    return "date:%d-%d-%d"%(year, month, day)
+
+
+def getTagScopes(path):
+    # tags of several libraries are combined by their path; a tag page lists its children
+    # as well, so changes of a tag are changes of all tags enclosing it
+    scopes = []
+    while path != "":
+        scopes += ["tag:" + path]
+        path = getTagParent(path)
+    return scopes
+
+
+def getDigest(text):
+    return hashlib.md5((text or "").encode('utf-8')).hexdigest()
+
+
+def getBrowseRow(row):
+    # id, filename, title, exposure_time, event_id, rating, flags, comment, md5, width, height, orientation, filesize,
+    # time_created of phototable and BROWSE_MODIFIED
+    year = month = day = None
+    if row[3] is not None:
+        date = time.gmtime(row[3])
+        year, month, day = date.tm_year, date.tm_mon, date.tm_mday
+    return tuple(row) + (year, month, day, getMediaClass(row[1]))
+
+
+class SideIndex:
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout = 30)
+        self.cursor = self.connection.cursor()
+        self.cursor.execute(SIDE_INDEX_TABLES[0])
+        if self.getState('version') != SIDE_INDEX_VERSION:
+            self.dropTables()
+            self.setState('version', SIDE_INDEX_VERSION)
+        for statement in SIDE_INDEX_TABLES:
+            self.cursor.execute(statement)
+        self.searchModule = self.createSearchTable()
+        # versions of scopes only compare within one generation of the tables
+        if self.getState('generation') is None:
+            self.setState('generation', binascii.hexlify(os.urandom(8)))
+        self.connection.commit()
+
+    def dropTables(self):
+        # virtual tables first, they drop their shadow tables themselves
+        self.cursor.execute("""select name from sqlite_master where type = 'table' and name != 'index_state' 
+                               and name not like 'sqlite_%' order by sql not like 'create virtual%'""")
+        for row in self.cursor.fetchall():
+            self.cursor.execute('drop table if exists "%s"'%(row[0]))
+        self.cursor.execute("delete from index_state")
+
+    def createSearchTable(self):
+        for module, options in SEARCH_MODULES:
+            try:
+                self.cursor.execute("create virtual table if not exists photo_search using %s(%s, %s)"%(module, SEARCH_COLUMNS, options))
+                break
+            except sqlite3.OperationalError:
+                continue
+        else:
+            self.cursor.execute("create table if not exists photo_search (id integer primary key, %s)"%(SEARCH_COLUMNS))
+
+        self.cursor.execute("select sql from sqlite_master where name = 'photo_search'")
+        sql = self.cursor.fetchone()[0].lower()
+        for module, options in SEARCH_MODULES:
+            if "using " + module in sql:
+                return module
+        return SEARCH_MODULE_LIKE
+
+    def close(self):
+        self.connection.close()
+
+    def getState(self, key):
+        self.cursor.execute("select value from index_state where key = ?", (key,))
+        row = self.cursor.fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def setState(self, key, value):
+        self.cursor.execute("insert or replace into index_state (key, value) values (?, ?)", (key, value))
+
+    def touchScopes(self, scopes):
+        # listings depending on one of scopes may have changed (see ShotwellAccess.getListingSignature)
+        if len(scopes) == 0:
+            return
+        change = int(self.getState('change') or 0) + 1
+        self.setState('change', str(change))
+        self.cursor.executemany("insert or replace into listing_scope (scope, version) values (?, ?)", [(scope, change) for scope in set(scopes)])
+
+    def getScopeVersions(self, scopes):
+        versions = {}
+        for i in range(0, len(scopes), 500):
+            chunk = scopes[i:i + 500]
+            self.cursor.execute("select scope, version from listing_scope where scope in (%s)"%(", ".join("?" * len(chunk))), chunk)
+            versions.update(self.cursor.fetchall())
+        return (self.getState('generation'),) + tuple(versions.get(scope, 0) for scope in scopes)
+
+    def getBrowseRows(self, first, end):
+        self.cursor.execute("select id, %s from photo_browse where id >= ? and id < ?"%(BROWSE_COLUMNS), (first, end))
+        return dict((row[0], row[1:]) for row in self.cursor.fetchall())
+
+    def getChangedScopes(self, before, after):
+        # before, after: photo_browse rows of the synced blocks by id
+        changed = [id for id in set(before) | set(after) if before.get(id, None) != after.get(id, None)]
+        if len(changed) == 0:
+            return []
+        scopes = [SCOPE_PHOTOS]
+        # import and edit times only show in collections, media classes nowhere
+        listedCount = len(LISTED_COLUMNS.split(","))
+        listed = [id for id in changed if before.get(id, (None,))[:listedCount] != after.get(id, (None,))[:listedCount]]
+        # the catalogs of events and days are compared by rebuildEvents and rebuildDates, the covers
+        # of tags are their first pictures, so the tags catalog changes with the order of pictures
+        for id in listed:
+            rows = (before.get(id, None), after.get(id, None))
+            if None in rows or rows[0][:3:2] != rows[1][:3:2]:
+                scopes += [SCOPE_TAGS]
+            for row in rows:
+                if row is None:
+                    continue
+                filename, title, exposureTime, eventId, flags, year, month, day = row[:8]
+                if eventId is not None:
+                    scopes += [getEventScope(eventId)]
+                if year is not None:
+                    scopes += [getDateScope(year, month, day)]
+        for i in range(0, len(listed), 500):
+            chunk = listed[i:i + 500]
+            self.cursor.execute("""select distinct tag_state.name from tag_photo join tag_state on tag_state.tag_id = tag_photo.tag_id
+                                   where tag_photo.photo_id in (%s)"""%(", ".join("?" * len(chunk))), chunk)
+            for row in self.cursor.fetchall():
+                scopes += getTagScopes(row[0])
+        return scopes
+
+    def syncTags(self, shotwellCursor, databaseSignature):
+        # only tags whose row changed since the last sync are split again
+        if self.getState('tags') == repr(databaseSignature):
+            return
+
+        self.cursor.execute("select tag_id, name, signature from tag_state")
+        known = {}
+        for row in self.cursor.fetchall():
+            known[row[0]] = (row[1], row[2])
+
+        shotwellCursor.execute("select id, name, photo_id_list from tagtable")
+        current = set()
+        scopes = []
+        for row in shotwellCursor:
+            tagId, name, photoIdList = row
+            current.add(tagId)
+            signature = getDigest(photoIdList)
+            previous = known.get(tagId, None)
+            if previous is not None and previous[1] == signature:
+                if previous[0] != name:
+                    self.cursor.execute("update tag_state set name = ?, parent = ? where tag_id = ?", (name, getTagParent(name), tagId))
+                    self.markTagDirty(tagId)
+                    scopes += [SCOPE_PHOTOS, SCOPE_TAGS] + getTagScopes(previous[0]) + getTagScopes(name)
+                continue
+
+            scopes += [SCOPE_PHOTOS, SCOPE_TAGS] + getTagScopes(name)
+            ids = parsePhotoIdList(photoIdList)
+            self.markTagDirty(tagId)
+            self.cursor.execute("delete from tag_photo where tag_id = ?", (tagId,))
+            self.cursor.executemany("insert or ignore into tag_photo (tag_id, photo_id) values (?, ?)", [(tagId, id) for id in ids])
+            self.markTagDirty(tagId)
+            self.cursor.execute("insert or replace into tag_state (tag_id, name, parent, signature, photo_count) values (?, ?, ?, ?, ?)",
+                                (tagId, name, getTagParent(name), signature, len(set(ids))))
+
+        for tagId in known:
+            if tagId not in current:
+                self.markTagDirty(tagId)
+                self.cursor.execute("delete from tag_photo where tag_id = ?", (tagId,))
+                self.cursor.execute("delete from tag_state where tag_id = ?", (tagId,))
+                scopes += [SCOPE_PHOTOS, SCOPE_TAGS] + getTagScopes(known[tagId][0])
+
+        self.touchScopes(scopes)
+        self.setState('tags', repr(databaseSignature))
+        self.connection.commit()
+
+    def markTagDirty(self, tagId):
+        self.cursor.execute("insert or ignore into search_dirty (photo_id) select photo_id from tag_photo where tag_id = ?", (tagId,))
+
+    def markBlockDirty(self, first, end):
+        self.cursor.execute("insert or ignore into search_dirty (photo_id) select id from photo_browse where id >= ? and id < ?", (first, end))
+
+    def getBlockChecksums(self, shotwellCursor):
+        numbers = ", ".join("total(%s * id)"%(column.strip()) for column in BROWSE_CHECK_NUMBERS.split(","))
+        # texts start with '=', which tells NULL and '' apart
+        texts = " || '|' || ".join("ifnull('=' || %s, '')"%(column.strip()) for column in BROWSE_CHECK_TEXTS.split(","))
+        shotwellCursor.execute("""select id >> %d as block, count(*), total(id), %s, group_concat(%s, '|') from
+                                  (select id, %s, %s from phototable order by id)
+                                  group by block"""%(BROWSE_BLOCK_BITS, numbers, texts, BROWSE_CHECK_NUMBERS, BROWSE_CHECK_TEXTS))
+        checksums = {}
+        for row in shotwellCursor.fetchall():
+            checksums[row[0]] = getDigest(repr(row[1:-1]) + "|" + (row[-1] or ""))
+        return checksums
+
+    def getBlockDigests(self, shotwellCursor, blocks = None):
+        # of all blocks, or of the given ones only
+        sql = """select block, group_concat(row, '|') from
+                 (select id >> %d as block, %s as row from phototable %%s order by id)
+                 group by block"""%(BROWSE_BLOCK_BITS, BROWSE_ROW_TEXT)
+        rows = []
+        if blocks is None:
+            shotwellCursor.execute(sql%(""))
+            rows = shotwellCursor.fetchall()
+        else:
+            for block in blocks:
+                shotwellCursor.execute(sql%("where id >= ? and id < ?"), (block << BROWSE_BLOCK_BITS, (block + 1) << BROWSE_BLOCK_BITS))
+                rows += shotwellCursor.fetchall()
+        digests = {}
+        for row in rows:
+            digests[row[0]] = getDigest(row[1])
+        return digests
+
+    def syncBrowse(self, shotwellCursor, databaseSignature):
+        # shotwell changes ratings, flags, titles and events in place without touching
+        # time_created or timestamp, so instead of high-water marks the rows are compared
+        # block by block; new photos only change the last blocks. the checksums of all
+        # blocks tell which ones to compare by their digests
+        if self.getState('browse') == repr(databaseSignature):
+            return
+
+        self.cursor.execute("select block, digest, checksum from browse_block")
+        known = {}
+        knownChecksums = {}
+        for block, digest, checksum in self.cursor.fetchall():
+            known[block] = digest
+            knownChecksums[block] = checksum
+        checksums = self.getBlockChecksums(shotwellCursor)
+        suspects = [block for block in checksums if knownChecksums.get(block, None) != checksums[block]]
+        if len(suspects) == len(checksums):
+            current = self.getBlockDigests(shotwellCursor)
+        else:
+            current = self.getBlockDigests(shotwellCursor, suspects)
+        changed = [block for block in suspects if known.get(block, None) != current[block]]
+        removed = [block for block in known if block not in checksums]
+        # blocks whose checksum changed but not their digest keep their rows
+        self.cursor.executemany("update browse_block set checksum = ? where block = ?",
+                                [(checksums[block], block) for block in suspects if block not in changed and block in known])
+
+        # rows are compared for the scopes they touch, a new index has no listings to invalidate
+        tracking = len(known) > 0
+        before = {}
+        after = {}
+        for block in changed + removed:
+            first, end = block << BROWSE_BLOCK_BITS, (block + 1) << BROWSE_BLOCK_BITS
+            if tracking:
+                before.update(self.getBrowseRows(first, end))
+            self.markBlockDirty(first, end)
+            self.cursor.execute("delete from photo_browse where id >= ? and id < ?", (first, end))
+            self.cursor.execute("delete from browse_block where block = ?", (block,))
+        for block in changed:
+            first, end = block << BROWSE_BLOCK_BITS, (block + 1) << BROWSE_BLOCK_BITS
+            shotwellCursor.execute("""select id, filename, title, exposure_time, event_id, rating, flags, comment, md5, width, height,
+                                             orientation, filesize, time_created, %s
+                                      from phototable where id >= ? and id < ?"""%(BROWSE_MODIFIED), (first, end))
+            self.cursor.executemany("""insert into photo_browse (id, filename, title, exposure_time, event_id, rating, flags,
+                                                                 comment, md5, width, height, orientation, filesize, time_created,
+                                                                 modified, year, month, day, media_class) 
+                                       values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", [getBrowseRow(row) for row in shotwellCursor.fetchall()])
+            self.cursor.execute("insert into browse_block (block, digest, checksum) values (?, ?, ?)", (block, current[block], checksums[block]))
+            self.markBlockDirty(first, end)
+            if tracking:
+                after.update(self.getBrowseRows(first, end))
+        self.touchScopes(self.getChangedScopes(before, after))
+
+        shotwellCursor.execute("select group_concat(row, '|') from (select %s as row from eventtable order by id)"%(EVENT_ROW_TEXT))
+        eventDigest = getDigest(shotwellCursor.fetchone()[0])
+        if len(changed) > 0 or len(removed) > 0 or self.getState('events') != eventDigest:
+            self.rebuildEvents(shotwellCursor)
+            self.setState('events', eventDigest)
+        if len(changed) > 0 or len(removed) > 0 or self.getState('dates') is None:
+            self.rebuildDates()
+            self.setState('dates', 'built')
+
+        self.setState('browse', repr(databaseSignature))
+        self.connection.commit()
+
+    def getEventRows(self):
+        self.cursor.execute("select event_id, name, cover_id, photo_count, flagged_count, start_time, end_time from event_browse")
+        return dict((row[0], row[1:]) for row in self.cursor.fetchall())
+
+    def rebuildEvents(self, shotwellCursor):
+        previousEvents = self.getEventRows()
+        self.cursor.execute("delete from event_browse")
+        shotwellCursor.execute("select id, name, primary_photo_id, primary_source_id from eventtable")
+        events = shotwellCursor.fetchall()
+        self.cursor.executemany("""insert into event_browse (event_id, name, cover_id, photo_count, flagged_count) 
+                                   values (?, ?, ?, 0, 0)""", [(row[0], row[1], parseSourceId(row[3]) or row[2]) for row in events])
+
+        self.cursor.execute("""select event_id, count(*), total((flags & 16) == 16), min(exposure_time), max(exposure_time)
+                               from photo_browse where event_id is not null group by event_id""")
+        self.cursor.executemany("""update event_browse set photo_count = ?, flagged_count = ?, start_time = ?, end_time = ?
+                                   where event_id = ?""", [(row[1], int(row[2]), row[3], row[4], row[0]) for row in self.cursor.fetchall()])
+        # events without a (known) primary picture show their earliest one
+        self.cursor.execute("""update event_browse set cover_id = 
+                                      (select id from photo_browse where event_id = event_browse.event_id and exposure_time is not null
+                                       order by exposure_time asc, filename asc limit 1)
+                               where cover_id is null or not exists (select 1 from photo_browse where id = event_browse.cover_id)""")
+        self.cursor.execute("delete from event_browse where photo_count = 0")
+
+        # the photos of renamed events are indexed again
+        # (text clauses of saved searches look at event names as well)
+        events = self.getEventRows()
+        scopes = []
+        for eventId in events:
+            if eventId in previousEvents and previousEvents[eventId][0] != events[eventId][0]:
+                self.cursor.execute("insert or ignore into search_dirty (photo_id) select id from photo_browse where event_id = ?", (eventId,))
+                scopes += [SCOPE_PHOTOS]
+        changed = [eventId for eventId in set(events) | set(previousEvents) if events.get(eventId, None) != previousEvents.get(eventId, None)]
+        if len(changed) > 0:
+            scopes += [SCOPE_EVENTS] + [getEventScope(eventId) for eventId in changed]
+        self.touchScopes(scopes)
+
+    def rebuildDates(self):
+        # relies on sqlite returning the bare id of the row holding min()
+        self.cursor.execute("""select year, month, day, count(*), id, min(exposure_time) from photo_browse
+                               where year is not null group by year, month, day""")
+        days = [row[:5] for row in self.cursor.fetchall()]
+        self.cursor.execute("select year, month, day, photo_count, cover_id from date_browse")
+        previousDays = set(self.cursor.fetchall())
+        self.cursor.execute("delete from date_browse")
+        self.cursor.executemany("insert into date_browse (year, month, day, photo_count, cover_id) values (?, ?, ?, ?, ?)", days)
+        changed = set(row[:3] for row in previousDays.symmetric_difference(days))
+        if len(changed) > 0:
+            self.touchScopes([SCOPE_DATES] + [getDateScope(*day) for day in changed])
+
+    def refreshSearch(self):
+        # writes the photo_search rows of the photos syncTags and syncBrowse marked
+        self.cursor.execute("select photo_id from search_dirty")
+        ids = [row[0] for row in self.cursor.fetchall()]
+        if len(ids) == 0:
+            return
+
+        idColumn = "rowid"
+        if self.searchModule == SEARCH_MODULE_LIKE:
+            idColumn = "id"
+        self.cursor.execute("delete from photo_search where %s in (select photo_id from search_dirty)"%(idColumn))
+
+        tagNames = {}
+        self.cursor.execute("""select tag_photo.photo_id, tag_state.name from search_dirty 
+                               join tag_photo on tag_photo.photo_id = search_dirty.photo_id 
+                               join tag_state on tag_state.tag_id = tag_photo.tag_id""")
+        for photoId, name in self.cursor.fetchall():
+            tagNames.setdefault(photoId, []).append(name)
+
+        self.cursor.execute("""select photo_browse.id, photo_browse.title, photo_browse.comment, photo_browse.filename, event_browse.name
+                               from search_dirty join photo_browse on photo_browse.id = search_dirty.photo_id
+                               left join event_browse on event_browse.event_id = photo_browse.event_id""")
+        rows = [(row[0],) + getSearchText(row[1], row[2], row[3], tagNames.get(row[0], []), row[4]) for row in self.cursor.fetchall()]
+        self.cursor.executemany("insert into photo_search (%s, %s) values (?, ?, ?, ?, ?, ?)"%(idColumn, SEARCH_COLUMNS), rows)
+        self.cursor.execute("delete from search_dirty")
+        self.connection.commit()
@@ -0,0 +1,116 @@
+import os
+import time
+import json
+import hashlib
+import sqlite3
+
+from shotwell import getDatabaseSignature
+from connection import openReadOnly
+
+# pages copied per backup step, shotwell can write in between
+BACKUP_PAGES_PER_STEP = 1024
+
+
+def quoteName(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+class DatabaseSnapshot:
+    # a local copy of a database on a network share; it is copied again when
+    # size or modification time of the shared file change, but the shared file
+    # is looked at no more often than every checkInterval seconds
+
+    def __init__(self, source, directory):
+        self.source = source
+        path = os.path.abspath(source)
+        if isinstance(path, unicode):
+            path = path.encode('utf-8')
+        key = hashlib.md5(path).hexdigest()[:12]
+        self.path = os.path.join(directory, key + '-snapshot.db')
+        self.statePath = self.path + '.state'
+
+    def readState(self):
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.statePath, 'r') as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def writeState(self, state):
+        try:
+            with open(self.statePath + '.tmp', 'w') as f:
+                json.dump(state, f)
+            os.rename(self.statePath + '.tmp', self.statePath)
+        except (IOError, OSError):
+            pass
+
+    def getPath(self, checkInterval, maxAge):
+        # maxAge (seconds, 0 for none) forces a new copy of a database whose changes don't show in size or time
+        now = time.time()
+        state = self.readState()
+        if state is not None and now - state['checked'] < checkInterval:
+            return self.path
+
+        # compared with the signature of the state file, where tuples became lists
+        signature = json.loads(json.dumps(getDatabaseSignature(self.source)))
+        if state is not None and state['signature'] == signature and (maxAge <= 0 or now - state['copied'] < maxAge):
+            state['checked'] = now
+            self.writeState(state)
+            return self.path
+
+        try:
+            self.copy()
+        except (sqlite3.Error, IOError, OSError):
+            # the share may be gone for a moment, an old copy is better than none
+            if os.path.exists(self.path):
+                return self.path
+            return self.source
+
+        self.writeState({'signature': signature, 'copied': now, 'checked': now})
+        return self.path
+
+    def copy(self):
+        temporary = self.path + '.tmp'
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+        target = sqlite3.connect(temporary, isolation_level = None)
+        try:
+            if hasattr(target, 'backup'):
+                # the backup api starts over by itself if shotwell writes while we copy
+                source = openReadOnly(self.source)
+                try:
+                    source.backup(target, pages = BACKUP_PAGES_PER_STEP)
+                finally:
+                    source.close()
+            else:
+                self.copyTables(target)
+        finally:
+            target.close()
+
+        # connections to the old copy keep reading it, see backend.ShotwellPool
+        try:
+            os.rename(temporary, self.path)
+        except OSError:
+            os.remove(self.path)
+            os.rename(temporary, self.path)
+
+    def copyTables(self, target):
+        # python 2's sqlite3 has no backup api: copy the tables inside one
+        # read transaction, so the copy is consistent all the same
+        target.execute("attach database ? as source", (self.source,))
+        target.execute("begin")
+        rows = target.execute("""select type, name, sql from source.sqlite_master
+                                 where sql is not null and name not like 'sqlite_%'""").fetchall()
+        for type, name, sql in rows:
+            if type == 'table':
+                target.execute(sql)
+                target.execute("insert into main.%s select * from source.%s"%(quoteName(name), quoteName(name)))
+        # indexes are faster to build on filled tables, triggers are of no use to readers
+        for type, name, sql in rows:
+            if type in ('index', 'view'):
+                target.execute(sql)
+        target.execute("commit")
+        target.execute("detach database source")
@@ -0,0 +1,54 @@
+import itertools
+
+from pictures import ListedPicture
+
+# bit of shotwell's flags column marking flagged pictures
+FLAGGED = 16
+
+
+class StackedPicture(ListedPicture):
+    # a row of ShotwellAccess.getStackedPicturesOfEvent, a ListedPicture and what picks the representative of its stack
+    __slots__ = ('flags', 'md5')
+
+    def __init__(self, row):
+        ListedPicture.__init__(self, row[:-2])
+        self.flags, self.md5 = row[-2:]
+
+
+def findBursts(exposureTimes, maxGap):
+    # indexes where a new burst starts, exposureTimes in picture order; kodi's python has no numpy,
+    # so the gaps are one comprehension over the pairs of neighbours. pictures without exposure
+    # time come first in picture order and stay alone
+    pairs = itertools.izip(exposureTimes, itertools.islice(exposureTimes, 1, None))
+    return [0] + [index for index, (previous, current) in enumerate(pairs, 1)
+                  if previous is None or current - previous > maxGap]
+
+
+def getStacks(pictures, maxGap):
+    # pictures in picture order; consecutive pictures taken within maxGap seconds of each other are
+    # a burst, copies of a picture (the same md5) join the stack of the first one. returns the
+    # stacks as lists of indexes into pictures, in the order of their first picture
+    starts = findBursts([picture.exposure_time for picture in pictures], maxGap) + [len(pictures)]
+    stacks = []
+    stackOfCopy = {}
+    for start, end in zip(starts, starts[1:]):
+        stack = []
+        for index in range(start, end):
+            md5 = pictures[index].md5
+            if md5 is not None and md5 in stackOfCopy and stackOfCopy[md5] is not stack:
+                stackOfCopy[md5].append(index)
+                continue
+            stack.append(index)
+            if md5 is not None:
+                stackOfCopy.setdefault(md5, stack)
+        if len(stack) > 0:
+            stacks.append(stack)
+    return stacks
+
+
+def getRepresentative(pictures, stack):
+    # flagged pictures first, then the best rated, then the earliest
+    def rank(index):
+        picture = pictures[index]
+        return ((picture.flags or 0) & FLAGGED == FLAGGED, picture.rating or 0, -index)
+    return pictures[max(stack, key = rank)]
@@ -0,0 +1,68 @@
+import os
+
+# shotwell keeps its thumbnails in thumbs<size>/<source id>.<ext>
+THUMBNAIL_SIZES = [128, 360]
+THUMBNAIL_EXTENSIONS = ["jpg", "png"]
+
+
+def getDefaultThumbnailDirectory(databasePath):
+    # photo.db lives in <shotwell>/data, older versions keep thumbs next to it
+    shotwellDir = os.path.dirname(os.path.dirname(databasePath))
+    legacyDir = os.path.join(shotwellDir, 'thumbs')
+    if os.path.isdir(legacyDir):
+        return legacyDir
+
+    # newer versions: ~/.local/share/shotwell/data/photo.db -> ~/.cache/shotwell/thumbs
+    home = os.path.dirname(os.path.dirname(os.path.dirname(shotwellDir)))
+    return os.path.join(home, '.cache', 'shotwell', 'thumbs')
+
+
+class ThumbnailResolver:
+
+    def __init__(self, directory, sourceIdForPhoto, pathMapper = None):
+        self.directory = directory
+        self.sourceIdForPhoto = sourceIdForPhoto
+        self.pathMapper = pathMapper
+        self.availableSizes = None
+
+    def getAvailableSizes(self):
+        if self.availableSizes is None:
+            self.availableSizes = []
+            if self.directory is not None and self.directory != "":
+                for size in THUMBNAIL_SIZES:
+                    if os.path.isdir(os.path.join(self.directory, 'thumbs%d'%(size))):
+                        self.availableSizes += [size]
+        return self.availableSizes
+
+    def getCandidateSizes(self, size):
+        # the smallest thumbnail covering the requested size first, then the bigger
+        # ones, and only then the smaller ones from the largest downwards
+        sizes = self.getAvailableSizes()
+        larger = [s for s in sizes if s >= size]
+        smaller = [s for s in sizes if s < size]
+        smaller.reverse()
+        return larger + smaller
+
+    def getThumbnailPath(self, photoId, size):
+        sourceId = self.sourceIdForPhoto(photoId)
+        for candidate in self.getCandidateSizes(size):
+            for ext in THUMBNAIL_EXTENSIONS:
+                path = os.path.join(self.directory, 'thumbs%d'%(candidate), sourceId + '.' + ext)
+                if os.path.exists(path):
+                    return path
+        return None
+
+    def mapPath(self, path):
+        if self.pathMapper is not None:
+            return self.pathMapper(path)
+        return path
+
+    def getIcon(self, picture, size):
+        path = None
+        if picture.id is not None:
+            path = self.getThumbnailPath(picture.id, size)
+
+        if path is None:
+            path = picture.filename
+
+        return self.mapPath(path)
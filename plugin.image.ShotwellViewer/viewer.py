@@ -0,0 +1,1046 @@
+import os
+import urllib
+import bisect
+import itertools
+import xbmc
+import xbmcaddon
+import time
+import datetime
+from shotwell import SCOPE_SAVED_SEARCHES, COLLECTION_CONDITIONS, COLLECTION_TIMES
+from sideindex import SCOPE_PHOTOS, SCOPE_EVENTS, SCOPE_DATES, SCOPE_TAGS, getEventScope, getDateScope, getTagScopes
+from pictures import PictureList
+from listingcache import ListingCache
+from connection import statistics
+import instrumentation
+from snapshot import DatabaseSnapshot
+from thumbnails import getDefaultThumbnailDirectory
+from derivatives import DerivativeCache, DERIVATIVE_DIRECTORY, getJobs
+from libraries import Library, LibraryQueries, ShotwellPool, MAX_LIBRARIES
+from libraries import getPictureOrder, mergeSorted, mergePictures, ofLibrary, interleave
+from randomorder import RandomOrder, getRandomSeed
+from stacks import getRepresentative
+from client import SUBMIT_BATCH_SIZE
+
+# edge length list icons are requested with, kodi's grid views show about this much
+ICON_SIZE = 256
+
+# random pages look at no more than this many ids per picture shown (filters matching few pictures),
+# in batches of at most MAX_RANDOM_BATCH ids
+RANDOM_TRIES_PER_PICTURE = 50
+MAX_RANDOM_BATCH = 500
+
+# the filters of random slideshows: name, label and arguments of ShotwellAccess.getRandomCondition,
+# the pictures of a year are a filter of their own
+RANDOM_FILTERS = [("all", "All pictures", {}), ("flagged", "Flagged", {'flagged': True}),
+                  ("rated3", "Rated 3 and more", {'minRating': 3}), ("rated5", "Rated 5", {'minRating': 5})]
+
+# the built-in collections: name and label (see ShotwellAccess.getCollectionSummary)
+COLLECTIONS = [("rated5", "Rated 5"), ("flagged", "Flagged"), ("imported", "Recently imported"), ("modified", "Recently edited")]
+
+def getDayDateFromUnixTimestamp(timestamp):
+    date = datetime.datetime.utcfromtimestamp(timestamp)
+    return str(date.day) + "." + str(date.month) + "." + str(date.year)
+    
+def getPictureInfo(picture):
+    # info labels and properties of a picture item (a ListedPicture), kodi sorts and shows them without opening the file
+    info = {'title': picture.label}
+    properties = {}
+    if picture.exposure_time is not None:
+        info['date'] = datetime.datetime.utcfromtimestamp(picture.exposure_time).strftime("%d.%m.%Y")
+    if picture.filesize is not None:
+        info['size'] = picture.filesize
+    if picture.width is not None and picture.height is not None:
+        info['exif:resolution'] = "%d,%d"%(picture.width, picture.height)
+    if picture.comment is not None and picture.comment != "":
+        info['exif:comment'] = picture.comment
+    # kodi's picture info has no rating, skins may show the property
+    for key in ('rating', 'orientation'):
+        if getattr(picture, key) is not None:
+            properties[key] = str(getattr(picture, key))
+    return info, properties
+
+def getMonthName(month):
+    # kodi's strings 21 to 32 are the names of the months
+    return xbmc.getLocalizedString(20 + int(month))
+
+class ShotwellViewer:
+    
+    # settings of further libraries end in their number (shotwelldb2, sourcepath2, ...)
+    def getShotwellSourcePath(self, suffix = ""):
+        path = None
+        db_path_from_settings = self.settings.getSetting( "shotwelldb" + suffix )
+        if db_path_from_settings is not None and db_path_from_settings!= "":
+            path = db_path_from_settings
+        elif suffix == "":
+            path = os.environ['HOME'] + '/.local/share/shotwell/data/photo.db'
+            
+        if path is None or path == '' or not os.path.exists(path):
+            return None
+        
+        return path
+        
+    def getShotwellDatabasePath(self, source):
+        if self.cacheDirectory is None or self.settings.getSetting( "snapshot" ) != "true":
+            return source
+        snapshot = DatabaseSnapshot(source, self.cacheDirectory)
+        return snapshot.getPath(self.getSnapshotCheckInterval(), self.getSnapshotMaxAge() * 60)
+        
+    def getSnapshotCheckInterval(self):
+        try:
+            interval = int(self.settings.getSetting( "snapshot_check_interval" ))
+        except ValueError:
+            interval = 60
+        return max(interval, 0)
+        
+    def getSnapshotMaxAge(self):
+        try:
+            maxAge = int(self.settings.getSetting( "snapshot_max_age" ))
+        except ValueError:
+            maxAge = 0
+        return max(maxAge, 0)
+        
+    def getSourceTargetPrefix(self, suffix = ""):
+        source = self.settings.getSetting( "sourcepath" + suffix )
+        if source is None:
+            source = ""
+        target = self.settings.getSetting( "targetpath" + suffix )
+        if target is None:
+            target = ""
+        
+        return source, target
+        
+    def getCacheDirectory(self):
+        directory = xbmc.translatePath(self.settings.getAddonInfo('profile'))
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                return None
+        return directory
+        
+    def getThumbnailDirectory(self, source, suffix = ""):
+        directory = self.settings.getSetting( "thumbnaildir" + suffix )
+        if directory is not None and directory != "":
+            return directory
+        return getDefaultThumbnailDirectory(source)
+        
+    def getLibraries(self):
+        # the library of the general settings and the enabled ones of the libraries category,
+        # as far as their database can be found (the machine keeping one may be switched off)
+        libraries = []
+        for index in range(MAX_LIBRARIES):
+            suffix = ""
+            if index > 0:
+                suffix = str(index + 1)
+                if self.settings.getSetting( "library" + suffix ) != "true":
+                    continue
+            source = self.getShotwellSourcePath(suffix)
+            if source is None:
+                continue
+            sourcePathPrefix, targetPathPrefix = self.getSourceTargetPrefix(suffix)
+            libraries += [Library(index, source, self.getShotwellDatabasePath(source), sourcePathPrefix, targetPathPrefix,
+                                  self.getThumbnailDirectory(source, suffix))]
+        return libraries
+        
+    def getSortEventsDescending(self):
+        descending = self.settings.getSetting( "sort_events_desc" )
+        if descending is None:
+            descending = True
+        return descending == "true"
+        
+    def getPageSize(self):
+        try:
+            pageSize = int(self.settings.getSetting( "page_size" ))
+        except ValueError:
+            pageSize = 500
+        if pageSize <= 0:
+            return None
+        return pageSize
+        
+    def getStacking(self):
+        # the longest gap in seconds between two pictures of a burst and the smallest
+        # event stacked (see stacks.py), None if the pictures of events aren't stacked
+        if self.settings.getSetting( "stack_bursts" ) != "true":
+            return None
+        try:
+            maxGap = int(self.settings.getSetting( "burst_gap" ))
+        except ValueError:
+            maxGap = 2
+        try:
+            minPictures = int(self.settings.getSetting( "stack_min_pictures" ))
+        except ValueError:
+            minPictures = 100
+        return max(maxGap, 0), max(minPictures, 0)
+        
+    def getRandomCount(self):
+        try:
+            count = int(self.settings.getSetting( "random_count" ))
+        except ValueError:
+            count = 100
+        return max(count, 1)
+        
+    def getWatchInterval(self):
+        # seconds between two looks of the service at the databases, None if it doesn't look
+        try:
+            interval = int(self.settings.getSetting( "watch_interval" ))
+        except ValueError:
+            interval = 10
+        if interval <= 0:
+            return None
+        return interval
+        
+    def getListingCache(self):
+        try:
+            size = int(self.settings.getSetting( "listing_cache_size" ))
+        except ValueError:
+            size = 20
+        if size <= 0 or self.cacheDirectory is None:
+            return None
+        return ListingCache(os.path.join(self.cacheDirectory, 'listings'), size * 1024 * 1024)
+        
+    def getDerivativeCache(self):
+        if self.settings.getSetting( "derivatives" ) != "true" or self.cacheDirectory is None:
+            return None
+        try:
+            width, height = [int(edge) for edge in self.settings.getSetting( "derivative_size" ).split("x")]
+        except ValueError:
+            width, height = 1920, 1080
+        try:
+            size = int(self.settings.getSetting( "derivative_cache_size" ))
+        except ValueError:
+            size = 500
+        return DerivativeCache(os.path.join(self.cacheDirectory, DERIVATIVE_DIRECTORY), max(size, 1) * 1024 * 1024, (width, height))
+        
+    def getPrefetchSettings(self):
+        # pictures read ahead and the cache size in bytes, None if slideshows read the pictures themselves
+        if self.settings.getSetting( "prefetch" ) != "true":
+            return None
+        try:
+            depth = int(self.settings.getSetting( "prefetch_depth" ))
+        except ValueError:
+            depth = 5
+        try:
+            size = int(self.settings.getSetting( "prefetch_cache_size" ))
+        except ValueError:
+            size = 200
+        return max(depth, 0), max(size, 1) * 1024 * 1024
+        
+    def getInstrumentation(self):
+        # enabled, threshold for slow queries in seconds and whether to log to a file
+        if self.settings.getSetting( "instrumentation" ) != "true":
+            return False, None, False
+        try:
+            slowQueryTime = int(self.settings.getSetting( "slow_query_ms" )) / 1000.0
+        except ValueError:
+            slowQueryTime = 0.1
+        return True, slowQueryTime, self.settings.getSetting( "instrumentation_file" ) == "true"
+        
+    def getSortPicturesAscending(self):
+        ascending = self.settings.getSetting( "sort_pictures_asc" )
+        if ascending is None:
+            ascending = True
+        return ascending == "true"
+        
+    
+    def __init__(self, baseUrl, args, directory, shotwellPool = None, settings = None, derivativeQueue = None, prefetcher = None,
+                 libraryQueries = None):
+        # directory receives the items as they are built (see plugin.KodiDirectory),
+        # shotwellPool keeps ShotwellAccess instances of a long running process,
+        # derivativeQueue makes display copies in its background (see derivatives.py),
+        # prefetcher reads pictures ahead during slideshows (see prefetch.py)
+        # and libraryQueries queries several libraries at once (see libraries.py)
+        self.baseUrl = baseUrl
+        self.args = args
+        self.directory = directory
+        if shotwellPool is None:
+            shotwellPool = ShotwellPool()
+        self.shotwellPool = shotwellPool
+        self.libraryQueries = libraryQueries
+        self.ownsLibraryQueries = libraryQueries is None
+        self.derivativeQueue = derivativeQueue
+        self.prefetcher = prefetcher
+        # one settings object for all getters, each Addon() reads the settings again
+        if settings is None:
+            settings = xbmcaddon.Addon()
+        self.settings = settings
+        self.cacheDirectory = self.getCacheDirectory()
+        self.libraries = self.getLibraries()
+        self.sortEventsDescending = self.getSortEventsDescending()
+        self.pageSize = self.getPageSize()
+        self.stacking = self.getStacking()
+        self.listingCache = self.getListingCache()
+        self.derivativeCache = self.getDerivativeCache()
+        self.prefetchSettings = self.getPrefetchSettings()
+        self.prefetchSequence = None
+        self.listing = {'items': [], 'total': 0}
+        self.pendingItems = []
+        # one-off listings (search results) would only push others out of the listing cache
+        self.cacheListing = True
+        self.listingSignature = None
+        self.instrumentation = self.getInstrumentation()
+        self.navigationStart = time.time()
+        self.submitTime = 0.0
+        #self.sortPicturesDescending = not self.getSortPicturesAscending()
+        
+    def buildUrl(self, query):
+        return self.baseUrl + '?' + urllib.urlencode(query)
+
+    def buildLibraryUrl(self, library, query):
+        # events, saved searches and tags belong to one library, urls of the first one stay as they were
+        if library.index > 0:
+            query['library'] = library.index
+        return self.buildUrl(query)
+
+    def getLibrary(self):
+        # the library of the url, None if it is no longer set up
+        index = int(self.args.get('library', ['0'])[0])
+        for library in self.libraries:
+            if library.index == index:
+                return library
+        return None
+
+    def openShotwell(self, library):
+        return self.shotwellPool.get(library.database, self.cacheDirectory)
+
+    def queryLibraries(self, query):
+        # the results of query(shotwellAccess, library) for all libraries, queried at once if there are several
+        if len(self.libraries) == 1:
+            return [query(self.openShotwell(self.libraries[0]), self.libraries[0])]
+        if self.libraryQueries is None:
+            self.libraryQueries = LibraryQueries()
+        return self.libraryQueries.map(query, self.libraries, self.cacheDirectory)
+
+    def combineFolders(self, query, getKey):
+        # query returns the folders (timeline buckets, tags) of a library sorted by getKey; folders of several
+        # libraries with the same key become one, their pictures add up and the earliest of their covers wins
+        streams = [[(library, folder) for folder in folders] for library, folders in zip(self.libraries, self.queryLibraries(query))]
+        folders = []
+        for library, folder in mergeSorted(streams, lambda entry: getKey(entry[1])):
+            if len(folders) > 0 and getKey(folders[-1]) == getKey(folder):
+                combined = folders[-1]
+                combined['picture_count'] += folder['picture_count']
+                if getPictureOrder(folder['picture_representation']) < getPictureOrder(combined['picture_representation']):
+                    combined['picture_representation'] = folder['picture_representation']
+                    combined['cover_library'] = library
+            else:
+                folder['library'] = library
+                folder['cover_library'] = library
+                folders += [folder]
+        return folders
+
+    def getListingKey(self):
+        # everything a listing depends on besides the databases: the url and the settings used to render it
+        query = tuple(sorted((key, tuple(self.args[key])) for key in self.args))
+        settings = (self.sortEventsDescending, self.pageSize, self.stacking)
+        return (tuple(library.getSettingsKey() for library in self.libraries), query, settings)
+    
+    def getListingScopes(self):
+        # the scopes (see sideindex) the listing of the url depends on, for every library; listings of
+        # an event or a saved search depend on nothing in other libraries. None if it isn't cached
+        category = self.args.get('category', [None])[0]
+        everywhere = lambda scopes: [scopes] * len(self.libraries)
+        inLibrary = lambda scopes: [scopes if library is self.getLibrary() else () for library in self.libraries]
+        if category == 'Saved Searches':
+            scopes = (SCOPE_PHOTOS, SCOPE_SAVED_SEARCHES)
+            if 'search_id' in self.args:
+                return inLibrary(scopes)
+            return everywhere(scopes)
+        elif category == 'Events':
+            if 'event_id' in self.args:
+                return inLibrary((getEventScope(int(self.args['event_id'][0])),))
+            return everywhere((SCOPE_EVENTS,))
+        elif category == 'Timeline':
+            if 'timeline_day' in self.args:
+                day = [int(self.args['timeline_' + key][0]) for key in ('year', 'month', 'day')]
+                return everywhere((getDateScope(*day),))
+            return everywhere((SCOPE_DATES,))
+        elif category == 'Tags':
+            library = self.getLibrary()
+            if 'tag_id' in self.args and library is not None:
+                tag = self.openShotwell(library).getTagInfo(self.args['tag_id'][0])
+                if tag is not None:
+                    return everywhere(tuple(getTagScopes(tag['path'])))
+            return everywhere((SCOPE_TAGS,))
+        elif category == 'Collections':
+            return everywhere((SCOPE_PHOTOS,))
+        elif category in ('Search', 'Random'):
+            return None
+        return everywhere(())
+
+    def getListingSignature(self):
+        # cached listings stay valid until shotwell changes something they show, see SideIndex.touchScopes
+        scopes = self.getListingScopes()
+        if scopes is None:
+            return None
+        signatures = self.queryLibraries(lambda v, library: v.getListingSignature(scopes[self.libraries.index(library)]))
+        return tuple(zip(scopes, signatures))
+
+    def linkDerivative(self, item):
+        # display copies are looked up when items are handed out, so cached listings link the ones made since
+        path = self.derivativeCache.lookup(item['source'])
+        if path is None:
+            return item
+        linked = dict(item)
+        linked['url'] = path
+        return linked
+    
+    def linkPrefetcher(self, item):
+        # the pictures of a listing become one sequence of the prefetcher, in listing order
+        if self.prefetchSequence is None:
+            self.prefetcher.configure(*self.prefetchSettings)
+            self.prefetchSequence = self.prefetcher.newSequence()
+        linked = dict(item)
+        linked['url'] = self.prefetcher.getUrl(self.prefetchSequence, item['url'])
+        return linked
+    
+    def linkItem(self, item):
+        if self.derivativeCache is not None:
+            linked = self.linkDerivative(item)
+            if linked is not item:
+                # display copies are local already
+                return linked
+        if self.prefetcher is not None and self.prefetchSettings is not None and item.get('remote', False):
+            return self.linkPrefetcher(item)
+        return item
+    
+    def submitItems(self, items):
+        if len(items) > 0:
+            items = [self.linkItem(item) if 'source' in item else item for item in items]
+            start = time.time()
+            self.directory.addItems(items, self.listing['total'])
+            self.submitTime += time.time() - start
+    
+    def endDirectory(self):
+        start = time.time()
+        self.directory.endOfDirectory()
+        self.submitTime += time.time() - start
+        if self.ownsLibraryQueries and self.libraryQueries is not None:
+            self.libraryQueries.close()
+            self.libraryQueries = None
+        
+        url = self.buildUrl(dict((key, self.args[key][0]) for key in self.args))
+        totalTime = time.time() - self.navigationStart
+        logDirectory = None
+        if self.instrumentation[2]:
+            logDirectory = self.cacheDirectory
+        instrumentation.finishNavigation(url, totalTime, self.submitTime, logDirectory)
+        xbmc.log("ShotwellViewer: %(queries)d queries in %(query_time).3fs, %(lock_waits)d lock waits (%(lock_wait_time).3fs), %(failures)d failed"%(statistics.asDict()), xbmc.LOGDEBUG)
+    
+    def addItem(self, url, label, icon = None, isFolder = False, source = None, info = None, remote = False):
+        # items are kept for the listing cache and handed to kodi in batches,
+        # source is the key of a picture's display copy (see Library.getSourceKey),
+        # info the info labels and properties of a picture (see getPictureInfo),
+        # remote whether the picture is read through the prefetcher (see Library.isRemotePath)
+        item = {'url': url, 'label': label, 'icon': icon, 'folder': isFolder}
+        if source is not None:
+            item['source'] = source
+        if remote:
+            item['remote'] = True
+        if info is not None:
+            item['info'], item['properties'] = info
+        self.listing['items'].append(item)
+        self.pendingItems.append(item)
+        if len(self.pendingItems) == SUBMIT_BATCH_SIZE:
+            self.submitItems(self.pendingItems)
+            self.pendingItems = []
+    
+    def endListing(self):
+        self.submitItems(self.pendingItems)
+        self.pendingItems = []
+        if self.cacheListing and self.listingCache is not None and self.listingSignature is not None:
+            self.listingCache.store(self.getListingKey(), self.listingSignature, self.listing)
+        self.endDirectory()
+    
+    def serveCachedListing(self):
+        if self.listingCache is None or self.listingSignature is None:
+            return False
+        listing = self.listingCache.load(self.getListingKey(), self.listingSignature)
+        if listing is None:
+            return False
+        
+        self.listing = listing
+        for i in range(0, len(listing['items']), SUBMIT_BATCH_SIZE):
+            self.submitItems(listing['items'][i:i + SUBMIT_BATCH_SIZE])
+        self.endDirectory()
+        return True
+    
+    def addCategoryToTitlePage(self, category):
+        url = self.buildUrl({'category': category})
+        self.addItem(url, category, isFolder=True)
+
+    def createTitlePage(self):
+        self.addCategoryToTitlePage('Saved Searches')
+        self.addCategoryToTitlePage('Events')
+        self.addCategoryToTitlePage('Timeline')
+        self.addCategoryToTitlePage('Tags')
+        self.addCategoryToTitlePage('Collections')
+        self.addCategoryToTitlePage('Search')
+        self.addCategoryToTitlePage('Random')
+     
+        self.endListing()
+
+    def createSavedSearchesTitlePage(self):
+        category = 'Saved Searches'
+        def query(v, library):
+            searches = v.getSavedSearches()
+            searches.sort(key=lambda savedSearch: savedSearch['earliest_time'])
+            return [(library, search) for search in searches]
+        searches = mergeSorted(self.queryLibraries(query), lambda entry: entry[1]['earliest_time'])
+        for library, search in searches:
+            url = self.buildLibraryUrl(library, {
+                    'category': category, 
+                    'search_id': search['id']})
+            picturePath = library.thumbnails.getIcon(search['picture_representation'], ICON_SIZE)
+            self.addItem(url, search['name'], picturePath, True)
+            
+        self.endListing()
+    
+    def getPageStart(self):
+        # key of the last picture of the previous page, see createPicturePage
+        afterNames = self.args.get('after_name', None)
+        if afterNames is None:
+            return None
+        afterTime = self.args.get('after_time', [''])[0]
+        if afterTime == '':
+            afterTime = None
+        else:
+            afterTime = int(afterTime)
+        return afterTime, afterNames[0].decode('utf-8')
+    
+    def getPageLimit(self):
+        # one more than shown, to know whether there is a next page
+        if self.pageSize is None:
+            return None
+        return self.pageSize + 1
+    
+    def getNextPageUrl(self, lastPicture):
+        query = {}
+        for key in self.args:
+            query[key] = self.args[key][0]
+        query['after_time'] = ''
+        if lastPicture.exposure_time is not None:
+            query['after_time'] = str(lastPicture.exposure_time)
+        query['after_name'] = lastPicture.filename.encode('utf-8')
+        return self.buildUrl(query)
+    
+    def createPicturePage(self, pictures, getNextPageUrl = None):
+        # pictures are (library, picture) entries (see libraries.ofLibrary),
+        # getNextPageUrl(lastPicture) for listings not paged by picture order
+        if self.pageSize is not None:
+            self.listing['total'] = self.pageSize + 1
+        
+        count = 0
+        lastPicture = None
+        batch = []
+        for library, picture in pictures:
+            if self.pageSize is not None and count == self.pageSize:
+                self.addPictures(batch)
+                batch = []
+                if getNextPageUrl is None:
+                    getNextPageUrl = self.getNextPageUrl
+                self.addItem(getNextPageUrl(lastPicture), "Next page", isFolder=True)
+                break
+            
+            batch += [(library, picture)]
+            if len(batch) == SUBMIT_BATCH_SIZE:
+                self.addPictures(batch)
+                batch = []
+            count += 1
+            lastPicture = picture
+        
+        self.addPictures(batch)
+        self.endListing()
+    
+    def addPicture(self, library, picture):
+        # picture listings read what the items show along with the pictures, see pictures.ListedPicture
+        self.addItem(library.getProperPath(picture.filename), picture.label, library.thumbnails.getIcon(picture, ICON_SIZE), False,
+                     library.getSourceKey(picture.filename), getPictureInfo(picture), library.isRemotePath(picture.filename))
+    
+    def addPictures(self, entries):
+        for library, picture in entries:
+            self.addPicture(library, picture)
+    
+    def preparesDerivatives(self):
+        return self.derivativeCache is not None and self.derivativeQueue is not None
+    
+    def queueDerivatives(self, library, pictures):
+        # the whole event or saved search, while the user looks at its first page
+        self.derivativeQueue.add(self.derivativeCache, getJobs(library, pictures))
+    
+    def queueListedDerivatives(self, library, query):
+        # as queueDerivatives, query(shotwellAccess) lists the pictures in the background of the queue
+        self.derivativeQueue.addListing(self.derivativeCache, library, self.cacheDirectory, query)
+    
+    def createSavedSearchPage(self, library, searchId):
+        v = self.openShotwell(library)
+        searchInfo = v.getSavedSearchInfo(searchId)
+        if self.getPageStart() is None and self.preparesDerivatives():
+            self.queueListedDerivatives(library, lambda access: access.iterPicturesOfSavedSearch(searchInfo))
+        pictures = v.iterPicturesOfSavedSearch(searchInfo, self.getPageStart(), self.getPageLimit())
+        self.createPicturePage(ofLibrary(library, pictures))
+
+    def createSavedSearchesPage(self):
+        searchIds = self.args.get('search_id', None)
+        
+        if searchIds is None:
+            self.createSavedSearchesTitlePage()
+        elif self.getLibrary() is None:
+            self.endListing()
+        else:
+            self.createSavedSearchPage(self.getLibrary(), searchIds[0])
+    
+    def createEventsTitlePage(self):
+        category = 'Events'
+        years = set()
+        for libraryYears in self.queryLibraries(lambda v, library: v.getEventYears()):
+            years.update(libraryYears)
+        years = list(years)
+        years.sort(reverse=self.sortEventsDescending)
+        for year in years:
+            url = self.buildUrl({
+                    'category': category, 
+                    'event_year': year})
+            name = year
+            self.addItem(url, name, isFolder=True)
+            
+        self.endListing()
+    
+    def createEventsYearPage(self, year):
+        category = 'Events'
+        def query(v, library):
+            events = v.getEventCatalog(year)
+            events.sort(key=lambda event: event['startrange'], reverse=self.sortEventsDescending)
+            return [(library, event) for event in events]
+        if self.sortEventsDescending:
+            order = lambda entry: -entry[1]['startrange']
+        else:
+            order = lambda entry: entry[1]['startrange']
+        for library, event in mergeSorted(self.queryLibraries(query), order):
+            url = self.buildLibraryUrl(library, {
+                    'category': category,
+                    'event_year': year,
+                    'event_id': event['eventid']})
+            start = getDayDateFromUnixTimestamp(event['startrange'])
+            end = getDayDateFromUnixTimestamp(event['endrange'])
+            name = event['name'] 
+            if name is None:
+                # shotwell shows unnamed events by their dates
+                name = start
+                if start != end:
+                    name += " - " + end
+            elif start == end:
+                name += " (" + start + ")"
+            else:
+                name += " (" + start +" - " + end + ")"
+            picturePath = library.thumbnails.getIcon(event['picture_representation'], ICON_SIZE)
+            self.addItem(url, name, picturePath, True)
+            
+        self.endListing()
+    
+    def addFlaggedFolder(self, v, library, year, eventId):
+        if v.hasFlaggedPictures(eventId):
+            url = self.buildLibraryUrl(library, {
+                    'category': 'Events', 
+                    'event_year': year,
+                    'event_id': eventId,
+                    'event_flagged': "True"})
+            name = "Flagged"
+            self.addItem(url, name, isFolder=True)
+    
+    def createEventPage(self, library, year, eventId, flagged):
+        v = self.openShotwell(library)
+        # the count of the event catalog decides, the rows stacking needs are read for large events only
+        if not flagged and self.stacking is not None and v.getEventPictureCount(eventId) >= self.stacking[1]:
+            self.createStackedEventPage(library, year, eventId)
+            return
+        pageStart = self.getPageStart()
+        if not flagged and pageStart is None:
+            self.addFlaggedFolder(v, library, year, eventId)
+        if pageStart is None and self.preparesDerivatives():
+            self.queueListedDerivatives(library, lambda access: access.iterPicturesOfEvent(eventId, flagged))
+            
+        pictures = v.iterPicturesOfEvent(eventId, flagged, pageStart, self.getPageLimit())
+        self.createPicturePage(ofLibrary(library, pictures))
+    
+    def getStackOffset(self):
+        return int(self.args.get('stack_offset', ['0'])[0])
+    
+    def getStackPageUrl(self, offset):
+        query = {}
+        for key in self.args:
+            query[key] = self.args[key][0]
+        query['stack_offset'] = offset
+        return self.buildUrl(query)
+    
+    def createStackedEventPage(self, library, year, eventId):
+        # bursts and copies of a picture are one folder each, shown by their best picture (see stacks.py);
+        # stacked events are paged by stack
+        offset = self.getStackOffset()
+        pictures, stacks = self.openShotwell(library).getStacksOfEvent(eventId, self.stacking[0])
+        if offset == 0:
+            self.addFlaggedFolder(self.openShotwell(library), library, year, eventId)
+            if self.preparesDerivatives():
+                self.queueDerivatives(library, pictures)
+        end = len(stacks)
+        if self.pageSize is not None:
+            self.listing['total'] = self.pageSize + 1
+            end = min(end, offset + self.pageSize)
+        
+        page = stacks[offset:end]
+        for stack in page:
+            if len(stack) == 1:
+                self.addPicture(library, pictures[stack[0]])
+                continue
+            representative = getRepresentative(pictures, stack)
+            url = self.buildLibraryUrl(library, {
+                    'category': 'Events',
+                    'event_year': year,
+                    'event_id': eventId,
+                    'event_stack': pictures[stack[0]].id})
+            name = representative.label + " (" + str(len(stack)) + ")"
+            self.addItem(url, name, library.thumbnails.getIcon(representative, ICON_SIZE), True)
+        if end < len(stacks):
+            self.addItem(self.getStackPageUrl(end), "Next page", isFolder=True)
+        self.endListing()
+    
+    def createStackPage(self, library, year, eventId, stackId):
+        # the pictures of one stack of an event, the stack is named by its first picture
+        pictures, stacks = self.openShotwell(library).getStacksOfEvent(eventId, self.stacking[0])
+        stack = []
+        for candidate in stacks:
+            if pictures[candidate[0]].id == stackId:
+                stack = candidate
+                break
+        offset = self.getStackOffset()
+        members = [(library, pictures[index]) for index in stack[offset:]]
+        self.createPicturePage(members, lambda lastPicture: self.getStackPageUrl(offset + self.pageSize))
+    
+    def createEventsPage(self):
+        eventYears = self.args.get('event_year', None)
+        eventIds = self.args.get('event_id', None)
+        eventFlaggs = self.args.get('event_flagged', None)
+        eventStacks = self.args.get('event_stack', None)
+        
+        if eventYears is None:
+            self.createEventsTitlePage()
+        elif eventIds is None:
+            self.createEventsYearPage(eventYears[0])
+        elif self.getLibrary() is None:
+            self.endListing()
+        elif eventStacks is not None and self.stacking is not None:
+            self.createStackPage(self.getLibrary(), eventYears[0], eventIds[0], int(eventStacks[0]))
+        else:
+            flagged = False
+            if eventFlaggs is not None and eventFlaggs[0]=="True":
+                flagged = True
+            self.createEventPage(self.getLibrary(), eventYears[0], eventIds[0], flagged)
+
+    def addTimelineFolders(self, query, keys, getName, reverse = False):
+        # query returns the buckets of a library in date order, keys are the date parts naming them
+        entries = self.combineFolders(query, lambda entry: tuple(entry[key] for key in keys))
+        if reverse:
+            entries.reverse()
+        for entry in entries:
+            query = {'category': 'Timeline'}
+            for key in ('year', 'month', 'day'):
+                if key in entry:
+                    query['timeline_' + key] = entry[key]
+            name = getName(entry) + " (" + str(entry['picture_count']) + ")"
+            cover = entry['cover_library'].thumbnails.getIcon(entry['picture_representation'], ICON_SIZE)
+            self.addItem(self.buildUrl(query), name, cover, True)
+        self.endListing()
+    
+    def createTimelineTitlePage(self):
+        self.addTimelineFolders(lambda v, library: v.getTimelineYears(), ['year'], lambda entry: str(entry['year']),
+                                self.sortEventsDescending)
+    
+    def createTimelineYearPage(self, year):
+        self.addTimelineFolders(lambda v, library: v.getTimelineMonths(year), ['year', 'month'],
+                                lambda entry: getMonthName(entry['month']) + " " + str(entry['year']))
+    
+    def createTimelineMonthPage(self, year, month):
+        self.addTimelineFolders(lambda v, library: v.getTimelineDays(year, month), ['year', 'month', 'day'],
+                                lambda entry: "%d.%d.%d"%(entry['day'], entry['month'], entry['year']))
+    
+    def createTimelineDayPage(self, year, month, day):
+        pageStart = self.getPageStart()
+        limit = self.getPageLimit()
+        def query(v, library):
+            return PictureList(v.iterPicturesOfDay(year, month, day, pageStart, limit))
+        self.createPicturePage(mergePictures(zip(self.libraries, self.queryLibraries(query))))
+    
+    def createTimelinePage(self):
+        years = self.args.get('timeline_year', None)
+        months = self.args.get('timeline_month', None)
+        days = self.args.get('timeline_day', None)
+        
+        if years is None:
+            self.createTimelineTitlePage()
+        elif months is None:
+            self.createTimelineYearPage(int(years[0]))
+        elif days is None:
+            self.createTimelineMonthPage(int(years[0]), int(months[0]))
+        else:
+            self.createTimelineDayPage(int(years[0]), int(months[0]), int(days[0]))
+    
+    def createSearchPage(self):
+        # the text is asked for by plugin.getSearchText, search results are paged by rank
+        self.cacheListing = False
+        texts = self.args.get('search_text', None)
+        if texts is None:
+            self.endListing()
+            return
+        offset = int(self.args.get('search_offset', ['0'])[0])
+        
+        def getNextPageUrl(lastPicture):
+            return self.buildUrl({
+                    'category': 'Search',
+                    'search_text': texts[0],
+                    'search_offset': offset + self.pageSize})
+        
+        text = texts[0].decode('utf-8')
+        limit = self.getPageLimit()
+        if len(self.libraries) == 1:
+            v = self.openShotwell(self.libraries[0])
+            pictures = ofLibrary(self.libraries[0], v.iterPicturesOfSearch(text, offset, limit))
+        else:
+            # every library ranks its own results, the page is cut out of them taking turns
+            def query(v, library):
+                if limit is None:
+                    return PictureList(v.iterPicturesOfSearch(text))
+                return PictureList(v.iterPicturesOfSearch(text, 0, offset + limit))
+            results = self.queryLibraries(query)
+            pictures = itertools.islice(interleave([ofLibrary(library, libraryPictures)
+                                                    for library, libraryPictures in zip(self.libraries, results)]), offset, None)
+        self.createPicturePage(pictures, getNextPageUrl)
+    
+    def addTagFolders(self, parent):
+        # tags of several libraries with the same path are one, their urls name the first library having it
+        category = 'Tags'
+        tags = self.combineFolders(lambda v, library: v.getTags(parent), lambda tag: tag['path'])
+        for tag in tags:
+            url = self.buildLibraryUrl(tag['library'], {
+                    'category': category,
+                    'tag_id': tag['id']})
+            name = tag['name'] + " (" + str(tag['picture_count']) + ")"
+            self.addItem(url, name, tag['cover_library'].thumbnails.getIcon(tag['picture_representation'], ICON_SIZE), True)
+    
+    def createTagsTitlePage(self):
+        self.addTagFolders("")
+        self.endListing()
+    
+    def createTagPage(self, library, tagId):
+        v = self.openShotwell(library)
+        tag = v.getTagInfo(tagId)
+        if tag is None:
+            self.endListing()
+            return
+        # hierarchical tags list their children before their own pictures
+        pageStart = self.getPageStart()
+        if pageStart is None:
+            self.addTagFolders(tag['path'])
+        limit = self.getPageLimit()
+        def query(v, other):
+            if other is library:
+                return PictureList(v.iterPicturesOfTag(tag['id'], pageStart, limit))
+            otherTag = v.getTagInfoForPath(tag['path'])
+            if otherTag is None:
+                return PictureList()
+            return PictureList(v.iterPicturesOfTag(otherTag['id'], pageStart, limit))
+        self.createPicturePage(mergePictures(zip(self.libraries, self.queryLibraries(query))))
+    
+    def createTagsPage(self):
+        tagIds = self.args.get('tag_id', None)
+        
+        if tagIds is None:
+            self.createTagsTitlePage()
+        elif self.getLibrary() is None:
+            self.endListing()
+        else:
+            self.createTagPage(self.getLibrary(), tagIds[0])
+
+    def createCollectionsTitlePage(self):
+        # every collection of every library is counted by an index, the collections of the libraries are one
+        category = 'Collections'
+        summaries = self.queryLibraries(lambda v, library: [v.getCollectionSummary(name) for name, label in COLLECTIONS])
+        for index, (name, label) in enumerate(COLLECTIONS):
+            count = 0
+            cover = None
+            for library, librarySummaries in zip(self.libraries, summaries):
+                summary = librarySummaries[index]
+                count += summary['picture_count']
+                picture = summary['picture_representation']
+                if picture is None:
+                    continue
+                if name in COLLECTION_TIMES:
+                    better = cover is None or summary['latest_time'] > cover[2]
+                else:
+                    better = cover is None or getPictureOrder(picture) < getPictureOrder(cover[1])
+                if better:
+                    cover = (library, picture, summary.get('latest_time', None))
+            if count == 0:
+                continue
+            url = self.buildUrl({'category': category, 'collection': name})
+            self.addItem(url, label + " (" + str(count) + ")", cover[0].thumbnails.getIcon(cover[1], ICON_SIZE), True)
+        self.endListing()
+    
+    def createCollectionPage(self, name):
+        pageStart = self.getPageStart()
+        limit = self.getPageLimit()
+        def query(v, library):
+            return PictureList(v.iterPicturesOfCollection(name, pageStart, limit))
+        self.createPicturePage(mergePictures(zip(self.libraries, self.queryLibraries(query))))
+    
+    def createLatestPage(self, name):
+        # collections by time are paged by offset, like search results
+        offset = int(self.args.get('collection_offset', ['0'])[0])
+        
+        def getNextPageUrl(lastPicture):
+            return self.buildUrl({
+                    'category': 'Collections',
+                    'collection': name,
+                    'collection_offset': offset + self.pageSize})
+        
+        limit = self.getPageLimit()
+        if len(self.libraries) == 1:
+            v = self.openShotwell(self.libraries[0])
+            pictures = ofLibrary(self.libraries[0], [picture for time, picture in v.getLatestPictures(name, offset, limit)])
+        else:
+            # every library is read up to the end of the page, the latest pictures of all of them make it
+            def query(v, library):
+                if limit is None:
+                    return [(library, time, picture) for time, picture in v.getLatestPictures(name, 0)]
+                return [(library, time, picture) for time, picture in v.getLatestPictures(name, 0, offset + limit)]
+            latest = mergeSorted(self.queryLibraries(query), lambda entry: (-entry[1], entry[0].index, -entry[2].id))
+            pictures = itertools.islice(((library, picture) for library, time, picture in latest), offset, None)
+        self.createPicturePage(pictures, getNextPageUrl)
+    
+    def createCollectionsPage(self):
+        names = self.args.get('collection', None)
+        
+        if names is None:
+            self.createCollectionsTitlePage()
+        elif names[0] in COLLECTION_TIMES:
+            self.createLatestPage(names[0])
+        elif names[0] in COLLECTION_CONDITIONS:
+            self.createCollectionPage(names[0])
+        else:
+            self.endListing()
+
+    def createRandomTitlePage(self):
+        category = 'Random'
+        for name, label, filters in RANDOM_FILTERS:
+            self.addItem(self.buildUrl({'category': category, 'random_filter': name}), label, isFolder=True)
+        years = self.combineFolders(lambda v, library: v.getTimelineYears(), lambda entry: entry['year'])
+        if self.sortEventsDescending:
+            years.reverse()
+        for entry in years:
+            url = self.buildUrl({'category': category, 'random_filter': 'year', 'random_year': entry['year']})
+            self.addItem(url, str(entry['year']), entry['cover_library'].thumbnails.getIcon(entry['picture_representation'], ICON_SIZE), True)
+        self.endListing()
+    
+    def getRandomPictures(self, order, offsets, ranges, position, count, filters):
+        # looks up the ids at the positions of order from position on, until count of them match
+        # the filters; returns the (library, picture) entries and the position to go on from
+        pictures = []
+        tries = count * RANDOM_TRIES_PER_PICTURE
+        while len(pictures) < count and position < order.size and tries > 0:
+            end = min(order.size, position + min(MAX_RANDOM_BATCH, 2 * (count - len(pictures)), tries))
+            candidates = []
+            for candidate in range(position, end):
+                number = order.get(candidate)
+                index = bisect.bisect_right(offsets, number) - 1
+                candidates += [(index, ranges[index][0] + number - offsets[index])]
+            def query(v, library):
+                ids = [id for index, id in candidates if self.libraries[index] is library]
+                if len(ids) == 0:
+                    return {}
+                condition, params = v.getRandomCondition(**filters)
+                return v.getPicturesForIds(ids, condition, params)
+            found = self.queryLibraries(query)
+            tries -= end - position
+            for index, id in candidates:
+                position += 1
+                if id in found[index]:
+                    pictures += [(self.libraries[index], found[index][id])]
+                    if len(pictures) == count:
+                        break
+        return pictures, position
+    
+    def createRandomPage(self, name):
+        # a slideshow of count random pictures; its seed and position in the random order are in the
+        # url of the next page, which goes on without repeats until all pictures have been shown
+        self.cacheListing = False
+        if name == 'year':
+            filters = {'year': int(self.args['random_year'][0])}
+        else:
+            filters = dict([entry[2] for entry in RANDOM_FILTERS if entry[0] == name][0])
+        seed = int(self.args.get('random_seed', [getRandomSeed()])[0])
+        position = int(self.args.get('random_position', ['0'])[0])
+        
+        # ids of all libraries are numbered one after the other
+        ranges = self.queryLibraries(lambda v, library: v.getIdRange())
+        ranges = [(0, -1) if idRange is None else idRange for idRange in ranges]
+        offsets = []
+        size = 0
+        for first, last in ranges:
+            offsets += [size]
+            size += last - first + 1
+        if size == 0:
+            self.endListing()
+            return
+        
+        count = self.getRandomCount()
+        self.listing['total'] = count + 1
+        pictures, position = self.getRandomPictures(RandomOrder(size, seed), offsets, ranges, position, count, filters)
+        if position >= size:
+            # every picture had its turn, the next page starts another order
+            seed = (seed + 1) & 0x7fffffff
+            position = 0
+        self.addPictures(pictures)
+        
+        query = {}
+        for key in self.args:
+            query[key] = self.args[key][0]
+        query['random_seed'] = seed
+        query['random_position'] = position
+        self.addItem(self.buildUrl(query), "More", isFolder=True)
+        self.endListing()
+    
+    def createRandomsPage(self):
+        names = self.args.get('random_filter', None)
+        
+        if names is None:
+            self.createRandomTitlePage()
+        else:
+            self.createRandomPage(names[0])
+    
+    def Main(self):
+        statistics.reset()
+        instrumentation.startNavigation(self.instrumentation[0], self.instrumentation[1])
+        if len(self.libraries) > 0 and self.listingCache is not None:
+            self.listingSignature = self.getListingSignature()
+        if self.serveCachedListing():
+            return
+        
+        categories = self.args.get('category', None)
+        if categories is None:
+            self.createTitlePage() 
+        else:
+            category = categories[0]
+            if category == 'Saved Searches':
+                self.createSavedSearchesPage()
+            elif category == 'Events':
+                self.createEventsPage()
+            elif category == 'Timeline':
+                self.createTimelinePage()
+            elif category == 'Tags':
+                self.createTagsPage()
+            elif category == 'Collections':
+                self.createCollectionsPage()
+            elif category == 'Search':
+                self.createSearchPage()
+            elif category == 'Random':
+                self.createRandomsPage()
+            else:
+                self.endListing()
@@ -0,0 +1,272 @@
+#!/usr/bin/python
+# times the ShotwellAccess entry points and the page handlers of the viewer
+# against a library, with kodi's modules replaced by tools/stubs, e.g.
+#   python tools/generate_library.py /tmp/photo.db --photos 100000
+#   python tools/benchmark.py /tmp/photo.db --repeat 20 --burst-gap 60
+# every case calls its function --repeat times, cycling through sampled
+# events, searches, tags, years, months and days; "first" is the first of
+# these calls. generated libraries have a picture every 37 seconds or so,
+# their events only have stacks (see stacks.py) with a larger burst gap
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+try:
+    import resource
+except ImportError:
+    resource = None
+
+TOOLS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+PLUGIN_DIRECTORY = os.path.join(os.path.dirname(TOOLS_DIRECTORY), "plugin.image.ShotwellViewer")
+sys.path[:0] = [os.path.join(TOOLS_DIRECTORY, "stubs"), PLUGIN_DIRECTORY]
+
+import xbmcaddon
+from shotwell import ShotwellAccess
+from viewer import ShotwellViewer, RANDOM_FILTERS, COLLECTIONS
+from connection import statistics
+
+BASE_URL = "plugin://plugin.image.ShotwellViewer/"
+
+# random pages are measured in a fixed order, so runs can be compared
+RANDOM_SEED = 1
+
+
+def getPeakMemory():
+    # peak resident size of this process in MiB, linux reports KiB and mac bytes
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak /= 1024
+    return peak / 1024.0
+
+
+def getPercentile(values, percent):
+    # nearest rank on sorted values
+    index = int(round(percent / 100.0 * len(values) + 0.5)) - 1
+    return values[max(0, min(len(values) - 1, index))]
+
+
+def getSamples(values, count):
+    # evenly spread over the values, so small and large entries are both in
+    if len(values) <= count:
+        return list(values)
+    step = float(len(values)) / count
+    return [values[int(i * step)] for i in range(count)]
+
+
+class CountingDirectory:
+
+    def __init__(self):
+        self.count = 0
+
+    def addItems(self, items, totalItems):
+        self.count += len(items)
+
+    def endOfDirectory(self):
+        pass
+
+
+class Benchmark:
+
+    def __init__(self, database, cacheDirectory, repeat, sampleCount, pageSize, listingCache, burstGap):
+        self.database = database
+        self.cacheDirectory = cacheDirectory
+        self.repeat = repeat
+        self.sampleCount = sampleCount
+        self.pageSize = pageSize
+        self.burstGap = burstGap
+        self.results = []
+        xbmcaddon.info['profile'] = cacheDirectory
+        xbmcaddon.settings.update({'shotwelldb': database, 'page_size': str(pageSize), 'use_service': 'false',
+                                   'listing_cache_size': str(listingCache), 'sort_events_desc': 'true',
+                                   'stack_bursts': 'false', 'burst_gap': str(burstGap)})
+
+    def measure(self, name, function, arguments = None):
+        if arguments is None or len(arguments) == 0:
+            arguments = [()]
+        times = []
+        items = 0
+        queries = 0
+        for i in range(self.repeat):
+            statistics.reset()
+            start = time.time()
+            result = function(*arguments[i % len(arguments)])
+            times.append(time.time() - start)
+            queries += statistics.queries
+            if result is not None:
+                items += len(result)
+
+        first = times[0]
+        times.sort()
+        entry = {'name': name, 'first': first, 'p50': getPercentile(times, 50), 'p90': getPercentile(times, 90),
+                 'p99': getPercentile(times, 99), 'max': times[-1], 'items': items // self.repeat,
+                 'queries': queries // self.repeat, 'peak_mib': getPeakMemory()}
+        self.results.append(entry)
+        self.printResult(entry)
+
+    def printHeader(self):
+        print("%-34s %9s %9s %9s %9s %9s %8s %8s %9s"%("case", "first ms", "p50 ms", "p90 ms", "p99 ms", "max ms",
+                                                     "items", "queries", "peak MiB"))
+
+    def printResult(self, entry):
+        peak = "-"
+        if entry['peak_mib'] is not None:
+            peak = "%.1f"%(entry['peak_mib'])
+        print("%-34s %9.1f %9.1f %9.1f %9.1f %9.1f %8d %8d %9s"%(entry['name'][:34], entry['first'] * 1000, entry['p50'] * 1000,
+                                                               entry['p90'] * 1000, entry['p99'] * 1000, entry['max'] * 1000,
+                                                               entry['items'], entry['queries'], peak))
+
+    def runAccessCases(self):
+        v = ShotwellAccess(self.database, self.cacheDirectory)
+        self.measure("getSavedSearches", v.getSavedSearches)
+        self.measure("getEvents", v.getEvents)
+        self.measure("getEventYears", v.getEventYears)
+        self.measure("getTags", v.getTags)
+
+        years = [(year,) for year in getSamples(sorted(v.getEventYears()), self.sampleCount)]
+        searches = [(search,) for search in getSamples(v.getSavedSearches(), self.sampleCount)]
+        events = [(event['eventid'],) for event in getSamples(v.getEvents(), self.sampleCount)]
+        tags = [(tag['id'],) for tag in getSamples(v.getTags(), self.sampleCount)]
+        self.measure("getEventCatalog(year)", v.getEventCatalog, years)
+        self.measure("getPicturesOfSavedSearch", v.getPicturesOfSavedSearch, searches)
+        self.measure("getPicturesOfEvent", v.getPicturesOfEvent, events)
+        self.measure("getPicturesOfTag", v.getPicturesOfTag, tags)
+        self.measure("getTimelineYears", v.getTimelineYears)
+
+        # the pages also go down the timeline, into child tags and to the stacks of the largest events
+        samples = {'years': years, 'searches': searches, 'events': events}
+        timelineYears = getSamples([entry['year'] for entry in v.getTimelineYears()], self.sampleCount)
+        months = []
+        for year in timelineYears:
+            months += [(year, entry['month']) for entry in v.getTimelineMonths(year)]
+        months = getSamples(months, self.sampleCount)
+        days = []
+        for year, month in months:
+            days += [(year, month, entry['day']) for entry in v.getTimelineDays(year, month)]
+        samples['timeline'] = (timelineYears, months, getSamples(days, self.sampleCount))
+        allTags = []
+        pending = v.getTags()
+        while len(pending) > 0:
+            tag = pending.pop(0)
+            allTags += [tag]
+            pending += v.getTags(tag['path'])
+        samples['tags'] = getSamples(allTags, self.sampleCount)
+        samples['texts'] = [tag['name'] for tag in samples['tags']]
+        largest = sorted(v.getEvents(), key = lambda event: event['picture_count'], reverse = True)[:self.sampleCount]
+        stacks = []
+        for event in largest:
+            pictures, eventStacks = v.getStacksOfEvent(event['eventid'], self.burstGap)
+            stacks += [(event['eventid'], pictures[stack[0]].id) for stack in eventStacks if len(stack) > 1][:1]
+        samples['stacked'] = ([event['eventid'] for event in largest], stacks)
+        return samples
+
+    def showPage(self, args):
+        directory = CountingDirectory()
+        ShotwellViewer(BASE_URL, dict((key, [str(args[key])]) for key in args), directory).Main()
+        return range(directory.count)
+
+    def runPageCases(self, samples):
+        years, searches, events = samples['years'], samples['searches'], samples['events']
+        self.measure("page: title", self.showPage, [({},)])
+        self.measure("page: saved searches", self.showPage, [({'category': 'Saved Searches'},)])
+        self.measure("page: saved search", self.showPage,
+                     [({'category': 'Saved Searches', 'search_id': search[0]['id']},) for search in searches])
+        self.measure("page: event years", self.showPage, [({'category': 'Events'},)])
+        self.measure("page: events of a year", self.showPage,
+                     [({'category': 'Events', 'event_year': year[0]},) for year in years])
+        self.measure("page: event", self.showPage,
+                     [({'category': 'Events', 'event_year': years[0][0], 'event_id': event[0]},) for event in events])
+        self.runStackedPageCases(years[0][0], *samples['stacked'])
+        self.runTimelinePageCases(*samples['timeline'])
+        self.measure("page: tags", self.showPage, [({'category': 'Tags'},)])
+        self.measure("page: tag", self.showPage, [({'category': 'Tags', 'tag_id': tag['id']},) for tag in samples['tags']])
+        self.measure("page: collections", self.showPage, [({'category': 'Collections'},)])
+        for name, label in COLLECTIONS:
+            self.measure("page: collection " + name, self.showPage, [({'category': 'Collections', 'collection': name},)])
+        self.runSearchPageCases(samples['texts'])
+        self.runRandomPageCases(samples['timeline'][0])
+
+    def runStackedPageCases(self, year, events, stacks):
+        # every sampled event is stacked, a stacked event is paged by its stacks
+        xbmcaddon.settings.update({'stack_bursts': 'true', 'stack_min_pictures': '0'})
+        try:
+            self.measure("page: stacked event", self.showPage,
+                         [({'category': 'Events', 'event_year': year, 'event_id': event},) for event in events])
+            self.measure("page: stacked event, next", self.showPage,
+                         [({'category': 'Events', 'event_year': year, 'event_id': event, 'stack_offset': self.pageSize},)
+                          for event in events])
+            if len(stacks) > 0:
+                self.measure("page: stack", self.showPage,
+                             [({'category': 'Events', 'event_year': year, 'event_id': event, 'event_stack': stack},)
+                              for event, stack in stacks])
+        finally:
+            xbmcaddon.settings.update({'stack_bursts': 'false'})
+
+    def runTimelinePageCases(self, years, months, days):
+        self.measure("page: timeline", self.showPage, [({'category': 'Timeline'},)])
+        self.measure("page: timeline year", self.showPage, [({'category': 'Timeline', 'timeline_year': year},) for year in years])
+        self.measure("page: timeline month", self.showPage,
+                     [({'category': 'Timeline', 'timeline_year': year, 'timeline_month': month},) for year, month in months])
+        self.measure("page: timeline day", self.showPage,
+                     [({'category': 'Timeline', 'timeline_year': year, 'timeline_month': month, 'timeline_day': day},)
+                      for year, month, day in days])
+
+    def runSearchPageCases(self, texts):
+        # searches for the names of tags, which also match titles, comments and file names
+        self.measure("page: search", self.showPage, [({'category': 'Search', 'search_text': text},) for text in texts])
+        self.measure("page: search, next", self.showPage,
+                     [({'category': 'Search', 'search_text': text, 'search_offset': self.pageSize},) for text in texts])
+
+    def runRandomPageCases(self, years):
+        self.measure("page: random", self.showPage, [({'category': 'Random'},)])
+        for name, label, filters in RANDOM_FILTERS:
+            self.measure("page: random " + name, self.showPage,
+                         [({'category': 'Random', 'random_filter': name, 'random_seed': RANDOM_SEED, 'random_position': position},)
+                          for position in range(0, self.repeat * self.pageSize, self.pageSize)])
+        self.measure("page: random year", self.showPage,
+                     [({'category': 'Random', 'random_filter': 'year', 'random_year': year, 'random_seed': RANDOM_SEED},)
+                      for year in years])
+
+    def run(self):
+        self.printHeader()
+        self.runPageCases(self.runAccessCases())
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark ShotwellAccess and the viewer pages")
+    parser.add_argument("database")
+    parser.add_argument("--repeat", type = int, default = 10)
+    parser.add_argument("--samples", type = int, default = 10, help = "events, searches, tags and years to cycle through")
+    parser.add_argument("--page-size", type = int, default = 500)
+    parser.add_argument("--listing-cache", type = int, default = 0, help = "listing cache size in MB (default: off)")
+    parser.add_argument("--burst-gap", type = int, default = 2, help = "seconds between pictures of a burst on the stacked pages")
+    parser.add_argument("--cache-directory", default = None, help = "keep side index and caches here (default: a new temporary directory)")
+    parser.add_argument("--json", default = None, help = "also write the results to this file")
+    options = parser.parse_args()
+
+    cacheDirectory = options.cache_directory
+    temporary = cacheDirectory is None
+    if temporary:
+        cacheDirectory = tempfile.mkdtemp(prefix = "shotwellviewer-benchmark-")
+    try:
+        benchmark = Benchmark(os.path.abspath(options.database), cacheDirectory, max(1, options.repeat), options.samples,
+                              options.page_size, options.listing_cache, options.burst_gap)
+        benchmark.run()
+    finally:
+        if temporary:
+            shutil.rmtree(cacheDirectory, ignore_errors = True)
+
+    if options.json is not None:
+        with open(options.json, "w") as f:
+            json.dump({'database': options.database, 'repeat': options.repeat, 'results': benchmark.results}, f, indent = 2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
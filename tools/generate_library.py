@@ -0,0 +1,284 @@
+#!/usr/bin/python
+# writes a synthetic shotwell library (photo.db) for benchmarks, e.g.
+#   python tools/generate_library.py /tmp/photo.db --photos 100000 --events 4000
+# thumbnails and picture files are not created, only the database
+
+from __future__ import print_function
+
+import os
+import sys
+import random
+import sqlite3
+import argparse
+
+SHOTWELL_SCHEMA = """
+CREATE TABLE VersionTable (id INTEGER PRIMARY KEY, schema_version INTEGER, app_version TEXT, user_data TEXT NULL);
+CREATE TABLE PhotoTable (id INTEGER PRIMARY KEY, filename TEXT UNIQUE NOT NULL, width INTEGER, height INTEGER, filesize INTEGER,
+    timestamp INTEGER, exposure_time INTEGER, orientation INTEGER, original_orientation INTEGER, import_id INTEGER, event_id INTEGER,
+    transformations TEXT, md5 TEXT, thumbnail_md5 TEXT, exif_md5 TEXT, time_created INTEGER, flags INTEGER DEFAULT 0,
+    rating INTEGER DEFAULT 0, file_format INTEGER DEFAULT 0, title TEXT, backlinks TEXT, time_reimported INTEGER,
+    editable_id INTEGER DEFAULT -1, metadata_dirty INTEGER DEFAULT 0, developer TEXT, develop_shotwell_id INTEGER DEFAULT -1,
+    develop_camera_id INTEGER DEFAULT -1, develop_embedded_id INTEGER DEFAULT -1, comment TEXT);
+CREATE INDEX PhotoEventIDIndex ON PhotoTable (event_id);
+CREATE TABLE VideoTable (id INTEGER PRIMARY KEY, filename TEXT UNIQUE NOT NULL, width INTEGER, height INTEGER, clip_duration REAL,
+    is_interpretable INTEGER, filesize INTEGER, timestamp INTEGER, exposure_time INTEGER, import_id INTEGER, event_id INTEGER,
+    md5 TEXT NOT NULL, time_created INTEGER, rating INTEGER DEFAULT 0, title TEXT, backlinks TEXT, time_reimported INTEGER,
+    flags INTEGER DEFAULT 0, comment TEXT);
+CREATE INDEX VideoEventIDIndex ON VideoTable (event_id);
+CREATE TABLE EventTable (id INTEGER PRIMARY KEY, name TEXT, primary_photo_id INTEGER, time_created INTEGER, primary_source_id TEXT,
+    comment TEXT);
+CREATE TABLE TagTable (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, photo_id_list TEXT, time_created INTEGER);
+CREATE TABLE TombstoneTable (id INTEGER PRIMARY KEY, filepath TEXT NOT NULL, filesize INTEGER, md5 TEXT, time_created INTEGER,
+    reason INTEGER DEFAULT 0);
+CREATE TABLE SavedSearchDBTable (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, operator TEXT NOT NULL);
+CREATE TABLE SavedSearchDBTable_Text (id INTEGER PRIMARY KEY, search_id INTEGER NOT NULL, search_type TEXT NOT NULL,
+    context TEXT NOT NULL, text TEXT);
+CREATE TABLE SavedSearchDBTable_MediaType (id INTEGER PRIMARY KEY, search_id INTEGER NOT NULL, search_type TEXT NOT NULL,
+    context TEXT NOT NULL, type TEXT NOT NULL);
+CREATE TABLE SavedSearchDBTable_Flagged (id INTEGER PRIMARY KEY, search_id INTEGER NOT NULL, search_type TEXT NOT NULL,
+    flag_state TEXT NOT NULL);
+CREATE TABLE SavedSearchDBTable_Rating (id INTEGER PRIMARY KEY, search_id INTEGER NOT NULL, search_type TEXT NOT NULL,
+    rating INTEGER NOT NULL, context TEXT NOT NULL);
+CREATE TABLE SavedSearchDBTable_Date (id INTEGER PRIMARY KEY, search_id INTEGER NOT NULL, search_type TEXT NOT NULL,
+    context TEXT NOT NULL, date_one INTEGER NOT NULL, date_two INTEGER NOT NULL);
+"""
+
+SCHEMA_VERSION = 20
+
+# (extension, weight), "mov" is not a picture format and gets skipped by the media type searches
+EXTENSIONS = [("jpg", 50), ("JPG", 20), ("jpeg", 3), ("png", 4), ("tif", 1), ("cr2", 10), ("nef", 8), ("dng", 2), ("mov", 2)]
+
+TAG_WORDS = ["Family", "Holiday", "Beach", "Mountains", "Birthday", "Friends", "Garden", "City", "Snow", "Concert",
+             "Wedding", "Cat", "Dog", "Sunset", "Food", "Museum", "Train", "Lake", "Forest", "O'Brien"]
+
+# one saved search per entry: operator and clauses as (table, values...), see addSavedSearch
+SAVED_SEARCH_TEMPLATES = [
+    ("ALL", [("rating", 4, "AND_HIGHER")]),
+    ("ALL", [("rating", 1, "AND_LOWER")]),
+    ("ALL", [("rating", 5, "ONLY")]),
+    ("ALL", [("rating", -1, "ONLY")]),
+    ("ALL", [("mediatype", "IS", "PHOTO_RAW")]),
+    ("ALL", [("mediatype", "IS_NOT", "PHOTO_RAW")]),
+    ("ALL", [("mediatype", "IS", "PHOTO_ALL")]),
+    ("ALL", [("mediatype", "IS", "VIDEO")]),
+    ("ALL", [("flagged", "FLAGGED")]),
+    ("ALL", [("flagged", "UNFLAGGED")]),
+    ("ALL", [("text", "TAG", "CONTAINS", "Beach")]),
+    ("ALL", [("text", "TAG", "IS_EXACTLY", "/Holiday/Beach")]),
+    ("ALL", [("text", "TAG", "STARTS_WITH", "/Fam")]),
+    ("ALL", [("text", "TAG", "IS_NOT_SET", None)]),
+    ("ALL", [("text", "TAG", "CONTAINS", "O'Brien")]),
+    ("ALL", [("text", "COMMENT", "CONTAINS", "nice")]),
+    ("ALL", [("text", "COMMENT", "DOES_NOT_CONTAIN", "nice")]),
+    ("ALL", [("text", "TITLE", "ENDS_WITH", "7")]),
+    ("ALL", [("text", "TITLE", "IS_NOT_SET", None)]),
+    ("ALL", [("text", "FILE_NAME", "CONTAINS", "IMG_00")]),
+    ("ALL", [("text", "FILE_NAME", "ENDS_WITH", ".png")]),
+    ("ALL", [("text", "EVENT_NAME", "CONTAINS", "Trip")]),
+    ("ALL", [("text", "ANY_TEXT", "CONTAINS", "Lake")]),
+    ("ALL", [("text", "ANY_TEXT", "DOES_NOT_CONTAIN", "a")]),
+    ("ALL", [("date", "BETWEEN", 0, 400)]),
+    ("ALL", [("date", "EXACT", 100, 0)]),
+    ("ALL", [("date", "AFTER", 2000, 0)]),
+    ("ALL", [("date", "BEFORE", 300, 0)]),
+    ("ALL", [("date", "IS_NOT_SET", 0, 0)]),
+    ("ALL", [("rating", 3, "AND_HIGHER"), ("mediatype", "IS", "PHOTO_RAW"), ("flagged", "FLAGGED")]),
+    ("ALL", [("text", "TAG", "CONTAINS", "Family"), ("date", "AFTER", 1000, 0)]),
+    ("ANY", [("flagged", "FLAGGED"), ("rating", 5, "ONLY")]),
+    ("ANY", [("text", "TAG", "CONTAINS", "Cat"), ("text", "TAG", "CONTAINS", "Dog")]),
+    ("ANY", [("text", "COMMENT", "CONTAINS", "party"), ("mediatype", "IS", "PHOTO_RAW"), ("date", "BEFORE", 200, 0)]),
+    ("NONE", [("rating", 1, "AND_LOWER")]),
+    ("NONE", [("text", "ANY_TEXT", "CONTAINS", "Snow"), ("flagged", "FLAGGED")])]
+
+
+def weightedChoices(rng, choices, count):
+    total = sum(weight for value, weight in choices)
+    result = []
+    for i in range(count):
+        pick = rng.uniform(0, total)
+        for value, weight in choices:
+            pick -= weight
+            if pick <= 0:
+                break
+        result.append(value)
+    return result
+
+
+def getSourceId(photoId):
+    return "thumb%016x"%(photoId)
+
+
+class LibraryGenerator:
+
+    def __init__(self, path, photos, events, tags, searches, seed):
+        self.path = path
+        self.photoCount = photos
+        self.eventCount = max(1, min(events, photos))
+        self.tagCount = tags
+        self.searchCount = searches
+        self.rng = random.Random(seed)
+        # the library starts at the beginning of 2005 and gets a new event every few days
+        self.start = 1104537600
+        self.eventDays = 3
+
+    def getDayTime(self, day):
+        return self.start + day * 86400
+
+    def createDatabase(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.connection = sqlite3.connect(self.path)
+        self.cursor = self.connection.cursor()
+        self.cursor.executescript(SHOTWELL_SCHEMA)
+        self.cursor.execute("insert into VersionTable (schema_version, app_version) values (?, ?)", (SCHEMA_VERSION, "0.22.0"))
+
+    def iterPhotos(self):
+        rng = self.rng
+        extensions = weightedChoices(rng, EXTENSIONS, 1000)
+        perEvent = float(self.photoCount) / self.eventCount
+        for id in range(1, self.photoCount + 1):
+            eventId = min(self.eventCount, int((id - 1) / perEvent) + 1)
+            # a few pictures come without exif data
+            exposureTime = None
+            if rng.random() > 0.005:
+                exposureTime = self.getDayTime(eventId * self.eventDays) + int(((id - 1) % perEvent) * 37) + rng.randint(0, 30)
+            timestamp = exposureTime or self.getDayTime(0)
+            filename = "/home/user/Pictures/%d/%03d/IMG_%07d.%s"%(2005 + eventId * self.eventDays // 365, eventId % 1000, id,
+                                                                 extensions[id % len(extensions)])
+            flags = 0
+            if rng.random() < 0.1:
+                flags |= 16
+            if rng.random() < 0.02:
+                # hidden
+                flags |= 4
+            rating = rng.choice([-1, 0, 0, 0, 0, 1, 2, 3, 3, 4, 5])
+            title = None
+            if rng.random() < 0.2:
+                title = "%s %d"%(rng.choice(TAG_WORDS), id)
+            comment = None
+            if rng.random() < 0.1:
+                comment = rng.choice(["nice light", "party at the lake", "need to crop", "print this"])
+            yield (id, filename, 4000, 3000, rng.randint(1000000, 30000000), timestamp, exposureTime, 1, 1, eventId, eventId,
+                   None, "%032x"%(rng.getrandbits(128)), None, None, timestamp + 3600, flags, rating, 0, title, None, None,
+                   -1, 0, "SHOTWELL", -1, -1, -1, comment)
+
+    def addPhotos(self):
+        batch = []
+        for row in self.iterPhotos():
+            batch.append(row)
+            if len(batch) == 10000:
+                self.cursor.executemany("insert into PhotoTable values (%s)"%(", ".join("?" * 29)), batch)
+                batch = []
+        self.cursor.executemany("insert into PhotoTable values (%s)"%(", ".join("?" * 29)), batch)
+
+    def addVideos(self):
+        count = max(1, self.photoCount // 200)
+        for id in range(1, count + 1):
+            eventId = self.rng.randint(1, self.eventCount)
+            time = self.getDayTime(eventId * self.eventDays)
+            self.cursor.execute("""insert into VideoTable (id, filename, width, height, clip_duration, is_interpretable, filesize,
+                                                           timestamp, exposure_time, import_id, event_id, md5, time_created)
+                                   values (?, ?, 1920, 1080, 12.5, 1, 50000000, ?, ?, ?, ?, ?, ?)""",
+                                (id, "/home/user/Videos/MVI_%07d.mov"%(id), time, time, eventId, eventId, "%032x"%(id), time))
+
+    def addEvents(self):
+        rows = []
+        perEvent = float(self.photoCount) / self.eventCount
+        for id in range(1, self.eventCount + 1):
+            firstPhoto = int((id - 1) * perEvent) + 1
+            name = None
+            if id % 3 != 0:
+                name = "%s Trip %d"%(self.rng.choice(TAG_WORDS), id)
+            # shotwell keeps the cover as source id, older versions as photo id, some events have none
+            sourceId = None
+            photoId = None
+            if id % 5 == 1:
+                photoId = firstPhoto
+            elif id % 5 != 0:
+                sourceId = getSourceId(self.rng.randint(firstPhoto, int(id * perEvent)))
+            elif id % 10 == 0:
+                sourceId = "video-%016x"%(1)
+            rows.append((id, name, photoId, self.getDayTime(id * self.eventDays), sourceId, None))
+        self.cursor.executemany("insert into EventTable values (?, ?, ?, ?, ?, ?)", rows)
+
+    def getTagName(self, index):
+        word = TAG_WORDS[index % len(TAG_WORDS)]
+        round = index // len(TAG_WORDS)
+        if round > 0:
+            word = "%s %d"%(word, round)
+        # every third tag is a child of the previous one, like shotwell's hierarchical tags
+        if index % 3 == 2:
+            return "/" + self.getTagName(index - 1).lstrip("/") + "/" + word
+        if index % 3 == 1:
+            return "/" + word
+        return word
+
+    def addTags(self):
+        rows = []
+        for index in range(self.tagCount):
+            # a few huge tags and a long tail of small ones
+            size = max(1, int(self.photoCount * 0.3 / (index + 1)))
+            ids = sorted(self.rng.sample(range(1, self.photoCount + 1), min(size, self.photoCount)))
+            photoIdList = "".join(getSourceId(id) + "," for id in ids)
+            rows.append((index + 1, self.getTagName(index), photoIdList, self.getDayTime(0)))
+        self.cursor.executemany("insert into TagTable values (?, ?, ?, ?)", rows)
+
+    def addSavedSearch(self, id, operator, clauses):
+        self.cursor.execute("insert into SavedSearchDBTable values (?, ?, ?)", (id, "Search %d (%s)"%(id, operator), operator))
+        lastDay = self.eventCount * self.eventDays
+        for clause in clauses:
+            kind = clause[0]
+            if kind == "rating":
+                self.cursor.execute("""insert into SavedSearchDBTable_Rating (search_id, search_type, rating, context)
+                                       values (?, 'RATING', ?, ?)""", (id, clause[1], clause[2]))
+            elif kind == "mediatype":
+                self.cursor.execute("""insert into SavedSearchDBTable_MediaType (search_id, search_type, context, type)
+                                       values (?, 'MEDIA_TYPE', ?, ?)""", (id, clause[1], clause[2]))
+            elif kind == "flagged":
+                self.cursor.execute("""insert into SavedSearchDBTable_Flagged (search_id, search_type, flag_state)
+                                       values (?, 'FLAG_STATE', ?)""", (id, clause[1]))
+            elif kind == "text":
+                self.cursor.execute("""insert into SavedSearchDBTable_Text (search_id, search_type, context, text)
+                                       values (?, ?, ?, ?)""", (id, clause[1], clause[2], clause[3]))
+            elif kind == "date":
+                # days are relative to the start of the library, capped to its length
+                first = self.getDayTime(min(clause[2], lastDay))
+                second = self.getDayTime(min(clause[3], lastDay))
+                self.cursor.execute("""insert into SavedSearchDBTable_Date (search_id, search_type, context, date_one, date_two)
+                                       values (?, 'DATE', ?, ?, ?)""", (id, clause[1], first, second))
+
+    def addSavedSearches(self):
+        for index in range(self.searchCount):
+            operator, clauses = SAVED_SEARCH_TEMPLATES[index % len(SAVED_SEARCH_TEMPLATES)]
+            self.addSavedSearch(index + 1, operator, clauses)
+
+    def generate(self):
+        self.createDatabase()
+        self.addPhotos()
+        self.addVideos()
+        self.addEvents()
+        self.addTags()
+        self.addSavedSearches()
+        self.connection.commit()
+        self.connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Write a synthetic shotwell photo.db")
+    parser.add_argument("path")
+    parser.add_argument("--photos", type = int, default = 10000)
+    parser.add_argument("--events", type = int, default = None, help = "default: one event per 25 photos")
+    parser.add_argument("--tags", type = int, default = 60)
+    parser.add_argument("--searches", type = int, default = len(SAVED_SEARCH_TEMPLATES))
+    parser.add_argument("--seed", type = int, default = 1)
+    options = parser.parse_args()
+
+    events = options.events
+    if events is None:
+        events = max(1, options.photos // 25)
+    LibraryGenerator(options.path, options.photos, events, options.tags, options.searches, options.seed).generate()
+    print("%s: %d photos, %d events, %d tags, %d saved searches"%(options.path, options.photos, events, options.tags, options.searches))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+# stand-in for kodi's xbmc module, see tools/benchmark.py
+
+LOGDEBUG, LOGINFO, LOGNOTICE, LOGWARNING, LOGERROR = range(5)
+
+# messages at or above this level are printed
+logLevel = LOGWARNING
+
+
+def log(message, level = LOGDEBUG):
+    if level >= logLevel:
+        print(message)
+
+
+def translatePath(path):
+    return path
+
+
+def getInfoLabel(label):
+    return ""
+
+
+# kodi's strings 21 to 32, the names of the months
+MONTHS = ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October",
+          "November", "December"]
+
+
+def getLocalizedString(id):
+    if 21 <= id <= 32:
+        return MONTHS[id - 21]
+    return ""
+
+
+def sleep(milliseconds):
+    pass
+
+
+class Monitor:
+
+    def abortRequested(self):
+        return False
+
+    def waitForAbort(self, timeout = None):
+        return False
+
+
+class Keyboard:
+
+    def __init__(self, default = "", heading = ""):
+        self.text = default
+
+    def doModal(self):
+        pass
+
+    def isConfirmed(self):
+        return True
+
+    def getText(self):
+        return self.text
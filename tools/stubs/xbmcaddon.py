@@ -0,0 +1,22 @@
+# stand-in for kodi's xbmcaddon module, the benchmark fills settings and info
+
+settings = {}
+info = {'id': 'plugin.image.ShotwellViewer', 'profile': '', 'path': ''}
+
+
+class Addon:
+
+    def __init__(self, id = None):
+        pass
+
+    def getSetting(self, id):
+        return settings.get(id, "")
+
+    def setSetting(self, id, value):
+        settings[id] = value
+
+    def getAddonInfo(self, id):
+        return info.get(id, "")
+
+    def getLocalizedString(self, id):
+        return str(id)
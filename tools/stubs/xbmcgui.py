@@ -0,0 +1,23 @@
+# stand-in for kodi's xbmcgui module
+
+
+class ListItem:
+
+    def __init__(self, label = "", label2 = "", iconImage = "", thumbnailImage = "", path = ""):
+        self.label = label
+        self.iconImage = iconImage
+        self.info = {}
+        self.properties = {}
+        self.art = {}
+
+    def setInfo(self, type, infoLabels):
+        self.info.update(infoLabels)
+
+    def setProperty(self, key, value):
+        self.properties[key] = value
+
+    def setArt(self, art):
+        self.art.update(art)
+
+    def getLabel(self):
+        return self.label
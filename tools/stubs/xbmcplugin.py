@@ -0,0 +1,38 @@
+# stand-in for kodi's xbmcplugin module, items are counted and dropped
+
+itemCount = 0
+
+SORT_METHOD_NONE = 0
+SORT_METHOD_LABEL = 1
+SORT_METHOD_DATE = 3
+SORT_METHOD_SIZE = 4
+SORT_METHOD_TITLE = 9
+SORT_METHOD_UNSORTED = 40
+
+
+def setContent(handle, content):
+    pass
+
+
+def addDirectoryItem(handle, url, listitem, isFolder = False, totalItems = 0):
+    global itemCount
+    itemCount += 1
+    return True
+
+
+def addDirectoryItems(handle, items, totalItems = 0):
+    global itemCount
+    itemCount += len(items)
+    return True
+
+
+def addSortMethod(handle, sortMethod, label2Mask = ""):
+    pass
+
+
+def endOfDirectory(handle, succeeded = True, updateListing = False, cacheToDisc = True):
+    pass
+
+
+def setResolvedUrl(handle, succeeded, listitem):
+    pass
@@ -0,0 +1,16 @@
+# stand-in for kodi's xbmcvfs module, local files only
+
+import shutil
+
+
+def copy(source, destination):
+    try:
+        shutil.copyfile(source, destination)
+    except (IOError, OSError):
+        return False
+    return True
+
+
+def exists(path):
+    import os
+    return os.path.exists(path)